@@ -0,0 +1,168 @@
+"""
+Control de admisión para los endpoints caros (exportar PDF, listado completo de notas).
+
+Cada clase de endpoint (CLASES_POR_DEFECTO, con los cambios de settings.ADMISION) tiene:
+  - una cubeta de fichas por cliente: `rafaga` fichas que se reponen a `tasa`
+    por segundo; sin ficha se responde 429 con Retry-After hasta la próxima.
+  - un tope de `concurrencia` peticiones en curso por proceso, con una cola de
+    hasta `cola` peticiones que esperan como máximo `espera` segundos; con la
+    cola llena, o vencida la espera, también 429.
+
+Así unos pocos usuarios exportando o recargando seguimiento no ocupan todos los
+workers y las escrituras (crear notas) siempre encuentran dónde ejecutarse: el
+tope de cada clase debe quedar por debajo de los hilos/workers disponibles.
+
+Todo vive en memoria del proceso (cada worker lleva su cuenta). Sirve con
+WSGI y con ASGI: las esperas se despiertan con call_soon_threadsafe, así que
+no importa en qué event loop corre cada petición.
+"""
+import asyncio
+import math
+import threading
+import time
+from collections import deque
+from functools import wraps
+
+from django.conf import settings
+from django.http import JsonResponse
+
+CLASES_POR_DEFECTO = {
+    "exportar": {"tasa": 0.1, "rafaga": 3, "concurrencia": 2, "cola": 4, "espera": 15},
+    "listado": {"tasa": 1.0, "rafaga": 10, "concurrencia": 4, "cola": 8, "espera": 5},
+}
+
+
+class Cubeta:
+    """Token bucket por cliente."""
+
+    def __init__(self, tasa, rafaga, maximo_clientes=10_000):
+        self.tasa = tasa
+        self.rafaga = rafaga
+        self.maximo_clientes = maximo_clientes
+        self._lock = threading.Lock()
+        self._clientes = {}   # cliente -> (fichas, instante)
+
+    def tomar(self, cliente):
+        """0 si se admite; si no, segundos hasta la próxima ficha."""
+        ahora = time.monotonic()
+        with self._lock:
+            fichas, antes = self._clientes.get(cliente, (self.rafaga, ahora))
+            fichas = min(self.rafaga, fichas + (ahora - antes) * self.tasa)
+            if fichas >= 1:
+                self._clientes[cliente] = (fichas - 1, ahora)
+                if len(self._clientes) > self.maximo_clientes:
+                    self._olvidar_llenas(ahora)
+                return 0
+            self._clientes[cliente] = (fichas, ahora)
+            return (1 - fichas) / self.tasa
+
+    def _olvidar_llenas(self, ahora):
+        # un cliente con la cubeta ya repuesta es igual a uno nuevo
+        llena = self.rafaga / self.tasa
+        self._clientes = {c: v for c, v in self._clientes.items() if ahora - v[1] < llena}
+
+
+class Limite:
+    """Tope de peticiones simultáneas con cola de espera acotada."""
+
+    def __init__(self, maximo, cola, espera):
+        self.maximo = maximo
+        self.cola = cola
+        self.espera = espera
+        self._lock = threading.Lock()
+        self._en_curso = 0
+        self._esperando = deque()   # (loop, future)
+
+    async def entrar(self):
+        """True si obtuvo lugar (hay que llamar a salir()); False si se rechaza."""
+        with self._lock:
+            if self._en_curso < self.maximo:
+                self._en_curso += 1
+                return True
+            if len(self._esperando) >= self.cola:
+                return False
+            loop = asyncio.get_running_loop()
+            turno = (loop, loop.create_future())
+            self._esperando.append(turno)
+        try:
+            await asyncio.wait_for(turno[1], self.espera)
+            return True
+        except asyncio.TimeoutError:
+            with self._lock:
+                try:
+                    self._esperando.remove(turno)
+                except ValueError:
+                    pass  # ya se le cedió el lugar: _ceder lo pasará al siguiente
+            return False
+
+    def salir(self):
+        with self._lock:
+            while self._esperando:
+                loop, futuro = self._esperando.popleft()
+                try:
+                    # el lugar pasa directo al que espera: _en_curso no cambia
+                    loop.call_soon_threadsafe(self._ceder, futuro)
+                    return
+                except RuntimeError:  # el loop de esa petición ya cerró
+                    continue
+            self._en_curso -= 1
+
+    def _ceder(self, futuro):
+        if futuro.done():   # venció o se canceló mientras tanto
+            self.salir()
+        else:
+            futuro.set_result(True)
+
+
+class Clase:
+    def __init__(self, tasa, rafaga, concurrencia, cola, espera):
+        self.cubeta = Cubeta(tasa, rafaga)
+        self.limite = Limite(concurrencia, cola, espera)
+
+
+_clases = {}
+_lock_clases = threading.Lock()
+
+
+def clase(nombre):
+    with _lock_clases:
+        if nombre not in _clases:
+            config = {**CLASES_POR_DEFECTO.get(nombre, {}), **getattr(settings, "ADMISION", {}).get(nombre, {})}
+            _clases[nombre] = Clase(**config)
+        return _clases[nombre]
+
+
+def cliente(request):
+    """IP del cliente; detrás de un proxy propio (ADMISION_PROXY) la primera de X-Forwarded-For."""
+    if getattr(settings, "ADMISION_PROXY", False):
+        reenviada = request.headers.get("X-Forwarded-For", "")
+        if reenviada:
+            return reenviada.split(",")[0].strip()
+    return request.META.get("REMOTE_ADDR", "")
+
+
+def _rechazo(mensaje, segundos):
+    respuesta = JsonResponse({"error": mensaje}, status=429)
+    respuesta["Retry-After"] = str(max(1, math.ceil(segundos)))
+    return respuesta
+
+
+def admitir(nombre):
+    """Decorador para vistas async: cubeta por cliente y tope de concurrencia de la clase `nombre`."""
+    def decorador(vista):
+        @wraps(vista)
+        async def envoltura(request, *args, **kwargs):
+            if not getattr(settings, "ADMISION_ACTIVA", True):
+                return await vista(request, *args, **kwargs)
+            c = clase(nombre)
+            espera = c.cubeta.tomar(cliente(request))
+            if espera:
+                return _rechazo("Demasiadas solicitudes; intente de nuevo en unos segundos", espera)
+            if not await c.limite.entrar():
+                return _rechazo("Servidor ocupado; intente de nuevo en unos segundos", c.limite.espera)
+            try:
+                return await vista(request, *args, **kwargs)
+            finally:
+                c.limite.salir()
+        return envoltura
+    return decorador
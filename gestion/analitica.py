@@ -0,0 +1,197 @@
+"""
+Analítica de movimientos (entradas vs. salidas) sobre la tabla MovimientoDiario.
+
+En lugar de agregar todos los NotaPedidoItem en cada consulta, cada nota suma
+(o resta, al borrarse o editarse) sus cantidades y montos en una fila por día,
+producto, tipo y contraparte. Las series por semana o mes y los rankings se
+calculan sobre esa tabla, que crece con los días con movimiento y no con los
+items: un rango de varios años son unos pocos miles de filas.
+
+acumular() la llaman las funciones de inventario.py dentro de la misma
+transacción que mueve el stock; reconstruir() la rehace desde cero
+(comando reconstruir_movimientos).
+"""
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Case, DecimalField, F, IntegerField, Q, Sum, Value, When
+from django.db.models.functions import Coalesce, TruncDate, TruncMonth, TruncWeek
+from django.utils import timezone
+
+from .models import Cierre, MovimientoDiario, NotaPedidoItem
+
+AGRUPACIONES = {
+    "dia": F("fecha"),
+    "semana": TruncWeek("fecha"),
+    "mes": TruncMonth("fecha"),
+}
+DIMENSIONES = ("producto", "proveedor", "cliente")
+TIPOS = ("Entrada", "Salida")
+METRICAS = ("cantidad", "monto")
+
+_MONTO = DecimalField(max_digits=14, decimal_places=2)
+
+
+def fecha_local(nota):
+    return timezone.localtime(nota.fecha).date()
+
+
+def clave(nota):
+    """Fila del acumulado a la que suma la nota: (fecha, tipo, proveedor_id, cliente_id)."""
+    return (fecha_local(nota), nota.tipo, nota.proveedor_id, nota.cliente_id)
+
+
+def acumular(nota, signo, items):
+    """
+    Suma (signo=1) o resta (signo=-1) los items {producto_id: (cantidad, monto)}
+    en las filas del día de la nota. Una consulta para leer, una para actualizar
+    y un bulk_create para las claves nuevas, sin importar cuántos items tenga.
+    """
+    acumular_varios({clave(nota): items}, signo)
+
+
+def acumular_varios(grupos, signo):
+    """
+    acumular() para varias notas a la vez: `grupos` es {clave: items} (ver
+    clave()). Siguen siendo una lectura, un UPDATE y un bulk_create en total,
+    sin importar cuántas claves o items haya.
+    """
+    # los traslados no son entradas ni salidas: no se acumulan
+    grupos = {k: items for k, items in grupos.items() if items and k[1] in TIPOS}
+    if not grupos:
+        return
+    filtro = {
+        "fecha__in": {k[0] for k in grupos},
+        "tipo__in": {k[1] for k in grupos},
+        "producto_id__in": set().union(*grupos.values()),
+    }
+    if len(grupos) == 1:
+        (_, _, proveedor_id, cliente_id), = grupos
+        filtro.update(proveedor_id=proveedor_id, cliente_id=cliente_id)
+
+    with transaction.atomic():
+        # (clave, producto_id) -> id de la fila; el filtro trae de más con varias claves
+        existentes = {}
+        for fila_id, fecha, tipo, proveedor_id, cliente_id, producto_id in (
+            MovimientoDiario.objects
+            .filter(**filtro)
+            .order_by("id")
+            .values_list("id", "fecha", "tipo", "proveedor_id", "cliente_id", "producto_id")
+        ):
+            k = (fecha, tipo, proveedor_id, cliente_id)
+            if producto_id in grupos.get(k, ()):
+                existentes.setdefault((k, producto_id), fila_id)
+
+        if existentes:
+            cambios = {fid: grupos[k][pid] for (k, pid), fid in existentes.items()}
+            MovimientoDiario.objects.filter(id__in=cambios).update(
+                cantidad=F("cantidad") + Case(
+                    *[When(id=fid, then=Value(signo * c)) for fid, (c, _) in cambios.items()],
+                    default=Value(0), output_field=IntegerField(),
+                ),
+                monto=F("monto") + Case(
+                    *[When(id=fid, then=Value(signo * m)) for fid, (_, m) in cambios.items()],
+                    default=Value(Decimal("0")), output_field=_MONTO,
+                ),
+                actualizado=timezone.now(),
+            )
+        MovimientoDiario.objects.bulk_create([
+            MovimientoDiario(fecha=fecha, tipo=tipo, proveedor_id=proveedor_id, cliente_id=cliente_id,
+                             producto_id=pid, cantidad=signo * cantidad, monto=signo * monto)
+            for (fecha, tipo, proveedor_id, cliente_id), items in grupos.items()
+            for pid, (cantidad, monto) in items.items()
+            if ((fecha, tipo, proveedor_id, cliente_id), pid) not in existentes
+        ])
+
+
+def reconstruir(tamano_lote=2000):
+    """
+    Rehace MovimientoDiario desde los items. Devuelve cuántas filas rehízo.
+    Las filas anteriores al último cierre no se tocan: sus items están archivados.
+    """
+    cierre = Cierre.ultimo()
+    filas = (
+        NotaPedidoItem.objects
+        .filter(nota__tipo__in=TIPOS)
+        .annotate(dia=TruncDate("nota__fecha"))
+        .values("dia", "producto_id", "nota__tipo", "nota__proveedor_id", "nota__cliente_id")
+        .annotate(
+            total=Sum("cantidad"),
+            importe=Sum(F("cantidad") * F("precio_unitario"), output_field=_MONTO),
+        )
+        .order_by()
+    )
+    creadas = 0
+    with transaction.atomic():
+        vigentes = MovimientoDiario.objects.all()
+        if cierre:
+            vigentes = vigentes.filter(fecha__gte=cierre.fecha_corte)
+        vigentes.delete()
+        lote = []
+        for f in filas.iterator():
+            lote.append(MovimientoDiario(
+                fecha=f["dia"],
+                producto_id=f["producto_id"],
+                tipo=f["nota__tipo"],
+                proveedor_id=f["nota__proveedor_id"],
+                cliente_id=f["nota__cliente_id"],
+                cantidad=f["total"],
+                monto=f["importe"] or Decimal("0"),
+            ))
+            if len(lote) >= tamano_lote:
+                creadas += len(MovimientoDiario.objects.bulk_create(lote))
+                lote = []
+        creadas += len(MovimientoDiario.objects.bulk_create(lote))
+    return creadas
+
+
+# ---------- consultas ----------
+def _suma(campo, tipo, output_field):
+    return Coalesce(
+        Sum(Case(When(tipo=tipo, then=F(campo)), default=Value(0), output_field=output_field)),
+        Value(0), output_field=output_field,
+    )
+
+
+def movimientos(desde=None, hasta=None, producto=None, proveedor=None, cliente=None):
+    qs = MovimientoDiario.objects.all()
+    if desde:
+        qs = qs.filter(fecha__gte=desde)
+    if hasta:
+        qs = qs.filter(fecha__lte=hasta)
+    if producto:
+        qs = qs.filter(producto_id=producto)
+    if proveedor:
+        qs = qs.filter(proveedor_id=proveedor)
+    if cliente:
+        qs = qs.filter(cliente_id=cliente)
+    return qs
+
+
+def serie(agrupar="dia", **filtros):
+    """Entradas y salidas (cantidad y monto) por periodo, en orden cronológico."""
+    return (
+        movimientos(**filtros)
+        .annotate(periodo=AGRUPACIONES[agrupar])
+        .values("periodo")
+        .annotate(
+            entradas=_suma("cantidad", "Entrada", IntegerField()),
+            salidas=_suma("cantidad", "Salida", IntegerField()),
+            monto_entradas=_suma("monto", "Entrada", _MONTO),
+            monto_salidas=_suma("monto", "Salida", _MONTO),
+        )
+        .order_by("periodo")
+    )
+
+
+def top(por="producto", tipo=None, metrica="cantidad", n=10, **filtros):
+    """Los n productos / proveedores / clientes con más cantidad o monto movido."""
+    qs = movimientos(**filtros).filter(**{f"{por}__isnull": False})
+    if tipo:
+        qs = qs.filter(tipo=tipo)
+    return (
+        qs.values(f"{por}_id", f"{por}__nombre")
+        .annotate(cantidad=Sum("cantidad"), monto=Sum("monto"))
+        .filter(~Q(**{metrica: 0}))
+        .order_by(f"-{metrica}", f"{por}__nombre")[:n]
+    )
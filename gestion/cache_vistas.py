@@ -0,0 +1,108 @@
+"""
+Cache de respuestas completas (y fragmentos de plantilla) para index y seguimiento.
+
+Cada modelo tiene una "versión" guardada en el cache. La clave de una respuesta
+incluye las versiones de los modelos de los que depende la vista, así que basta
+con cambiar la versión de un modelo (signals.py, al confirmarse la escritura)
+para que todas las respuestas que lo usan dejen de encontrarse. No hace falta
+borrar claves: las viejas expiran solas.
+
+El backend es el de CACHES["default"] (ver settings): debe ser compartido entre
+workers (archivo, base de datos, Redis...) para que la invalidación llegue a todos.
+"""
+import hashlib
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import Cliente, NotaPedido, NotaPedidoItem, Producto, Proveedor
+
+DEPENDENCIAS = {
+    "index": (Producto, Proveedor, NotaPedido, NotaPedidoItem),
+    "seguimiento": (NotaPedido, NotaPedidoItem, Producto, Proveedor, Cliente),
+}
+
+
+def _clave_version(modelo):
+    return f"ver:{modelo._meta.label_lower}"
+
+
+def invalidar(*modelos):
+    # un timestamp en lugar de incr(): no depende de que el backend lo haga atómico
+    cache.set_many({_clave_version(m): time.time_ns() for m in modelos}, None)
+
+
+def versiones(modelos):
+    claves = [_clave_version(m) for m in modelos]
+    actuales = cache.get_many(claves)
+    faltantes = {c: time.time_ns() for c in claves if c not in actuales}
+    if faltantes:
+        cache.set_many(faltantes, None)
+        actuales.update(faltantes)
+    return ".".join(str(actuales[c]) for c in claves)
+
+
+def _registrar(vista, resultado):
+    clave = f"stats:{vista}:{resultado}"
+    if not cache.add(clave, 1, None):
+        try:
+            cache.incr(clave)
+        except ValueError:
+            cache.set(clave, 1, None)
+
+
+def estadisticas():
+    """{vista: {"hits": n, "misses": n, "ratio": 0..1}}"""
+    claves = [f"stats:{v}:{r}" for v in DEPENDENCIAS for r in ("hit", "miss")]
+    valores = cache.get_many(claves)
+    salida = {}
+    for vista in DEPENDENCIAS:
+        hits = valores.get(f"stats:{vista}:hit", 0)
+        misses = valores.get(f"stats:{vista}:miss", 0)
+        total = hits + misses
+        salida[vista] = {"hits": hits, "misses": misses, "ratio": hits / total if total else 0.0}
+    return salida
+
+
+def reiniciar_estadisticas():
+    cache.delete_many([f"stats:{v}:{r}" for v in DEPENDENCIAS for r in ("hit", "miss")])
+
+
+def cache_vista(nombre, parametros=("q", "start_date", "end_date")):
+    """
+    Cachea la respuesta de una vista GET según sus parámetros y las versiones
+    de los modelos listados en DEPENDENCIAS[nombre].
+    """
+    modelos = DEPENDENCIAS[nombre]
+
+    def decorador(vista):
+        @wraps(vista)
+        def envoltura(request, *args, **kwargs):
+            if request.method not in ("GET", "HEAD"):
+                return vista(request, *args, **kwargs)
+
+            valores = "&".join(f"{p}={(request.GET.get(p) or '').strip()}" for p in parametros)
+            huella = hashlib.md5(valores.encode("utf-8")).hexdigest()
+            clave = f"vista:{nombre}:{versiones(modelos)}:{huella}"
+
+            response = cache.get(clave)
+            if response is not None:
+                _registrar(nombre, "hit")
+                response["X-Cache"] = "HIT"
+                return response
+
+            _registrar(nombre, "miss")
+            response = vista(request, *args, **kwargs)
+            # no se cachea nada que dependa del usuario (cookies) ni errores
+            if response.status_code == 200 and not response.cookies:
+                if hasattr(response, "render") and callable(response.render):
+                    response.render()
+                cache.set(clave, response, getattr(settings, "VISTAS_CACHE_TIMEOUT", 300))
+            response["X-Cache"] = "MISS"
+            return response
+
+        return envoltura
+
+    return decorador
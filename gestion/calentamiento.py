@@ -0,0 +1,80 @@
+"""
+Calentamiento opcional al arrancar un worker (WARMUP=1, ver wsgi.py / asgi.py).
+
+Tras un arranque en frío (Render duerme el servicio y el cache en disco de
+/tmp se pierde) el primer request pagaba todo junto: abrir la BD, compilar
+plantillas, armar el índice de autocompletado y renderizar el dashboard sin
+cache. calentar() hace eso antes de que el worker acepte requests:
+
+  - abre la conexión a la BD y lee una fila (trae las páginas al cache del SO)
+  - compila las plantillas (quedan en el loader cacheado de Django)
+  - construye el índice en memoria de typeahead.py
+  - renderiza index una vez, lo que deja su respuesta y el fragmento del
+    catálogo en el cache compartido
+
+Cada paso es independiente: si uno falla se registra y el worker arranca igual.
+ReportLab y NumPy no se importan aquí; se cargan recién al exportar o analizar.
+"""
+import logging
+import time
+
+from django.db import connections
+
+logger = logging.getLogger("gestion.arranque")
+
+PLANTILLAS = ("index.html", "seguimiento.html", "gestion_datos.html")
+
+
+def _bd():
+    from .models import Producto
+
+    Producto.objects.order_by().values_list("id", flat=True).first()
+
+
+def _plantillas():
+    from django.template.loader import get_template
+
+    for nombre in PLANTILLAS:
+        get_template(nombre)
+
+
+def _indice():
+    from .typeahead import indice
+
+    indice.construir()
+
+
+def _index():
+    # un HttpRequest simple, sin django.test: cache_vista arma la clave con los
+    # parámetros GET (aquí ninguno) y las versiones, igual que para un GET / real
+    from django.contrib.auth.models import AnonymousUser
+    from django.http import HttpRequest
+
+    from .views import index
+
+    request = HttpRequest()
+    request.method = "GET"
+    request.path = request.path_info = "/"
+    request.META["SERVER_NAME"], request.META["SERVER_PORT"] = "localhost", "80"
+    request.user = AnonymousUser()
+    index(request)
+
+
+PASOS = (("bd", _bd), ("plantillas", _plantillas), ("indice", _indice), ("index", _index))
+
+
+def calentar():
+    """Ejecuta los pasos y devuelve {paso: ms} (None si falló)."""
+    tiempos = {}
+    for nombre, paso in PASOS:
+        inicio = time.perf_counter()
+        try:
+            paso()
+            tiempos[nombre] = round((time.perf_counter() - inicio) * 1000, 1)
+        except Exception:
+            logger.exception("Calentamiento: falló el paso %s", nombre)
+            tiempos[nombre] = None
+    # la conexión abierta aquí no se hereda: cada hilo de request abre la suya
+    connections.close_all()
+    logger.info("Calentamiento del worker: %s", tiempos)
+    return tiempos
@@ -0,0 +1,142 @@
+"""
+Cierre de periodo: saca de NotaPedido / NotaPedidoItem las notas anteriores a
+una fecha de corte (comando cierre_anual).
+
+Todo el historial vivía en las tablas operativas, así que seguimiento, la
+exportación, sync y los recálculos recorrían años de notas. cerrar(fecha):
+
+  1. registra en SaldoInicial el stock de cada producto por almacén al empezar
+     ese día: el saldo del cierre anterior más el efecto de las notas que se
+     archivan (las notas sin almacén suman en la fila con almacén nulo)
+  2. copia esas notas y sus items a NotaArchivada / NotaArchivadaItem, con
+     los nombres en lugar de referencias, y las borra de las tablas operativas
+
+El stock no cambia y MovimientoDiario conserva sus filas (el acumulado ya está
+hecho); recalcular_stock y reconstruir_movimientos parten del último cierre.
+El borrado es por conjunto (signals.borrar_notas): sync recibe las
+eliminaciones y seguimiento las ve salir con un evento por lote. Las
+archivadas se leen en /api/archivo/.
+
+Es una sola transacción, lo que bloquea las escrituras mientras dura: conviene
+correrlo fuera de horario.
+"""
+from datetime import datetime, time
+
+from django.db import transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from . import inventario
+from .models import Cierre, NotaArchivada, NotaArchivadaItem, NotaPedido, NotaPedidoItem, SaldoInicial
+from .signals import borrar_notas
+
+TAMANO_LOTE = 500
+
+
+def inicio_del_dia(fecha):
+    return timezone.make_aware(datetime.combine(fecha, time.min))
+
+
+def notas_a_archivar(fecha_corte):
+    return NotaPedido.objects.filter(fecha__lt=inicio_del_dia(fecha_corte))
+
+
+def validar(fecha_corte):
+    """ValueError si la fecha no sirve como corte."""
+    if fecha_corte > timezone.localdate():
+        raise ValueError("La fecha de corte no puede ser futura")
+    ultimo = Cierre.ultimo()
+    if ultimo and fecha_corte <= ultimo.fecha_corte:
+        raise ValueError(f"Ya hay un cierre al {ultimo.fecha_corte:%d/%m/%Y}; el nuevo corte debe ser posterior")
+
+
+def previsualizar(fecha_corte):
+    """{"notas": n, "items": m} que archivaría un cierre a esa fecha."""
+    notas = notas_a_archivar(fecha_corte)
+    return {"notas": notas.count(), "items": NotaPedidoItem.objects.filter(nota__in=notas).count()}
+
+
+def _saldos(anterior, notas):
+    """{(almacen_id, producto_id): stock} al corte: saldos de `anterior` más el efecto de `notas`."""
+    saldos = {}
+    if anterior:
+        for a, pid, stock in anterior.saldos.values_list("almacen_id", "producto_id", "stock"):
+            saldos[(a, pid)] = stock
+    for tipo, almacen_id, destino_id, pid, total in (
+        NotaPedidoItem.objects.filter(nota__in=notas)
+        .values_list("nota__tipo", "nota__almacen_id", "nota__almacen_destino_id", "producto_id")
+        .annotate(total=Sum("cantidad"))
+        .order_by()
+    ):
+        if almacen_id is None:
+            lados = [(None, inventario.signo(tipo))]
+        else:
+            lados = inventario.lados(tipo, almacen_id, destino_id)
+        for a, s in lados:
+            saldos[(a, pid)] = saldos.get((a, pid), 0) + s * total
+    return saldos
+
+
+def _nombre(objeto):
+    return objeto.nombre if objeto else ""
+
+
+def _archivar(cierre, ids):
+    notas = (
+        NotaPedido.objects.filter(id__in=ids)
+        .select_related("proveedor", "cliente", "almacen", "almacen_destino")
+        .prefetch_related("items__producto")
+    )
+    archivadas, items = [], []
+    for n in notas:
+        archivadas.append(NotaArchivada(
+            id=n.id,
+            cierre=cierre,
+            numero=n.numero,
+            fecha=n.fecha,
+            tipo=n.tipo,
+            proveedor_id=n.proveedor_id,
+            proveedor_nombre=_nombre(n.proveedor),
+            cliente_id=n.cliente_id,
+            cliente_nombre=_nombre(n.cliente),
+            almacen_id=n.almacen_id,
+            almacen_nombre=_nombre(n.almacen),
+            almacen_destino_id=n.almacen_destino_id,
+            almacen_destino_nombre=_nombre(n.almacen_destino),
+            orden_compra=n.orden_compra,
+        ))
+        items += [
+            NotaArchivadaItem(
+                nota_id=n.id,
+                producto_id=i.producto_id,
+                producto_nombre=i.producto.nombre,
+                producto_codigo=i.producto.codigo,
+                cantidad=i.cantidad,
+                precio_unitario=i.precio_unitario,
+            )
+            for i in n.items.all()
+        ]
+    NotaArchivada.objects.bulk_create(archivadas)
+    NotaArchivadaItem.objects.bulk_create(items)
+    borrar_notas(ids)
+    return len(archivadas), len(items)
+
+
+def cerrar(fecha_corte, tamano_lote=TAMANO_LOTE):
+    """Archiva las notas anteriores a fecha_corte y registra los saldos iniciales. Devuelve el Cierre."""
+    validar(fecha_corte)
+    with transaction.atomic():
+        anterior = Cierre.ultimo()
+        notas = notas_a_archivar(fecha_corte)
+        cierre = Cierre.objects.create(fecha_corte=fecha_corte)
+        SaldoInicial.objects.bulk_create([
+            SaldoInicial(cierre=cierre, almacen_id=a, producto_id=pid, stock=stock)
+            for (a, pid), stock in _saldos(anterior, notas).items() if stock
+        ])
+        ids = list(notas.order_by("id").values_list("id", flat=True))
+        for i in range(0, len(ids), tamano_lote):
+            n, m = _archivar(cierre, ids[i:i + tamano_lote])
+            cierre.notas += n
+            cierre.items += m
+        cierre.save(update_fields=["notas", "items"])
+    return cierre
@@ -0,0 +1,24 @@
+"""
+Filtros de consulta compartidos por las vistas y la exportación a PDF.
+
+Viven aparte de views.py para que exportar.py no tenga que importar las vistas
+(y todo lo que ellas importan) solo para filtrar notas.
+"""
+from django.db.models import Q
+
+
+def filtrar_notas(notas, q=None, start_date=None, end_date=None):
+    """Filtros compartidos por seguimiento, /api/notas/ y la exportación."""
+    if q:
+        notas = notas.filter(
+            Q(numero__icontains=q) |
+            Q(items__producto__nombre__icontains=q) |
+            Q(orden_compra__icontains=q) |
+            Q(proveedor__nombre__icontains=q) |
+            Q(cliente__nombre__icontains=q)
+        ).distinct()
+    if start_date:
+        notas = notas.filter(fecha__date__gte=start_date)
+    if end_date:
+        notas = notas.filter(fecha__date__lte=end_date)
+    return notas
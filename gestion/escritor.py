@@ -0,0 +1,104 @@
+"""
+Escritura agrupada (group commit) para POST /api/notas/crear/, opcional con
+ESCRITURA_AGRUPADA=1.
+
+En el cambio de turno muchos lectores mandan notas a la vez. Con SQLite cada
+nota es una transacción con su propio fsync y todas compiten por el único
+bloqueo de escritura, así que el rendimiento cae justo cuando más se escribe.
+
+Con la escritura agrupada la vista valida el JSON y encola la nota en un hilo
+escritor del proceso. El hilo toma lo que haya en la cola, espera a lo sumo
+ESCRITURA_ESPERA_MS por más, hasta ESCRITURA_LOTE_MAX notas, y las escribe en
+una sola transacción, cada una en su savepoint: la que falla (producto
+inexistente, proveedor faltante) se deshace sola y su request recibe su error,
+las demás se confirman juntas con un único commit. Cada request espera su
+propio resultado (id y número de nota) sin ocupar un hilo: la vista es async.
+
+Con poca carga el costo es la espera del lote (milisegundos); con ráfagas un
+commit sirve a muchas notas. Las peticiones con Idempotency-Key siguen el
+camino directo: su clave se registra en la misma transacción que la nota.
+Cada worker tiene su propio escritor; entre workers sigue habiendo un bloqueo
+de escritura por lote en lugar de uno por nota.
+"""
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+
+logger = logging.getLogger("gestion.escritor")
+
+
+def activo():
+    return getattr(settings, "ESCRITURA_AGRUPADA", False)
+
+
+class Escritor:
+    def __init__(self):
+        self._cola = queue.Queue()
+        self._lock = threading.Lock()
+        self._hilo = None
+        self.lotes = 0
+        self.escrituras = 0
+
+    def enviar(self, funcion):
+        """Encola funcion() para ejecutarla en el próximo lote. Devuelve un Future con su resultado o error."""
+        futuro = Future()
+        self._cola.put((funcion, futuro))
+        with self._lock:
+            if self._hilo is None or not self._hilo.is_alive():
+                self._hilo = threading.Thread(target=self._correr, name="escritor-notas", daemon=True)
+                self._hilo.start()
+        return futuro
+
+    def _lote(self):
+        lote = [self._cola.get()]
+        maximo = getattr(settings, "ESCRITURA_LOTE_MAX", 32)
+        limite = time.monotonic() + getattr(settings, "ESCRITURA_ESPERA_MS", 5) / 1000
+        while len(lote) < maximo:
+            try:
+                lote.append(self._cola.get(timeout=max(limite - time.monotonic(), 0)))
+            except queue.Empty:
+                break
+        return lote
+
+    def _correr(self):
+        while True:
+            lote = self._lote()
+            try:
+                self._escribir(lote)
+            except Exception as e:  # no debería pasar: que ningún request quede esperando
+                logger.exception("Escritura agrupada: falló un lote de %s", len(lote))
+                for _, futuro in lote:
+                    if not futuro.done():
+                        futuro.set_exception(e)
+
+    def _escribir(self, lote):
+        close_old_connections()
+        resultados = []
+        try:
+            with transaction.atomic():
+                for funcion, futuro in lote:
+                    try:
+                        with transaction.atomic():  # savepoint: un error solo deshace esta escritura
+                            resultados.append((futuro, funcion(), None))
+                    except Exception as e:
+                        resultados.append((futuro, None, e))
+        except Exception as e:
+            # falló el commit: no quedó escrita ninguna
+            for futuro, _, _ in resultados:
+                futuro.set_exception(e)
+            return
+        self.lotes += 1
+        self.escrituras += len(resultados)
+        for futuro, valor, error in resultados:
+            if error is None:
+                futuro.set_result(valor)
+            else:
+                futuro.set_exception(error)
+
+
+escritor = Escritor()
@@ -0,0 +1,174 @@
+"""
+Eventos en vivo para /api/eventos/ (Server-Sent Events).
+
+Las escrituras publican eventos al confirmarse la transacción:
+    nota_guardada     {"id", "numero", "creada"}   (signals.py)
+    nota_eliminada    {"id"}                       (signals.py)
+    notas_eliminadas  {"ids"}                      (borrado por conjunto, signals.borrar_notas)
+    stock             {"productos": {id: {"stock", "bajo_minimo"}}}  (inventario.py)
+
+EVENTOS_BACKEND elige cómo llegan a los navegadores:
+  "memoria" (por defecto): un hub dentro del proceso reparte cada evento a las
+      colas de las conexiones abiertas. Solo ve lo publicado en el mismo
+      proceso: sirve con un único worker (uvicorn, runserver).
+  "bd": cada evento se guarda en la tabla Evento y cada conexión lee los nuevos
+      cada EVENTOS_INTERVALO segundos (consulta por id, indexada). Funciona con
+      varios workers de gunicorn, que comparten la base de datos;
+      gunicorn_asgi.conf.py lo elige cuando arranca más de uno.
+
+Los ids de evento permiten retomar tras una reconexión (Last-Event-ID). En
+"memoria" llevan el prefijo del arranque del proceso: si no coincide se envía
+un evento "resync" para que la página recargue sus datos.
+"""
+import asyncio
+import itertools
+import json
+import threading
+import time
+from collections import deque
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Evento
+
+
+def backend():
+    return getattr(settings, "EVENTOS_BACKEND", "memoria")
+
+
+class Hub:
+    """Reparte eventos a las conexiones SSE abiertas en este proceso."""
+
+    def __init__(self, recientes=500):
+        self._lock = threading.Lock()
+        self._suscriptores = set()   # (loop, cola)
+        self._recientes = deque(maxlen=recientes)
+        self._contador = itertools.count(1)
+        self.arranque = format(time.time_ns() // 1_000_000, "x")
+
+    def publicar(self, tipo, datos):
+        with self._lock:
+            evento = (f"{self.arranque}-{next(self._contador)}", tipo, datos)
+            self._recientes.append(evento)
+            suscriptores = list(self._suscriptores)
+        for loop, cola in suscriptores:
+            try:
+                loop.call_soon_threadsafe(cola.put_nowait, evento)
+            except RuntimeError:  # el loop de esa conexión ya cerró
+                with self._lock:
+                    self._suscriptores.discard((loop, cola))
+
+    def suscribir(self):
+        cola = asyncio.Queue()
+        with self._lock:
+            self._suscriptores.add((asyncio.get_running_loop(), cola))
+        return cola
+
+    def desuscribir(self, cola):
+        with self._lock:
+            self._suscriptores = {s for s in self._suscriptores if s[1] is not cola}
+
+    def desde(self, ultimo_id):
+        """Eventos posteriores a ultimo_id; None si ese id no es de este arranque o ya salió del buffer."""
+        prefijo, _, numero = (ultimo_id or "").partition("-")
+        if prefijo != self.arranque or not numero.isdigit():
+            return None
+        numero = int(numero)
+        with self._lock:
+            recientes = list(self._recientes)
+        if recientes and int(recientes[0][0].split("-")[1]) > numero + 1:
+            return None
+        return [e for e in recientes if int(e[0].split("-")[1]) > numero]
+
+
+hub = Hub()
+
+
+def publicar(tipo, datos):
+    """Publica al confirmarse la transacción actual (de inmediato si no hay una)."""
+    transaction.on_commit(lambda: _publicar(tipo, datos))
+
+
+def _publicar(tipo, datos):
+    if backend() == "bd":
+        evento = Evento.objects.create(tipo=tipo, datos=datos)
+        if evento.id % 1000 == 0:
+            depurar()
+    else:
+        hub.publicar(tipo, datos)
+
+
+def formatear(evento_id, tipo, datos):
+    return f"id: {evento_id}\nevent: {tipo}\ndata: {json.dumps(datos, ensure_ascii=False)}\n\n"
+
+
+# ---------- flujos para la vista SSE ----------
+async def flujo(ultimo_id=None):
+    """Generador asíncrono de texto SSE (eventos y latidos)."""
+    latido = getattr(settings, "EVENTOS_HEARTBEAT", 15)
+    if backend() == "bd":
+        async for trozo in _flujo_bd(ultimo_id, latido):
+            yield trozo
+        return
+
+    # suscrito antes del primer envío: lo publicado desde que se abre el flujo no se pierde
+    cola = hub.suscribir()
+    try:
+        yield "retry: 3000\n\n"
+        if ultimo_id:
+            pendientes = hub.desde(ultimo_id)
+            if pendientes is None:
+                yield formatear(f"{hub.arranque}-0", "resync", {})
+            else:
+                for evento in pendientes:
+                    yield formatear(*evento)
+        while True:
+            try:
+                evento = await asyncio.wait_for(cola.get(), timeout=latido)
+            except asyncio.TimeoutError:
+                yield ": latido\n\n"
+                continue
+            yield formatear(*evento)
+    finally:
+        hub.desuscribir(cola)
+
+
+def _nuevos(ultimo, limite=200):
+    return list(Evento.objects.filter(id__gt=ultimo).order_by("id").values_list("id", "tipo", "datos")[:limite])
+
+
+def _ultimo_id_bd():
+    return Evento.objects.order_by("-id").values_list("id", flat=True).first() or 0
+
+
+async def _flujo_bd(ultimo_id, latido):
+    intervalo = getattr(settings, "EVENTOS_INTERVALO", 1.0)
+    try:
+        ultimo = int(ultimo_id)
+    except (TypeError, ValueError):
+        ultimo = await sync_to_async(_ultimo_id_bd)()
+    yield "retry: 3000\n\n"
+    espera = 0.0
+    while True:
+        nuevos = await sync_to_async(_nuevos)(ultimo)
+        for evento_id, tipo, datos in nuevos:
+            ultimo = evento_id
+            yield formatear(evento_id, tipo, datos)
+        if nuevos:
+            espera = 0.0
+            continue
+        await asyncio.sleep(intervalo)
+        espera += intervalo
+        if espera >= latido:
+            espera = 0.0
+            yield ": latido\n\n"
+
+
+def depurar(horas=None):
+    """Borra los eventos guardados más viejos que EVENTOS_RETENCION_HORAS."""
+    horas = horas or getattr(settings, "EVENTOS_RETENCION_HORAS", 24)
+    return Evento.objects.filter(creado__lt=timezone.now() - timedelta(hours=horas)).delete()[0]
@@ -0,0 +1,146 @@
+"""
+Exportación de notas a PDF con ReportLab (sin dependencias nativas en Windows).
+
+views.api_notas_export_pdf importa este módulo recién al exportar: ReportLab
+tarda en importarse y el resto de las vistas, los workers al arrancar y los
+comandos de manage.py no lo necesitan.
+"""
+import io
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from django.conf import settings
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import A4, landscape
+from reportlab.lib.styles import ParagraphStyle, getSampleStyleSheet
+from reportlab.platypus import Paragraph, SimpleDocTemplate, Spacer, Table, TableStyle
+
+from .consultas import filtrar_notas  # mismos filtros que seguimiento
+from .models import NotaPedido
+
+_pdf_executor = None
+
+
+def executor_pdf():
+    """
+    Pool donde se genera el PDF, fuera del event loop (ASGI) o del hilo del request.
+    PDF_EXECUTOR = "thread" (por defecto) | "process" (ReportLab es CPU puro y retiene el GIL).
+    """
+    global _pdf_executor
+    if _pdf_executor is None:
+        workers = getattr(settings, "PDF_WORKERS", 2)
+        if getattr(settings, "PDF_EXECUTOR", "thread") == "process":
+            _pdf_executor = ProcessPoolExecutor(max_workers=workers)
+        else:
+            _pdf_executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="pdf")
+    return _pdf_executor
+
+
+def filas_exportacion(id_list, q, start_date, end_date):
+    """Consulta las notas a exportar y las reduce a filas de texto (serializables)."""
+    notas = (
+        NotaPedido.objects
+        .select_related("proveedor", "cliente", "almacen", "almacen_destino")
+        .prefetch_related("items__producto")
+        .order_by("-fecha", "-id")
+    )
+    if id_list:
+        notas = notas.filter(id__in=id_list)
+    else:
+        notas = filtrar_notas(notas, q, start_date, end_date)
+
+    def fmt_fecha(n):
+        f = getattr(n, "fecha", None)
+        return f.strftime("%d/%m/%Y %H:%M") if f else "-"
+
+    def fmt_tipo(n):
+        t = (n.tipo or "").lower()
+        return "Entrada" if t == "entrada" else "Salida" if t == "salida" else (n.tipo or "-")
+
+    def fmt_dest(n):
+        if n.tipo == "Traslado":
+            origen = getattr(n.almacen, "nombre", "") or "-"
+            return f"Traslado: {origen} -> {getattr(n.almacen_destino, 'nombre', '') or '-'}"
+        if n.proveedor_id:
+            return f"Proveedor: {getattr(n.proveedor, 'nombre', '') or '-'}"
+        if n.cliente_id:
+            return f"Cliente: {getattr(n.cliente, 'nombre', '') or '-'}"
+        return "-"
+
+    def fmt_items(n):
+        líneas = []
+        for it in n.items.all():
+            nombre = getattr(it.producto, "nombre", "") or "-"
+            cant = getattr(it, "cantidad", 0) or 0
+            líneas.append(f"{nombre} (x{cant})")
+        # ReportLab hace wrap de \n automáticamente
+        return "\n".join(líneas) or "-"
+
+    return [
+        (n.numero or "-", fmt_fecha(n), fmt_tipo(n), fmt_items(n), fmt_dest(n), n.orden_compra or "-")
+        for n in notas
+    ]
+
+
+def construir_pdf_notas(filas):
+    """Arma el PDF con ReportLab a partir de filas de texto. No toca la BD."""
+    buffer = io.BytesIO()
+    doc = SimpleDocTemplate(
+        buffer,
+        pagesize=landscape(A4),
+        leftMargin=18, rightMargin=18, topMargin=20, bottomMargin=20
+    )
+
+    styles = getSampleStyleSheet()
+    styles.add(ParagraphStyle(name="Hdr", fontName="Helvetica", fontSize=14, leading=16, spaceAfter=8))
+    styles.add(ParagraphStyle(name="Cell", fontName="Helvetica", fontSize=9, leading=11))
+
+    story = []
+    story.append(Paragraph("C&R Logística — Notas de Pedido (Exportación)", styles["Hdr"]))
+    story.append(Spacer(1, 6))
+
+    data = [[
+        Paragraph("<b># Nota</b>", styles["Cell"]),
+        Paragraph("<b>Fecha</b>", styles["Cell"]),
+        Paragraph("<b>Tipo</b>", styles["Cell"]),
+        Paragraph("<b>Productos</b>", styles["Cell"]),
+        Paragraph("<b>Destinatario</b>", styles["Cell"]),
+        Paragraph("<b>Orden</b>", styles["Cell"]),
+    ]]
+
+    # filas
+    for numero, fecha, tipo, items, dest, orden in filas:
+        data.append([
+            Paragraph(numero, styles["Cell"]),
+            Paragraph(fecha, styles["Cell"]),
+            Paragraph(tipo, styles["Cell"]),
+            Paragraph(items.replace("&", "&amp;"), styles["Cell"]),
+            Paragraph(dest.replace("&", "&amp;"), styles["Cell"]),
+            Paragraph(orden.replace("&", "&amp;"), styles["Cell"]),
+        ])
+
+    table = Table(
+        data,
+        colWidths=[70, 90, 60, 330, 150, 120],
+        repeatRows=1
+    )
+    table.setStyle(TableStyle([
+        ("BACKGROUND", (0,0), (-1,0), colors.HexColor("#F3F4F6")),
+        ("TEXTCOLOR", (0,0), (-1,0), colors.HexColor("#111827")),
+        ("FONTNAME", (0,0), (-1,-1), "Helvetica"),
+        ("FONTSIZE", (0,0), (-1,-1), 9),
+        ("ALIGN", (0,0), (-1,0), "LEFT"),
+        ("VALIGN", (0,0), (-1,-1), "TOP"),
+        ("GRID", (0,0), (-1,-1), 0.25, colors.HexColor("#D1D5DB")),
+        ("ROWBACKGROUNDS", (0,1), (-1,-1), [colors.white, colors.HexColor("#FAFAFA")]),
+        ("LEFTPADDING", (0,0), (-1,-1), 6),
+        ("RIGHTPADDING", (0,0), (-1,-1), 6),
+        ("TOPPADDING", (0,0), (-1,-1), 4),
+        ("BOTTOMPADDING", (0,0), (-1,-1), 4),
+    ]))
+
+    story.append(table)
+    doc.build(story)
+
+    pdf_value = buffer.getvalue()
+    buffer.close()
+    return pdf_value
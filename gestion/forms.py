@@ -4,12 +4,12 @@ from .models import Producto, NotaPedido, NotaPedidoItem
 class ProductoForm(forms.ModelForm):
     class Meta:
         model = Producto
-        fields = ["codigo", "nombre", "unidad", "adquisicion", "precio", "peso", "proveedor"]
+        fields = ["codigo", "nombre", "unidad", "adquisicion", "precio", "peso", "proveedor", "stock_minimo"]
 
 class NotaForm(forms.ModelForm):
     class Meta:
         model = NotaPedido
-        fields = ["fecha", "tipo", "proveedor", "cliente", "orden_compra"]
+        fields = ["fecha", "tipo", "proveedor", "cliente", "almacen", "almacen_destino", "orden_compra"]
 
 
 class NotaItemForm(forms.ModelForm):
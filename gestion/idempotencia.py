@@ -0,0 +1,118 @@
+"""
+Idempotency-Key para las escrituras que los clientes reintentan (crear notas,
+borrados en lote).
+
+Si la petición trae el header Idempotency-Key, la clave se registra en la
+misma transacción que la escritura y al terminar se guarda la respuesta:
+
+  - misma clave y mismo cuerpo, ya respondida -> se devuelve la respuesta
+    guardada (header Idempotent-Replayed: true) sin ejecutar la vista
+  - misma clave con otro cuerpo -> 422
+  - la primera aún en curso -> el INSERT de la clave espera a que esa
+    transacción termine (índice único) y luego se repite su respuesta; si la
+    BD no responde a tiempo (SQLite bloqueado), 409 con Retry-After
+
+Las respuestas 5xx no se guardan: la escritura no ocurrió y el cliente puede
+reintentar con la misma clave. Se guarda el hash de ruta + clave (64 bytes) y
+el registro vive IDEMPOTENCIA_TTL_HORAS; se depura cada tantas altas.
+"""
+import hashlib
+from datetime import timedelta
+from functools import wraps
+
+from django.conf import settings
+from django.db import IntegrityError, OperationalError, transaction
+from django.http import HttpResponse, JsonResponse
+from django.utils import timezone
+
+from .models import ClaveIdempotencia
+
+HEADER = "Idempotency-Key"
+DEPURAR_CADA = 200
+
+
+def ttl():
+    return timedelta(hours=getattr(settings, "IDEMPOTENCIA_TTL_HORAS", 24))
+
+
+def _hash(*partes):
+    return hashlib.sha256(b"\0".join(partes)).hexdigest()
+
+
+def idempotente(vista):
+    """Decorador para vistas síncronas de escritura (ver docstring del módulo)."""
+    @wraps(vista)
+    def envoltura(request, *args, **kwargs):
+        clave = request.headers.get(HEADER)
+        if clave is None:
+            return vista(request, *args, **kwargs)
+        clave = clave.strip()
+        if not clave or len(clave) > 255:
+            return JsonResponse({"error": f"{HEADER} inválida (1 a 255 caracteres)"}, status=400)
+
+        clave = _hash(request.path.encode(), clave.encode())
+        huella = _hash(request.method.encode(), request.body)
+        try:
+            with transaction.atomic():
+                registro, previa = _reservar(clave, huella)
+                if previa is not None:
+                    return previa
+                respuesta = vista(request, *args, **kwargs)
+                if respuesta.status_code >= 500 or respuesta.streaming:
+                    registro.delete()
+                else:
+                    registro.estado = respuesta.status_code
+                    registro.tipo_contenido = respuesta.get("Content-Type", "")
+                    registro.cuerpo = respuesta.content
+                    registro.save(update_fields=["estado", "tipo_contenido", "cuerpo"])
+        except OperationalError:
+            respuesta = _en_curso()
+        return respuesta
+    return envoltura
+
+
+def _en_curso():
+    respuesta = JsonResponse({"error": f"Hay una petición en curso con la misma {HEADER}"}, status=409)
+    respuesta["Retry-After"] = "1"
+    return respuesta
+
+
+def _reservar(clave, huella, reintento=False):
+    """(registro nuevo, None) para ejecutar la vista, o (None, respuesta) si no hay que ejecutarla."""
+    ahora = timezone.now()
+    try:
+        with transaction.atomic():
+            registro = ClaveIdempotencia.objects.create(clave=clave, huella=huella, creada=ahora)
+        if registro.id % DEPURAR_CADA == 0:
+            depurar(ahora)
+        return registro, None
+    except IntegrityError:
+        pass
+
+    try:
+        registro = ClaveIdempotencia.objects.select_for_update().get(clave=clave)
+    except ClaveIdempotencia.DoesNotExist:
+        # la depuró otro request entre el INSERT fallido y esta lectura: se intenta una vez más
+        if not reintento:
+            return _reservar(clave, huella, reintento=True)
+        return None, _en_curso()
+    if registro.creada < ahora - ttl():
+        # vencida pero aún sin depurar: cuenta como una clave nueva
+        registro.huella, registro.estado, registro.tipo_contenido, registro.cuerpo = huella, None, "", b""
+        registro.creada = ahora
+        registro.save()
+        return registro, None
+    if registro.huella != huella:
+        return None, JsonResponse({"error": f"{HEADER} ya usada con otro cuerpo"}, status=422)
+    if registro.estado is None:
+        return None, _en_curso()
+
+    respuesta = HttpResponse(bytes(registro.cuerpo), status=registro.estado, content_type=registro.tipo_contenido)
+    respuesta["Idempotent-Replayed"] = "true"
+    return None, respuesta
+
+
+def depurar(ahora=None):
+    """Borra las claves vencidas."""
+    ahora = ahora or timezone.now()
+    return ClaveIdempotencia.objects.filter(creada__lt=ahora - ttl()).delete()[0]
@@ -0,0 +1,333 @@
+"""
+Stock guardado en Producto y alertas de reposición.
+
+Producto.stock es el saldo (Entradas - Salidas) y solo se modifica desde aquí,
+con UPDATE ... SET stock = stock + delta sobre los productos de la nota: crear
+o borrar una nota cuesta lo mismo tenga el catálogo 100 o 100.000 productos.
+En la misma transacción se recalcula Producto.bajo_minimo (indexado) para esos
+productos, así /api/productos/alertas/ es una consulta sobre el índice.
+
+Cuando un producto cruza su stock_minimo (en cualquier sentido) se agrega una
+línea JSON a ALERTAS_STOCK_ARCHIVO al confirmarse la transacción; el comando
+resumen_alertas arma el resumen para quien deba reponer.
+
+Las mismas funciones mantienen el acumulado diario de analitica.py, así stock
+y analítica se actualizan en la misma transacción que la nota.
+
+Con varias sedes, además del total en Producto.stock cada nota mueve el saldo
+de su almacén en StockAlmacen (un Traslado resta en el origen y suma en el
+destino, sin cambiar el total ni la analítica). Mismo criterio: un UPDATE por
+nota sobre las filas (almacen, producto) que toca, con índice único.
+
+Si el saldo se desvía (cargas manuales en la BD, restauraciones), el comando
+recalcular_stock lo reconstruye desde los items, el total y el de cada almacén.
+Después de un cierre (cierre.py) los items archivados ya no están: se parte del
+SaldoInicial del último cierre.
+"""
+import json
+import threading
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from . import analitica, cache_vistas, eventos
+from .models import Cierre, NotaPedidoItem, Producto, SaldoInicial, StockAlmacen, expresion_bajo_minimo
+
+_lock_archivo = threading.Lock()
+
+
+def signo(tipo):
+    """Efecto en el stock total; un Traslado no lo cambia."""
+    return {"Entrada": 1, "Salida": -1}.get(tipo, 0)
+
+
+def lados(tipo, almacen_id, destino_id):
+    """(almacen_id, signo) de los saldos por almacén que mueve una nota."""
+    if tipo == "Traslado":
+        lados = ((almacen_id, -1), (destino_id, 1))
+    else:
+        lados = ((almacen_id, signo(tipo)),)
+    return [(a, s) for a, s in lados if a is not None and s]
+
+
+def efecto_almacen(nota, items, factor=1):
+    """{(almacen_id, producto_id): cambio} de la nota en StockAlmacen (factor=-1 la deshace)."""
+    efecto = {}
+    for almacen_id, s in lados(nota.tipo, nota.almacen_id, nota.almacen_destino_id):
+        for pid, (cantidad, _) in items.items():
+            efecto[(almacen_id, pid)] = efecto.get((almacen_id, pid), 0) + factor * s * cantidad
+    return efecto
+
+
+def items_de(nota):
+    """{producto_id: (cantidad, monto)} de los items de la nota (sumando repetidos)."""
+    totales = {}
+    for producto_id, cantidad, precio in nota.items.values_list("producto_id", "cantidad", "precio_unitario"):
+        c, m = totales.get(producto_id, (0, 0))
+        totales[producto_id] = (c + cantidad, m + cantidad * precio)
+    return totales
+
+
+def aplicar_almacenes(efecto):
+    """
+    Suma {(almacen_id, producto_id): cambio} a StockAlmacen: un INSERT que crea
+    (sin pisar) las filas que faltan y un UPDATE para todas.
+    """
+    efecto = {k: d for k, d in efecto.items() if d}
+    if not efecto:
+        return
+    with transaction.atomic():
+        StockAlmacen.objects.bulk_create(
+            [StockAlmacen(almacen_id=a, producto_id=pid) for a, pid in efecto], ignore_conflicts=True
+        )
+        StockAlmacen.objects.filter(
+            almacen_id__in={a for a, _ in efecto}, producto_id__in={pid for _, pid in efecto}
+        ).update(
+            stock=F("stock") + Case(
+                *[When(almacen_id=a, producto_id=pid, then=Value(d)) for (a, pid), d in efecto.items()],
+                default=Value(0),
+                output_field=IntegerField(),
+            ),
+            actualizado=timezone.now(),
+        )
+
+
+def aplicar(deltas, nota=None, por_almacen=None):
+    """
+    Suma deltas {producto_id: cambio} al stock guardado y actualiza bajo_minimo;
+    `por_almacen` ({(almacen_id, producto_id): cambio}) va a aplicar_almacenes().
+    Devuelve las transiciones de alerta (también se escriben al confirmar).
+    """
+    if por_almacen:
+        aplicar_almacenes(por_almacen)
+    deltas = {pid: d for pid, d in deltas.items() if d}
+    if not deltas:
+        return []
+
+    with transaction.atomic():
+        productos = Producto.objects.filter(id__in=deltas)
+        antes = {
+            p["id"]: p for p in productos.select_for_update()
+            .values("id", "nombre", "codigo", "stock", "stock_minimo", "bajo_minimo")
+        }
+        productos.update(
+            stock=F("stock") + Case(
+                *[When(id=pid, then=Value(d)) for pid, d in deltas.items()],
+                default=Value(0),
+                output_field=IntegerField(),
+            ),
+            actualizado=timezone.now(),  # update() no aplica auto_now; /api/sync/ lo necesita
+        )
+        productos.update(bajo_minimo=expresion_bajo_minimo())
+
+        transiciones = []
+        saldos = {}
+        for pid, p in antes.items():
+            stock = p["stock"] + deltas[pid]
+            bajo = p["stock_minimo"] is not None and stock <= p["stock_minimo"]
+            saldos[pid] = {"stock": stock, "bajo_minimo": bajo, "stock_minimo": p["stock_minimo"]}
+            if bajo != p["bajo_minimo"]:
+                transiciones.append({
+                    "evento": "bajo_minimo" if bajo else "repuesto",
+                    "producto": pid,
+                    "codigo": p["codigo"],
+                    "nombre": p["nombre"],
+                    "stock": stock,
+                    "stock_minimo": p["stock_minimo"],
+                    "nota": getattr(nota, "numero", None),
+                })
+
+        # update() no dispara señales: el cache de vistas se invalida a mano
+        transaction.on_commit(lambda: cache_vistas.invalidar(Producto))
+        if transiciones:
+            transaction.on_commit(lambda: _escribir_alertas(transiciones))
+        eventos.publicar("stock", {"productos": saldos})
+    return transiciones
+
+
+def registrar(nota):
+    """Aplica al stock y a la analítica una nota recién creada con sus items."""
+    items = items_de(nota)
+    s = signo(nota.tipo)
+    with transaction.atomic():
+        analitica.acumular(nota, 1, items)
+        return aplicar({pid: s * c for pid, (c, _) in items.items()}, nota, efecto_almacen(nota, items))
+
+
+def revertir(nota, items=None):
+    """Deshace el efecto de la nota. Llamar antes de borrarla (o pasar sus items)."""
+    items = items_de(nota) if items is None else items
+    s = signo(nota.tipo)
+    with transaction.atomic():
+        analitica.acumular(nota, -1, items)
+        return aplicar({pid: -s * c for pid, (c, _) in items.items()}, nota, efecto_almacen(nota, items, -1))
+
+
+def revertir_notas(notas):
+    """
+    Deshace el efecto de varias notas (queryset) a la vez: una lectura de sus
+    items, un solo aplicar() con los deltas sumados por producto y un solo
+    acumular_varios() para todas las filas del acumulado (día, tipo, contraparte).
+    Llamar antes de borrarlas.
+    """
+    filas = (
+        NotaPedidoItem.objects
+        .filter(nota__in=notas)
+        .values_list("nota__tipo", "nota__fecha", "nota__proveedor_id", "nota__cliente_id",
+                     "nota__almacen_id", "nota__almacen_destino_id", "producto_id", "cantidad", "precio_unitario")
+    )
+    deltas, por_almacen, grupos = {}, {}, {}
+    for tipo, fecha, proveedor_id, cliente_id, almacen_id, destino_id, pid, cantidad, precio in filas:
+        deltas[pid] = deltas.get(pid, 0) - signo(tipo) * cantidad
+        for a, s in lados(tipo, almacen_id, destino_id):
+            por_almacen[(a, pid)] = por_almacen.get((a, pid), 0) - s * cantidad
+        items = grupos.setdefault((timezone.localtime(fecha).date(), tipo, proveedor_id, cliente_id), {})
+        c, m = items.get(pid, (0, 0))
+        items[pid] = (c + cantidad, m + cantidad * precio)
+
+    with transaction.atomic():
+        analitica.acumular_varios(grupos, -1)
+        return aplicar(deltas, por_almacen=por_almacen)
+
+
+def nota_editada(nota, anterior):
+    """
+    Ajusta stock y analítica cuando cambian la cabecera de una nota (tipo, fecha,
+    proveedor, cliente o almacenes) sin tocar sus items. `anterior` es una copia
+    de la nota antes del cambio.
+    """
+    if analitica.clave(nota) == analitica.clave(anterior) and _almacenes(nota) == _almacenes(anterior):
+        return []
+    items = items_de(nota)
+    return nota_modificada(nota, anterior, items, items)
+
+
+def nota_modificada(nota, anterior, antes, despues):
+    """
+    Ajusta stock y analítica por un cambio de cabecera y/o de items. `antes` y
+    `despues` son los items {producto_id: (cantidad, monto)} de la nota antes y
+    después del cambio; `anterior`, una copia de la nota antes del cambio.
+    Solo los productos cuyo efecto cambia llegan a aplicar().
+    """
+    productos = antes.keys() | despues.keys()
+    with transaction.atomic():
+        if analitica.clave(nota) == analitica.clave(anterior):
+            # misma fila del acumulado: basta con sumar la diferencia de cada producto
+            diferencia = {}
+            for pid in productos:
+                c0, m0 = antes.get(pid, (0, 0))
+                c1, m1 = despues.get(pid, (0, 0))
+                if (c0, m0) != (c1, m1):
+                    diferencia[pid] = (c1 - c0, m1 - m0)
+            analitica.acumular(nota, 1, diferencia)
+        else:
+            analitica.acumular(anterior, -1, antes)
+            analitica.acumular(nota, 1, despues)
+        # una Entrada que pasa a Salida (o al revés) mueve el doble de sus cantidades
+        s0, s1 = signo(anterior.tipo), signo(nota.tipo)
+        por_almacen = efecto_almacen(anterior, antes, -1)
+        for clave, d in efecto_almacen(nota, despues).items():
+            por_almacen[clave] = por_almacen.get(clave, 0) + d
+        return aplicar({
+            pid: s1 * despues.get(pid, (0, 0))[0] - s0 * antes.get(pid, (0, 0))[0]
+            for pid in productos
+        }, nota, por_almacen)
+
+
+def _almacenes(nota):
+    return (nota.almacen_id, nota.almacen_destino_id)
+
+
+def recalcular(producto_ids=None):
+    """
+    Reconstruye stock y bajo_minimo desde el saldo inicial del último cierre y
+    los items. Devuelve cuántos productos cambiaron.
+    """
+    inicial = (
+        SaldoInicial.objects
+        .filter(cierre=Cierre.ultimo(), producto_id=OuterRef("pk"))
+        .values("producto_id")
+        .annotate(total=Sum("stock"))
+        .values("total")
+    )
+    saldo = (
+        NotaPedidoItem.objects
+        .filter(producto_id=OuterRef("pk"))
+        .values("producto_id")
+        .annotate(total=Sum(Case(
+            When(nota__tipo="Entrada", then=F("cantidad")),
+            When(nota__tipo="Salida", then=-F("cantidad")),
+            default=Value(0),
+            output_field=IntegerField(),
+        )))
+        .values("total")
+    )
+    productos = Producto.objects.all()
+    if producto_ids is not None:
+        productos = productos.filter(id__in=producto_ids)
+    with transaction.atomic():
+        antes = dict(productos.values_list("id", "stock"))
+        productos.update(
+            stock=(Coalesce(Subquery(inicial, output_field=IntegerField()), Value(0))
+                   + Coalesce(Subquery(saldo, output_field=IntegerField()), Value(0))),
+            actualizado=timezone.now(),
+        )
+        productos.update(bajo_minimo=expresion_bajo_minimo())
+        cambiados = sum(1 for pid, stock in productos.values_list("id", "stock") if antes.get(pid) != stock)
+        transaction.on_commit(lambda: cache_vistas.invalidar(Producto))
+    return cambiados
+
+
+def recalcular_almacenes(producto_ids=None):
+    """Reconstruye StockAlmacen desde el último cierre y los items. Devuelve cuántos saldos cambiaron."""
+    items = NotaPedidoItem.objects.all()
+    iniciales = SaldoInicial.objects.filter(cierre=Cierre.ultimo(), almacen__isnull=False)
+    saldos_actuales = StockAlmacen.objects.all()
+    if producto_ids is not None:
+        items = items.filter(producto_id__in=producto_ids)
+        iniciales = iniciales.filter(producto_id__in=producto_ids)
+        saldos_actuales = saldos_actuales.filter(producto_id__in=producto_ids)
+    saldos = {(a, pid): stock for a, pid, stock in iniciales.values_list("almacen_id", "producto_id", "stock")}
+    for tipo, almacen_id, destino_id, pid, total in (
+        items.values_list("nota__tipo", "nota__almacen_id", "nota__almacen_destino_id", "producto_id")
+        .annotate(total=Sum("cantidad"))
+        .order_by()
+    ):
+        for a, s in lados(tipo, almacen_id, destino_id):
+            saldos[(a, pid)] = saldos.get((a, pid), 0) + s * total
+
+    with transaction.atomic():
+        antes = {(a, pid): (fila_id, stock) for fila_id, a, pid, stock in
+                 saldos_actuales.values_list("id", "almacen_id", "producto_id", "stock")}
+        cambiados = [k for k in antes.keys() | saldos.keys() if antes.get(k, (None, 0))[1] != saldos.get(k, 0)]
+        StockAlmacen.objects.filter(id__in=[antes[k][0] for k in cambiados if k in antes]).delete()
+        StockAlmacen.objects.bulk_create([
+            StockAlmacen(almacen_id=a, producto_id=pid, stock=saldos[(a, pid)])
+            for a, pid in cambiados if saldos.get((a, pid))
+        ])
+    return len(cambiados)
+
+
+def alertas():
+    """Productos en o bajo su stock mínimo, los más faltantes primero."""
+    return (
+        Producto.objects
+        .filter(bajo_minimo=True)
+        .select_related("proveedor")
+        .order_by(F("stock") - F("stock_minimo"), "nombre", "id")
+    )
+
+
+def _escribir_alertas(transiciones):
+    archivo = getattr(settings, "ALERTAS_STOCK_ARCHIVO", "")
+    if not archivo:
+        return
+    fecha = timezone.now().isoformat()
+    lineas = "".join(
+        json.dumps(dict(t, fecha=fecha), ensure_ascii=False) + "\n" for t in transiciones
+    )
+    with _lock_archivo, open(archivo, "a", encoding="utf-8") as f:
+        f.write(lineas)
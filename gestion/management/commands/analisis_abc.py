@@ -0,0 +1,38 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from gestion import rotacion
+
+
+class Command(BaseCommand):
+    help = "Clasificación ABC, rotación, días de cobertura y stock muerto de todos los productos."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dias", type=int, default=365, help="Ventana de movimientos (días).")
+        parser.add_argument("--sin-movimiento", type=int, default=180,
+                            help="Días sin salidas para considerar un producto stock muerto.")
+        parser.add_argument("--json", action="store_true", help="Salida completa en JSON.")
+
+    def handle(self, *args, **options):
+        data = rotacion.analizar(options["dias"], options["sin_movimiento"])
+        if options["json"]:
+            self.stdout.write(json.dumps(data, ensure_ascii=False, indent=2))
+            return
+
+        r = data["resumen"]
+        self.stdout.write(f"{r['movimientos']} movimientos en {r['dias']} días, calculado en {r['ms']} ms")
+        for clase, datos in r["clases"].items():
+            self.stdout.write(f"  Clase {clase}: {datos['productos']:>5} productos  S/. {datos['valor']:,.2f}")
+        self.stdout.write(f"  Stock muerto: {r['stock_muerto']} productos")
+        self.stdout.write("")
+        for p in data["productos"]:
+            if p["clase"] == "C" and not p["stock_muerto"]:
+                continue
+            rot = "-" if p["rotacion"] is None else f"{p['rotacion']:.2f}"
+            cob = "-" if p["dias_cobertura"] is None else f"{p['dias_cobertura']:.0f}"
+            marca = " MUERTO" if p["stock_muerto"] else ""
+            self.stdout.write(
+                f"  {p['clase']} {p['codigo'] or 'S/C':<12} {p['nombre'][:40]:<40} "
+                f"rotación={rot:<7} cobertura={cob:<6}d{marca}"
+            )
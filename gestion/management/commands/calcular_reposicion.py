@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from gestion import reposicion
+
+
+class Command(BaseCommand):
+    help = (
+        "Calcula demanda diaria, punto de reorden y cantidad sugerida por producto. "
+        "Por defecto solo recalcula los productos con movimientos desde la última corrida."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dias", type=int, help="Ventana de demanda en días (REPOSICION_VENTANA_DIAS).")
+        parser.add_argument("--completo", action="store_true",
+                            help="Recalcula todos los productos (conviene una vez al día).")
+
+    def handle(self, *args, **options):
+        r = reposicion.calcular(options["dias"], options["completo"])
+        modo = "incremental" if r["incremental"] else "completo"
+        self.stdout.write(f"Sugerencias actualizadas ({modo}): {r['productos']} productos en {r['ms']} ms")
@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from gestion import cierre
+
+
+class Command(BaseCommand):
+    help = (
+        "Archiva las notas anteriores a la fecha de corte (NotaArchivada) y registra el "
+        "saldo inicial de cada producto por almacén. El stock no cambia."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--fecha", help="Fecha de corte AAAA-MM-DD (por defecto, 1 de enero del año en curso).")
+        parser.add_argument("--simular", action="store_true", help="Solo informa cuántas notas e items archivaría.")
+
+    def handle(self, *args, **options):
+        if options["fecha"]:
+            fecha = parse_date(options["fecha"])
+            if fecha is None:
+                raise CommandError("--fecha debe tener formato AAAA-MM-DD")
+        else:
+            fecha = timezone.localdate().replace(month=1, day=1)
+
+        try:
+            cierre.validar(fecha)
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        if options["simular"]:
+            cuenta = cierre.previsualizar(fecha)
+            self.stdout.write(f"Cierre al {fecha:%d/%m/%Y}: archivaría {cuenta['notas']} notas y {cuenta['items']} items")
+            return
+
+        hecho = cierre.cerrar(fecha)
+        self.stdout.write(
+            f"Cierre al {fecha:%d/%m/%Y}: {hecho.notas} notas y {hecho.items} items archivados, "
+            f"{hecho.saldos.count()} saldos iniciales"
+        )
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+
+from gestion import perfil_sql
+
+
+class Command(BaseCommand):
+    help = (
+        "Consultas SQL más costosas por huella y vista (acumulado de todos los workers) "
+        "y las últimas sentencias lentas de SQL_LENTAS_ARCHIVO con su plan."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--top", type=int, default=20, help="Cuántas huellas mostrar (20).")
+        parser.add_argument("--orden", choices=("total", "max", "promedio", "cantidad"), default="total")
+        parser.add_argument("--vista", help="Solo las consultas de esta vista (p. ej. api_notas_list).")
+        parser.add_argument("--lentas", type=int, default=5, help="Últimas sentencias lentas a mostrar (5).")
+        parser.add_argument("--reiniciar", action="store_true", help="Pone los acumulados en cero.")
+
+    def handle(self, *args, **options):
+        consultas = perfil_sql.top(options["top"], options["orden"], options["vista"])
+        self.stdout.write(f"{'vista':<28} {'cant.':>8} {'total ms':>10} {'prom. ms':>9} {'máx. ms':>9}  sql")
+        for c in consultas:
+            self.stdout.write(
+                f"{c['vista'][:28]:<28} {c['cantidad']:>8} {c['total_ms']:>10.1f} {c['promedio_ms']:>9.2f} "
+                f"{c['max_ms']:>9.1f}  [{c['huella']}] {c['sql'][:120]}"
+            )
+        for l in perfil_sql.lentas(options["lentas"]):
+            self.stdout.write(f"\n[{l['fecha']}] {l['ms']} ms en {l['vista']} [{l['huella']}]\n  {l['sql'][:500]}")
+            for linea in l.get("plan") or []:
+                self.stdout.write(f"    {linea}")
+        if options["reiniciar"]:
+            perfil_sql.reiniciar()
+            self.stdout.write("Acumulados reiniciados.")
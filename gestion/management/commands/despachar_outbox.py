@@ -0,0 +1,35 @@
+import signal
+import threading
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from gestion import outbox
+
+
+class Command(BaseCommand):
+    help = (
+        "Envía a OUTBOX_URL, en orden de id (ver outbox.py) y por lotes, los eventos de notas del outbox. "
+        "Corre hasta recibir SIGTERM / Ctrl+C; debe haber un solo despachador."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--una-vez", action="store_true",
+                            help="Envía lo pendiente (reintentando si falla) y termina.")
+        parser.add_argument("--estado", action="store_true", help="Muestra pendientes y el último error.")
+
+    def handle(self, *args, **options):
+        if options["estado"]:
+            estado = outbox.estado()
+            self.stdout.write(f"Pendientes: {estado['pendientes']} (el más antiguo: {estado['mas_antiguo'] or '-'})")
+            if estado["ultimo_error"]:
+                self.stdout.write(f"Intentos: {estado['intentos']}; último error: {estado['ultimo_error']}")
+            return
+        if not getattr(settings, "OUTBOX_URL", ""):
+            raise CommandError("OUTBOX_URL no está configurada")
+
+        detener = threading.Event()
+        for senal in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(senal, lambda *_: detener.set())
+        entregados = outbox.correr(detener, hasta_vaciar=options["una_vez"])
+        self.stdout.write(f"Eventos entregados: {entregados}")
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from gestion.cache_vistas import estadisticas, reiniciar_estadisticas
+
+
+class Command(BaseCommand):
+    help = "Muestra aciertos/fallos del cache de vistas (index, seguimiento)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--reiniciar", action="store_true", help="Pone los contadores en cero.")
+
+    def handle(self, *args, **options):
+        for vista, datos in estadisticas().items():
+            self.stdout.write(
+                f"{vista:<14} hits={datos['hits']:<8} misses={datos['misses']:<8} ratio={datos['ratio']:.1%}"
+            )
+        if options["reiniciar"]:
+            reiniciar_estadisticas()
+            self.stdout.write("Contadores reiniciados.")
@@ -0,0 +1,33 @@
+from asgiref.sync import async_to_sync
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory
+
+from gestion import views
+from mi_proyecto.middleware import brotli, comprimir
+
+MODOS = [
+    ("productos completo", views.api_productos, {"page_size": 200}),
+    ("productos fields", views.api_productos, {"page_size": 200, "fields": "id,nombre,precio,unidad,stock"}),
+    ("productos normalized", views.api_productos, {"page_size": 200, "format": "normalized"}),
+    ("notas completo", views.api_notas_list, {}),
+    ("notas fields", views.api_notas_list, {"fields": "id,numero,fecha,tipo,orden"}),
+    ("notas normalized", views.api_notas_list, {"format": "normalized"}),
+]
+
+
+class Command(BaseCommand):
+    help = "Mide el tamaño de /api/productos/ y /api/notas/ en cada modo (completo, fields, normalized) y comprimido."
+
+    def handle(self, *args, **options):
+        rf = RequestFactory()
+        encabezado = f"{'modo':<24}{'json':>12}{'gzip':>12}{'br':>12}"
+        self.stdout.write(encabezado)
+        self.stdout.write("-" * len(encabezado))
+        for nombre, vista, params in MODOS:
+            response = async_to_sync(vista)(rf.get("/", params))
+            crudo = response.content
+            gz = len(comprimir(crudo, "gzip"))
+            br = len(comprimir(crudo, "br")) if brotli is not None else None
+            self.stdout.write(
+                f"{nombre:<24}{len(crudo):>12,}{gz:>12,}{br if br is None else format(br, ','):>12}"
+            )
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from gestion import inventario
+
+
+class Command(BaseCommand):
+    help = "Reconstruye Producto.stock, bajo_minimo y el stock por almacén desde el último cierre y los items de las notas."
+
+    def add_arguments(self, parser):
+        parser.add_argument("productos", nargs="*", type=int, help="IDs de producto (por defecto, todos).")
+
+    def handle(self, *args, **options):
+        productos = options["productos"] or None
+        cambiados = inventario.recalcular(productos)
+        self.stdout.write(f"Productos con stock corregido: {cambiados}")
+        saldos = inventario.recalcular_almacenes(productos)
+        self.stdout.write(f"Saldos por almacén corregidos: {saldos}")
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from gestion import analitica
+
+
+class Command(BaseCommand):
+    help = "Rehace la tabla acumulada MovimientoDiario desde los items de las notas."
+
+    def handle(self, *args, **options):
+        filas = analitica.reconstruir()
+        self.stdout.write(f"Filas de movimientos diarios: {filas}")
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from gestion import respaldo
+
+
+class Command(BaseCommand):
+    help = (
+        "Respaldo consistente de la base de datos sin detener la app (API de backup de SQLite por pasos; "
+        "pg_dump / mysqldump con otros motores). Verifica la copia antes de darle el nombre final."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("destino", nargs="?", help="Archivo de salida (por defecto en RESPALDO_DIR, con fecha y hora).")
+        parser.add_argument("--comprimir", action="store_true", help="Comprime con gzip (.gz).")
+        parser.add_argument("--database", default="default", help="Alias de DATABASES (por defecto, default).")
+
+    def handle(self, *args, **options):
+        try:
+            hecho = respaldo.respaldar(options["destino"], options["database"], options["comprimir"])
+        except respaldo.ErrorRespaldo as e:
+            raise CommandError(str(e))
+        detalle = ""
+        if "pasos" in hecho:
+            detalle = f", {hecho['paginas']} páginas en {hecho['pasos']} pasos, {hecho['reinicios']} reinicios"
+            if hecho["de_una_vez"]:
+                detalle += " (terminó de una vez)"
+        self.stdout.write(f"Respaldo en {hecho['archivo']}: {hecho['bytes']} bytes en {hecho['segundos']} s{detalle}")
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from gestion import respaldo
+
+
+class Command(BaseCommand):
+    help = (
+        "Reemplaza la base de datos por un respaldo, previa verificación. Antes respalda la base actual "
+        "en RESPALDO_DIR. Conviene detener los workers o reiniciarlos después."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("archivo")
+        parser.add_argument("--database", default="default", help="Alias de DATABASES (por defecto, default).")
+        parser.add_argument("--noinput", "--no-input", action="store_false", dest="interactive",
+                            help="No pide confirmación.")
+        parser.add_argument("--sin-respaldo-previo", action="store_true",
+                            help="No respalda la base actual antes de reemplazarla.")
+
+    def handle(self, *args, **options):
+        alias = options["database"]
+        if options["interactive"]:
+            respuesta = input(f"Se reemplazará la base '{alias}' por {options['archivo']}. Escriba 'si' para seguir: ")
+            if respuesta.strip().lower() not in ("si", "sí"):
+                raise CommandError("Restauración cancelada")
+        try:
+            if not options["sin_respaldo_previo"]:
+                previo = respaldo.respaldar(alias=alias, comprimir=True)
+                self.stdout.write(f"Base actual respaldada en {previo['archivo']}")
+            respaldo.restaurar(options["archivo"], alias)
+        except respaldo.ErrorRespaldo as e:
+            raise CommandError(str(e))
+        self.stdout.write(f"Base '{alias}' restaurada desde {options['archivo']}")
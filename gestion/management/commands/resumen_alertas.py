@@ -0,0 +1,62 @@
+import json
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from gestion import inventario
+
+
+class Command(BaseCommand):
+    help = (
+        "Resumen de productos en o bajo su stock mínimo, con los cruces de umbral "
+        "registrados en ALERTAS_STOCK_ARCHIVO desde la última ejecución."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--salida", help="Escribe el resumen (JSON) en este archivo en lugar de mostrarlo.")
+        parser.add_argument(
+            "--vaciar", action="store_true",
+            help="Vacía ALERTAS_STOCK_ARCHIVO después de leerlo (los cruces ya quedan en el resumen).",
+        )
+
+    def _cruces(self, vaciar):
+        archivo = Path(getattr(settings, "ALERTAS_STOCK_ARCHIVO", "") or "")
+        if not archivo.name or not archivo.exists():
+            return []
+        # se renombra antes de leer: lo que llegue mientras tanto va a un archivo nuevo
+        leer = archivo.with_name(archivo.name + ".leyendo") if vaciar else archivo
+        if vaciar:
+            archivo.replace(leer)
+        with open(leer, encoding="utf-8") as f:
+            cruces = [json.loads(linea) for linea in f if linea.strip()]
+        if vaciar:
+            leer.unlink()
+        return cruces
+
+    def handle(self, *args, **options):
+        productos = [{
+            "id": p.id,
+            "codigo": p.codigo,
+            "nombre": p.nombre,
+            "proveedor": p.proveedor.nombre,
+            "stock": p.stock,
+            "stock_minimo": p.stock_minimo,
+            "faltante": p.stock_minimo - p.stock,
+        } for p in inventario.alertas()]
+        resumen = {"bajo_minimo": productos, "cruces": self._cruces(options["vaciar"])}
+
+        if options["salida"]:
+            with open(options["salida"], "w", encoding="utf-8") as f:
+                json.dump(resumen, f, ensure_ascii=False, indent=2)
+            self.stdout.write(f"Resumen escrito en {options['salida']} ({len(productos)} productos bajo mínimo)")
+            return
+
+        self.stdout.write(f"Productos bajo stock mínimo: {len(productos)}")
+        for p in productos:
+            self.stdout.write(
+                f"  {p['codigo'] or 'S/C':<12} {p['nombre'][:40]:<40} stock={p['stock']:<6} "
+                f"mínimo={p['stock_minimo']:<6} proveedor={p['proveedor']}"
+            )
+        for c in resumen["cruces"]:
+            self.stdout.write(f"  [{c['fecha']}] {c['evento']}: {c['nombre']} ({c['stock']}/{c['stock_minimo']})")
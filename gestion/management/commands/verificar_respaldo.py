@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from gestion import respaldo
+
+
+class Command(BaseCommand):
+    help = "Verifica un respaldo (integridad de SQLite o volcado completo) sin tocar la base de datos."
+
+    def add_arguments(self, parser):
+        parser.add_argument("archivo")
+        parser.add_argument("--database", default="default", help="Alias de DATABASES cuyo motor generó el respaldo.")
+
+    def handle(self, *args, **options):
+        try:
+            resultado = respaldo.verificar(options["archivo"], options["database"])
+        except respaldo.ErrorRespaldo as e:
+            raise CommandError(str(e))
+        if not resultado["ok"]:
+            raise CommandError("Respaldo dañado: " + "; ".join(resultado["detalle"]))
+        linea = "Respaldo correcto"
+        if resultado["tablas"] is not None:
+            linea += f": {resultado['tablas']} tablas, última migración {resultado['migracion'] or '-'}"
+        self.stdout.write(linea)
@@ -0,0 +1,58 @@
+# Generated by Django 5.2.5 on 2026-10-19 04:35
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def numerar_existentes(apps, schema_editor):
+    """Misma numeración que calculaba seguimiento.html: por año, en orden de fecha."""
+    NotaPedido = apps.get_model('gestion', 'NotaPedido')
+    SecuenciaNota = apps.get_model('gestion', 'SecuenciaNota')
+    contadores = {}
+    for nota in NotaPedido.objects.order_by('fecha', 'id').iterator():
+        anio = timezone.localtime(nota.fecha).year
+        contadores[anio] = contadores.get(anio, 0) + 1
+        nota.anio = anio
+        nota.correlativo = contadores[anio]
+        nota.numero = f"N{anio}_{str(contadores[anio]).zfill(4)}"
+        nota.save(update_fields=['anio', 'correlativo', 'numero'])
+    SecuenciaNota.objects.bulk_create(
+        [SecuenciaNota(anio=anio, ultimo=ultimo) for anio, ultimo in contadores.items()]
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion', '0005_alter_producto_precio'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SecuenciaNota',
+            fields=[
+                ('anio', models.PositiveSmallIntegerField(primary_key=True, serialize=False)),
+                ('ultimo', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='notapedido',
+            name='anio',
+            field=models.PositiveSmallIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='notapedido',
+            name='correlativo',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='notapedido',
+            name='numero',
+            field=models.CharField(blank=True, editable=False, max_length=12, null=True, unique=True),
+        ),
+        migrations.RunPython(numerar_existentes, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='notapedido',
+            constraint=models.UniqueConstraint(fields=('anio', 'correlativo'), name='nota_anio_correlativo_unico'),
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 5.2.5 on 2026-10-19 04:43
+
+from django.db import migrations, models
+from django.db.models import Case, F, IntegerField, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+
+
+def calcular_stock(apps, schema_editor):
+    """El saldo que antes se anotaba en cada consulta, guardado una vez por producto."""
+    Producto = apps.get_model('gestion', 'Producto')
+    NotaPedidoItem = apps.get_model('gestion', 'NotaPedidoItem')
+    saldo = (
+        NotaPedidoItem.objects
+        .filter(producto_id=OuterRef('pk'))
+        .values('producto_id')
+        .annotate(total=Sum(Case(
+            When(nota__tipo='Entrada', then=F('cantidad')),
+            When(nota__tipo='Salida', then=-F('cantidad')),
+            default=Value(0),
+            output_field=IntegerField(),
+        )))
+        .values('total')
+    )
+    Producto.objects.update(stock=Coalesce(Subquery(saldo, output_field=IntegerField()), Value(0)))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion', '0006_numeracion_notas'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='producto',
+            name='bajo_minimo',
+            field=models.BooleanField(db_index=True, default=False, editable=False),
+        ),
+        migrations.AddField(
+            model_name='producto',
+            name='stock',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='producto',
+            name='stock_minimo',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.RunPython(calcular_stock, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,74 @@
+# Generated by Django 5.2.5 on 2026-10-19 04:46
+
+import django.db.models.deletion
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models import DecimalField, F, OuterRef, Subquery, Sum
+from django.db.models.functions import TruncDate
+
+
+def copiar_precios(apps, schema_editor):
+    """Los items existentes toman el precio actual del producto (no había otro registro)."""
+    Producto = apps.get_model('gestion', 'Producto')
+    NotaPedidoItem = apps.get_model('gestion', 'NotaPedidoItem')
+    NotaPedidoItem.objects.update(precio_unitario=Subquery(
+        Producto.objects.filter(pk=OuterRef('producto_id')).values('precio')[:1]
+    ))
+
+
+def acumular_existentes(apps, schema_editor):
+    NotaPedidoItem = apps.get_model('gestion', 'NotaPedidoItem')
+    MovimientoDiario = apps.get_model('gestion', 'MovimientoDiario')
+    filas = (
+        NotaPedidoItem.objects
+        .annotate(dia=TruncDate('nota__fecha'))
+        .values('dia', 'producto_id', 'nota__tipo', 'nota__proveedor_id', 'nota__cliente_id')
+        .annotate(
+            total=Sum('cantidad'),
+            importe=Sum(F('cantidad') * F('precio_unitario'),
+                        output_field=DecimalField(max_digits=14, decimal_places=2)),
+        )
+        .order_by()
+    )
+    MovimientoDiario.objects.bulk_create([
+        MovimientoDiario(
+            fecha=f['dia'], producto_id=f['producto_id'], tipo=f['nota__tipo'],
+            proveedor_id=f['nota__proveedor_id'], cliente_id=f['nota__cliente_id'],
+            cantidad=f['total'], monto=f['importe'] or Decimal('0'),
+        )
+        for f in filas
+    ], batch_size=2000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion', '0007_stock_guardado'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notapedidoitem',
+            name='precio_unitario',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=10),
+        ),
+        migrations.RunPython(copiar_precios, migrations.RunPython.noop),
+        migrations.CreateModel(
+            name='MovimientoDiario',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField()),
+                ('tipo', models.CharField(choices=[('Entrada', 'Entrada'), ('Salida', 'Salida')], max_length=10)),
+                ('cantidad', models.IntegerField(default=0)),
+                ('monto', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=14)),
+                ('actualizado', models.DateTimeField(auto_now=True, db_index=True)),
+                ('cliente', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='gestion.cliente')),
+                ('producto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='movimientos', to='gestion.producto')),
+                ('proveedor', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='gestion.proveedor')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['fecha', 'tipo'], name='mov_fecha_tipo'), models.Index(fields=['producto', 'fecha'], name='mov_producto_fecha')],
+            },
+        ),
+        migrations.RunPython(acumular_existentes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.5 on 2026-10-19 04:49
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion', '0008_movimientos_diarios'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='proveedor',
+            name='dias_entrega',
+            field=models.PositiveSmallIntegerField(default=7),
+        ),
+        migrations.CreateModel(
+            name='SugerenciaReposicion',
+            fields=[
+                ('producto', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='sugerencia', serialize=False, to='gestion.producto')),
+                ('ventana_dias', models.PositiveSmallIntegerField()),
+                ('demanda_diaria', models.FloatField(default=0)),
+                ('desviacion_diaria', models.FloatField(default=0)),
+                ('stock', models.IntegerField(default=0)),
+                ('punto_reorden', models.PositiveIntegerField(default=0)),
+                ('cantidad_sugerida', models.PositiveIntegerField(default=0)),
+                ('calculado', models.DateTimeField(db_index=True)),
+                ('proveedor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sugerencias', to='gestion.proveedor')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['proveedor', 'cantidad_sugerida'], name='sug_proveedor_cantidad')],
+            },
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.5 on 2026-10-19 04:58
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion', '0011_eventos'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ClaveIdempotencia',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('clave', models.CharField(max_length=64, unique=True)),
+                ('huella', models.CharField(max_length=64)),
+                ('estado', models.PositiveSmallIntegerField(blank=True, null=True)),
+                ('tipo_contenido', models.CharField(blank=True, default='', max_length=100)),
+                ('cuerpo', models.BinaryField(blank=True, default=b'')),
+                ('creada', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+            ],
+        ),
+    ]
@@ -0,0 +1,65 @@
+# Generated by Django 5.2.5 on 2026-10-19 05:12
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def almacen_principal(apps, schema_editor):
+    """Hasta ahora había una sola sede: todas las notas y todo el stock pasan al almacén Principal."""
+    Almacen = apps.get_model('gestion', 'Almacen')
+    NotaPedido = apps.get_model('gestion', 'NotaPedido')
+    Producto = apps.get_model('gestion', 'Producto')
+    StockAlmacen = apps.get_model('gestion', 'StockAlmacen')
+    principal = Almacen.objects.create(nombre='Principal')
+    NotaPedido.objects.update(almacen=principal)
+    saldos = Producto.objects.exclude(stock=0).values_list('id', 'stock')
+    StockAlmacen.objects.bulk_create(
+        (StockAlmacen(almacen=principal, producto_id=pid, stock=stock) for pid, stock in saldos.iterator()),
+        batch_size=2000,
+    )
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion', '0012_idempotencia'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Almacen',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nombre', models.CharField(max_length=200, unique=True)),
+                ('actualizado', models.DateTimeField(auto_now=True, db_index=True)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='notapedido',
+            name='tipo',
+            field=models.CharField(choices=[('Entrada', 'Entrada'), ('Salida', 'Salida'), ('Traslado', 'Traslado')], max_length=10),
+        ),
+        migrations.AddField(
+            model_name='notapedido',
+            name='almacen',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='notas', to='gestion.almacen'),
+        ),
+        migrations.AddField(
+            model_name='notapedido',
+            name='almacen_destino',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='traslados_recibidos', to='gestion.almacen'),
+        ),
+        migrations.CreateModel(
+            name='StockAlmacen',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('stock', models.IntegerField(default=0)),
+                ('actualizado', models.DateTimeField(auto_now=True, db_index=True)),
+                ('almacen', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='saldos', to='gestion.almacen')),
+                ('producto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='saldos', to='gestion.producto')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('almacen', 'producto'), name='stock_almacen_producto_unico')],
+            },
+        ),
+        migrations.RunPython(almacen_principal, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,70 @@
+# Generated by Django 5.2.5 on 2026-10-19 05:16
+
+import django.db.models.deletion
+import django.utils.timezone
+from decimal import Decimal
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion', '0013_almacenes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Cierre',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha_corte', models.DateField(unique=True)),
+                ('creado', models.DateTimeField(default=django.utils.timezone.now)),
+                ('notas', models.PositiveIntegerField(default=0)),
+                ('items', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='NotaArchivada',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('numero', models.CharField(blank=True, db_index=True, max_length=12, null=True)),
+                ('fecha', models.DateTimeField(db_index=True)),
+                ('tipo', models.CharField(choices=[('Entrada', 'Entrada'), ('Salida', 'Salida'), ('Traslado', 'Traslado')], max_length=10)),
+                ('proveedor_id', models.BigIntegerField(blank=True, null=True)),
+                ('proveedor_nombre', models.CharField(blank=True, default='', max_length=200)),
+                ('cliente_id', models.BigIntegerField(blank=True, null=True)),
+                ('cliente_nombre', models.CharField(blank=True, default='', max_length=200)),
+                ('almacen_id', models.BigIntegerField(blank=True, null=True)),
+                ('almacen_nombre', models.CharField(blank=True, default='', max_length=200)),
+                ('almacen_destino_id', models.BigIntegerField(blank=True, null=True)),
+                ('almacen_destino_nombre', models.CharField(blank=True, default='', max_length=200)),
+                ('orden_compra', models.CharField(blank=True, max_length=100, null=True)),
+                ('cierre', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='notas_archivadas', to='gestion.cierre')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='NotaArchivadaItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('producto_id', models.BigIntegerField(db_index=True)),
+                ('producto_nombre', models.CharField(max_length=200)),
+                ('producto_codigo', models.CharField(blank=True, max_length=50, null=True)),
+                ('cantidad', models.PositiveIntegerField()),
+                ('precio_unitario', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=10)),
+                ('nota', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='items', to='gestion.notaarchivada')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='SaldoInicial',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('stock', models.IntegerField()),
+                ('almacen', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, to='gestion.almacen')),
+                ('cierre', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='saldos', to='gestion.cierre')),
+                ('producto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='saldos_iniciales', to='gestion.producto')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('cierre', 'almacen', 'producto'), name='saldo_inicial_unico')],
+            },
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.5 on 2026-10-19 05:21
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion', '0014_cierres'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EventoSalida',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(max_length=30)),
+                ('datos', models.JSONField(default=dict)),
+                ('creado', models.DateTimeField(default=django.utils.timezone.now)),
+                ('entregado', models.DateTimeField(blank=True, null=True)),
+                ('intentos', models.PositiveIntegerField(default=0)),
+                ('ultimo_error', models.TextField(blank=True, default='')),
+            ],
+            options={
+                'indexes': [models.Index(condition=models.Q(('entregado__isnull', True)), fields=['id'], name='outbox_pendientes'), models.Index(fields=['entregado'], name='outbox_entregados')],
+            },
+        ),
+    ]
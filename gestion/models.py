@@ -1,5 +1,6 @@
 from decimal import Decimal
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.db.models import Case, F, Value, When
 from django.utils import timezone
 
 # ---------- Catálogo de unidades ----------
@@ -30,6 +31,9 @@ UNIDAD_CHOICES = [
 
 class Proveedor(models.Model):
     nombre = models.CharField(max_length=200, unique=True)
+    # Tiempo de reposición (días desde el pedido hasta la entrada); lo usa reposicion.py
+    dias_entrega = models.PositiveSmallIntegerField(default=7)
+    actualizado = models.DateTimeField(auto_now=True, db_index=True)
 
     def __str__(self):
         return self.nombre
@@ -37,11 +41,34 @@ class Proveedor(models.Model):
 
 class Cliente(models.Model):
     nombre = models.CharField(max_length=200, unique=True)
+    actualizado = models.DateTimeField(auto_now=True, db_index=True)
 
     def __str__(self):
         return self.nombre
 
 
+class Almacen(models.Model):
+    """Sede o depósito. Cada nota mueve el stock de un almacén (un traslado, de uno a otro)."""
+    nombre = models.CharField(max_length=200, unique=True)
+    actualizado = models.DateTimeField(auto_now=True, db_index=True)
+
+    @classmethod
+    def principal(cls):
+        """Almacén de las notas que no indican uno: el primero creado."""
+        return cls.objects.order_by("id").first()
+
+    def __str__(self):
+        return self.nombre
+
+
+def expresion_bajo_minimo():
+    """bajo_minimo calculado en la BD a partir de stock y stock_minimo."""
+    return Case(
+        When(stock_minimo__isnull=False, stock__lte=F("stock_minimo"), then=Value(True)),
+        default=Value(False),
+    )
+
+
 class Producto(models.Model):
     nombre = models.CharField(max_length=200)
     codigo = models.CharField(max_length=50, unique=True, blank=True, null=True)
@@ -62,7 +89,30 @@ class Producto(models.Model):
     peso = models.DecimalField(max_digits=10, decimal_places=2, default=Decimal("0.00"))
     proveedor = models.ForeignKey(Proveedor, on_delete=models.CASCADE, related_name="productos")
 
+    # Saldo actual (Entradas - Salidas). Lo mantiene gestion.inventario en cada nota;
+    # save() nunca lo escribe para no pisar movimientos concurrentes.
+    stock = models.IntegerField(default=0, editable=False)
+    # Umbral de reposición: alerta cuando stock <= stock_minimo (vacío = sin alerta)
+    stock_minimo = models.PositiveIntegerField(null=True, blank=True)
+    bajo_minimo = models.BooleanField(default=False, db_index=True, editable=False)
+    # Última modificación, incluidos los cambios de stock (inventario.py la fija a mano en sus UPDATE)
+    actualizado = models.DateTimeField(auto_now=True, db_index=True)
+
     def save(self, *args, **kwargs):
+        self._asignar_codigo()
+        if self.pk is not None and not self._state.adding and kwargs.get("update_fields") is None:
+            kwargs["update_fields"] = [
+                f.name for f in self._meta.concrete_fields
+                if not f.primary_key and f.name not in ("stock", "bajo_minimo")
+            ]
+            super().save(*args, **kwargs)
+            Producto.objects.filter(pk=self.pk).update(bajo_minimo=expresion_bajo_minimo())
+            return
+        if self._state.adding:
+            self.bajo_minimo = self.stock_minimo is not None and self.stock <= self.stock_minimo
+        super().save(*args, **kwargs)
+
+    def _asignar_codigo(self):
         if not self.codigo:
             prefijo = "F1" if self.adquisicion == "Fabricacion" else "M1"
             base = (self.nombre or "").upper()
@@ -72,23 +122,72 @@ class Producto(models.Model):
             ).count() + 1
             correlativo = str(count).zfill(3)
             self.codigo = f"{prefijo}{abreviatura}{correlativo}"
-        super().save(*args, **kwargs)
 
     def __str__(self):
         return f"{self.nombre} ({self.codigo or 'S/C'})"
 
 
+class SecuenciaNota(models.Model):
+    """Último correlativo emitido por año (N{anio}_{0001})."""
+    anio = models.PositiveSmallIntegerField(primary_key=True)
+    ultimo = models.PositiveIntegerField(default=0)
+
+    @classmethod
+    def siguiente(cls, anio):
+        """Reserva el siguiente correlativo del año. Debe llamarse dentro de una transacción."""
+        # El UPDATE bloquea la fila (o la BD en SQLite) hasta el commit: dos notas
+        # simultáneas nunca reciben el mismo número.
+        if not cls.objects.filter(anio=anio).update(ultimo=F("ultimo") + 1):
+            try:
+                with transaction.atomic():
+                    cls.objects.create(anio=anio, ultimo=1)
+            except IntegrityError:
+                cls.objects.filter(anio=anio).update(ultimo=F("ultimo") + 1)
+        return cls.objects.get(anio=anio).ultimo
+
+
+def formatear_numero(anio, correlativo):
+    return f"N{anio}_{str(correlativo).zfill(4)}"
+
+
 class NotaPedido(models.Model):
     TIPO_CHOICES = [
         ("Entrada", "Entrada"),
         ("Salida", "Salida"),
+        ("Traslado", "Traslado"),
     ]
     fecha = models.DateTimeField(default=timezone.now)
     tipo = models.CharField(max_length=10, choices=TIPO_CHOICES)
     proveedor = models.ForeignKey(Proveedor, on_delete=models.SET_NULL, null=True, blank=True)
     cliente = models.ForeignKey(Cliente, on_delete=models.SET_NULL, null=True, blank=True)
+    # Dónde entra o sale la mercadería; en un Traslado, el almacén de origen
+    almacen = models.ForeignKey(Almacen, on_delete=models.PROTECT, null=True, blank=True, related_name="notas")
+    # Solo en Traslado: el stock pasa de `almacen` a este (el total no cambia)
+    almacen_destino = models.ForeignKey(Almacen, on_delete=models.PROTECT, null=True, blank=True,
+                                        related_name="traslados_recibidos")
     orden_compra = models.CharField(max_length=100, blank=True, null=True)
 
+    # Numeración por año asignada al crear (no cambia si luego se edita la fecha)
+    anio = models.PositiveSmallIntegerField(null=True, blank=True, editable=False)
+    correlativo = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    numero = models.CharField(max_length=12, unique=True, null=True, blank=True, editable=False)
+    actualizado = models.DateTimeField(auto_now=True, db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["anio", "correlativo"], name="nota_anio_correlativo_unico"),
+        ]
+
+    def save(self, *args, **kwargs):
+        if self.numero is None:
+            with transaction.atomic():
+                self.anio = timezone.localtime(self.fecha).year
+                self.correlativo = SecuenciaNota.siguiente(self.anio)
+                self.numero = formatear_numero(self.anio, self.correlativo)
+                super().save(*args, **kwargs)
+            return
+        super().save(*args, **kwargs)
+
     def __str__(self):
         return f"{self.tipo} - {self.fecha.strftime('%d/%m/%Y')}"
 
@@ -97,10 +196,228 @@ class NotaPedidoItem(models.Model):
     nota = models.ForeignKey(NotaPedido, on_delete=models.CASCADE, related_name="items")
     producto = models.ForeignKey(Producto, on_delete=models.CASCADE)
     cantidad = models.PositiveIntegerField()
+    # Precio del producto al registrar la nota: los montos históricos no cambian con el catálogo
+    precio_unitario = models.DecimalField(max_digits=10, decimal_places=2, default=Decimal("0.00"))
 
     @property
     def subtotal(self):
-        return self.cantidad * self.producto.precio
+        return self.cantidad * self.precio_unitario
 
     def __str__(self):
         return f"{self.producto.nombre} x {self.cantidad}"
+
+
+class StockAlmacen(models.Model):
+    """
+    Saldo de un producto en un almacén. Lo mantiene gestion.inventario junto con
+    Producto.stock, que sigue siendo el total de todas las sedes; el índice único
+    (almacen, producto) hace que el stock de una sede cueste lo mismo que el global.
+    """
+    almacen = models.ForeignKey(Almacen, on_delete=models.CASCADE, related_name="saldos")
+    producto = models.ForeignKey(Producto, on_delete=models.CASCADE, related_name="saldos")
+    stock = models.IntegerField(default=0)
+    actualizado = models.DateTimeField(auto_now=True, db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["almacen", "producto"], name="stock_almacen_producto_unico"),
+        ]
+
+    def __str__(self):
+        return f"{self.almacen_id}/{self.producto_id}: {self.stock}"
+
+
+class Cierre(models.Model):
+    """
+    Cierre de periodo (comando cierre_anual): las notas anteriores a fecha_corte
+    pasan a NotaArchivada y su efecto en el stock queda en SaldoInicial.
+    """
+    fecha_corte = models.DateField(unique=True)
+    creado = models.DateTimeField(default=timezone.now)
+    notas = models.PositiveIntegerField(default=0)
+    items = models.PositiveIntegerField(default=0)
+
+    @classmethod
+    def ultimo(cls):
+        return cls.objects.order_by("-fecha_corte").first()
+
+    def __str__(self):
+        return f"Cierre al {self.fecha_corte:%d/%m/%Y}"
+
+
+class SaldoInicial(models.Model):
+    """
+    Stock de cada producto por almacén al comenzar fecha_corte. Incluye los
+    cierres anteriores: el stock actual es el saldo del último cierre más las
+    notas vigentes (ver inventario.recalcular).
+    """
+    cierre = models.ForeignKey(Cierre, on_delete=models.CASCADE, related_name="saldos")
+    almacen = models.ForeignKey(Almacen, on_delete=models.PROTECT, null=True, blank=True)  # null: notas sin almacén
+    producto = models.ForeignKey(Producto, on_delete=models.CASCADE, related_name="saldos_iniciales")
+    stock = models.IntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["cierre", "almacen", "producto"], name="saldo_inicial_unico"),
+        ]
+
+    def __str__(self):
+        return f"{self.cierre_id} {self.almacen_id}/{self.producto_id}: {self.stock}"
+
+
+class NotaArchivada(models.Model):
+    """
+    Nota sacada de NotaPedido por un cierre, de solo lectura (/api/archivo/notas/).
+    Conserva el id original y guarda los nombres en lugar de referencias: sigue
+    legible aunque después se borren productos, proveedores o clientes.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    cierre = models.ForeignKey(Cierre, on_delete=models.PROTECT, related_name="notas_archivadas")
+    numero = models.CharField(max_length=12, null=True, blank=True, db_index=True)
+    fecha = models.DateTimeField(db_index=True)
+    tipo = models.CharField(max_length=10, choices=NotaPedido.TIPO_CHOICES)
+    proveedor_id = models.BigIntegerField(null=True, blank=True)
+    proveedor_nombre = models.CharField(max_length=200, blank=True, default="")
+    cliente_id = models.BigIntegerField(null=True, blank=True)
+    cliente_nombre = models.CharField(max_length=200, blank=True, default="")
+    almacen_id = models.BigIntegerField(null=True, blank=True)
+    almacen_nombre = models.CharField(max_length=200, blank=True, default="")
+    almacen_destino_id = models.BigIntegerField(null=True, blank=True)
+    almacen_destino_nombre = models.CharField(max_length=200, blank=True, default="")
+    orden_compra = models.CharField(max_length=100, blank=True, null=True)
+
+    def __str__(self):
+        return f"{self.numero or self.id} (archivada)"
+
+
+class NotaArchivadaItem(models.Model):
+    nota = models.ForeignKey(NotaArchivada, on_delete=models.CASCADE, related_name="items")
+    producto_id = models.BigIntegerField(db_index=True)
+    producto_nombre = models.CharField(max_length=200)
+    producto_codigo = models.CharField(max_length=50, blank=True, null=True)
+    cantidad = models.PositiveIntegerField()
+    precio_unitario = models.DecimalField(max_digits=10, decimal_places=2, default=Decimal("0.00"))
+
+    def __str__(self):
+        return f"{self.producto_nombre} x {self.cantidad}"
+
+
+class MovimientoDiario(models.Model):
+    """
+    Acumulado por día, producto, tipo y contraparte (proveedor o cliente).
+    Lo mantiene gestion.analitica en cada nota; se reconstruye con el comando
+    reconstruir_movimientos. Puede haber filas repetidas para la misma clave
+    (altas concurrentes): las consultas siempre suman.
+    """
+    fecha = models.DateField()
+    producto = models.ForeignKey(Producto, on_delete=models.CASCADE, related_name="movimientos")
+    tipo = models.CharField(max_length=10, choices=NotaPedido.TIPO_CHOICES[:2])  # los traslados no se acumulan
+    proveedor = models.ForeignKey(Proveedor, on_delete=models.SET_NULL, null=True, blank=True)
+    cliente = models.ForeignKey(Cliente, on_delete=models.SET_NULL, null=True, blank=True)
+    cantidad = models.IntegerField(default=0)
+    monto = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal("0.00"))
+    actualizado = models.DateTimeField(auto_now=True, db_index=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["fecha", "tipo"], name="mov_fecha_tipo"),
+            models.Index(fields=["producto", "fecha"], name="mov_producto_fecha"),
+        ]
+
+    def __str__(self):
+        return f"{self.fecha} {self.tipo} {self.producto_id} x {self.cantidad}"
+
+
+class SugerenciaReposicion(models.Model):
+    """
+    Demanda y punto de reorden precalculados por producto (comando calcular_reposicion).
+    La planificación de compras lee esta tabla en lugar del historial de salidas.
+    """
+    producto = models.OneToOneField(Producto, on_delete=models.CASCADE, primary_key=True,
+                                    related_name="sugerencia")
+    proveedor = models.ForeignKey(Proveedor, on_delete=models.CASCADE, related_name="sugerencias")
+    ventana_dias = models.PositiveSmallIntegerField()
+    demanda_diaria = models.FloatField(default=0)
+    desviacion_diaria = models.FloatField(default=0)
+    stock = models.IntegerField(default=0)
+    punto_reorden = models.PositiveIntegerField(default=0)
+    cantidad_sugerida = models.PositiveIntegerField(default=0)
+    calculado = models.DateTimeField(db_index=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["proveedor", "cantidad_sugerida"], name="sug_proveedor_cantidad"),
+        ]
+
+    def __str__(self):
+        return f"{self.producto_id}: reorden {self.punto_reorden}, pedir {self.cantidad_sugerida}"
+
+
+class Eliminacion(models.Model):
+    """
+    Registro de borrados (tombstones) para /api/sync/: los clientes que
+    sincronizan por diferencias necesitan saber qué ids quitar. Lo escriben las
+    señales post_delete; se depura pasados SYNC_RETENCION_DIAS.
+    """
+    MODELOS = [
+        ("producto", "Producto"),
+        ("proveedor", "Proveedor"),
+        ("cliente", "Cliente"),
+        ("nota", "Nota de pedido"),
+    ]
+    modelo = models.CharField(max_length=10, choices=MODELOS)
+    objeto_id = models.BigIntegerField()
+    fecha = models.DateTimeField(default=timezone.now, db_index=True)
+
+    def __str__(self):
+        return f"{self.modelo} {self.objeto_id} eliminado {self.fecha:%d/%m/%Y %H:%M}"
+
+
+class Evento(models.Model):
+    """Eventos en vivo guardados para repartirlos entre workers (EVENTOS_BACKEND = "bd")."""
+    tipo = models.CharField(max_length=30)
+    datos = models.JSONField(default=dict)
+    creado = models.DateTimeField(default=timezone.now, db_index=True)
+
+    def __str__(self):
+        return f"{self.id} {self.tipo}"
+
+
+class EventoSalida(models.Model):
+    """
+    Outbox hacia sistemas externos (ERP): se escribe en la misma transacción que
+    la nota y lo entrega en orden de id el comando despachar_outbox (ver gestion/outbox.py).
+    """
+    tipo = models.CharField(max_length=30)
+    datos = models.JSONField(default=dict)
+    creado = models.DateTimeField(default=timezone.now)
+    entregado = models.DateTimeField(null=True, blank=True)
+    intentos = models.PositiveIntegerField(default=0)
+    ultimo_error = models.TextField(blank=True, default="")
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["id"], condition=models.Q(entregado__isnull=True), name="outbox_pendientes"),
+            models.Index(fields=["entregado"], name="outbox_entregados"),
+        ]
+
+    def __str__(self):
+        return f"{self.id} {self.tipo}"
+
+
+class ClaveIdempotencia(models.Model):
+    """
+    Respuesta guardada por Idempotency-Key (ver gestion.idempotencia): un
+    reintento con la misma clave recibe la respuesta original sin repetir la
+    escritura. Se guarda el hash de ruta + clave, no la clave, y se depura
+    pasadas IDEMPOTENCIA_TTL_HORAS.
+    """
+    clave = models.CharField(max_length=64, unique=True)
+    huella = models.CharField(max_length=64)  # hash del método y el cuerpo
+    estado = models.PositiveSmallIntegerField(null=True, blank=True)
+    tipo_contenido = models.CharField(max_length=100, blank=True, default="")
+    cuerpo = models.BinaryField(blank=True, default=b"")
+    creada = models.DateTimeField(default=timezone.now, db_index=True)
+
+    def __str__(self):
+        return f"{self.clave[:12]}… {self.estado or 'en curso'}"
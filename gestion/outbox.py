@@ -0,0 +1,202 @@
+"""
+Outbox transaccional hacia sistemas externos (el ERP), en lugar de que lean
+/api/notas/ completo cada tanto.
+
+Las vistas que crean, editan o eliminan notas agregan un EventoSalida en la
+misma transacción que la nota: si la escritura se deshace, el evento también, y
+si se confirma, el evento queda guardado aunque el ERP no responda. Al request
+le cuesta un INSERT; el envío lo hace otro proceso (comando despachar_outbox):
+
+    nota_creada      {"id", "numero", "fecha", "tipo", "proveedor", "cliente",
+    nota_modificada   "almacen", "almacen_destino", "orden_compra",
+                      "items": [{"producto", "cantidad", "precio_unitario"}]}
+    nota_eliminada   {"id", "numero"}
+
+El despachador toma los pendientes por id, de a OUTBOX_LOTE, y los manda en un
+POST a OUTBOX_URL:
+
+    {"eventos": [{"id", "tipo", "creado", "datos"}, ...]}
+
+Solo con una respuesta 2xx se marcan entregados. Si falla, el mismo lote se
+reintenta con espera exponencial (OUTBOX_REINTENTO_BASE, duplicándose hasta
+OUTBOX_REINTENTO_MAX) y nada posterior sale antes: la entrega es al menos una
+vez y en orden de id. El receptor debe ignorar los ids que ya procesó (un lote
+puede llegar dos veces si la respuesta se pierde). Debe correr un solo despachador.
+
+El orden de id es el orden de confirmación solo porque SQLite tiene un único
+escritor: nadie confirma un id menor después de que se despachó uno mayor. Con
+PostgreSQL o MySQL eso sí puede pasar (el evento llegaría desordenado, o después
+de la marca de un receptor que guarda el último id), así que antes de cambiar de
+motor el despachador tendría que esperar los huecos de id o usar una secuencia
+asignada al confirmar. correr() lo advierte en el log si la BD no es SQLite.
+
+Sin OUTBOX_URL no se registran eventos.
+"""
+import json
+import logging
+import random
+import threading
+import time
+import urllib.error
+import urllib.request
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import F
+from django.utils import timezone
+
+from .models import EventoSalida
+
+logger = logging.getLogger("gestion.outbox")
+
+
+class ErrorEntrega(Exception):
+    pass
+
+
+def activo():
+    return bool(getattr(settings, "OUTBOX_URL", ""))
+
+
+# ---------- escritura (dentro de la transacción de la vista) ----------
+def _datos_nota(nota, items):
+    return {
+        "id": nota.id,
+        "numero": nota.numero,
+        "fecha": nota.fecha.isoformat(),
+        "tipo": nota.tipo,
+        "proveedor": nota.proveedor_id,
+        "cliente": nota.cliente_id,
+        "almacen": nota.almacen_id,
+        "almacen_destino": nota.almacen_destino_id,
+        "orden_compra": nota.orden_compra,
+        "items": [
+            {"producto": producto_id, "cantidad": cantidad, "precio_unitario": float(precio)}
+            for producto_id, cantidad, precio in items
+        ],
+    }
+
+
+def nota_guardada(nota, items=None, creada=False):
+    """
+    Registra nota_creada / nota_modificada. items: (producto_id, cantidad, precio)
+    de la nota; si no vienen se leen (una consulta).
+    """
+    if not activo():
+        return
+    if items is None:
+        items = nota.items.order_by("id").values_list("producto_id", "cantidad", "precio_unitario")
+    EventoSalida.objects.create(
+        tipo="nota_creada" if creada else "nota_modificada",
+        datos=_datos_nota(nota, items),
+    )
+
+
+def notas_eliminadas(notas):
+    """Registra nota_eliminada de cada (id, numero), con un INSERT."""
+    if not activo():
+        return
+    EventoSalida.objects.bulk_create([
+        EventoSalida(tipo="nota_eliminada", datos={"id": nota_id, "numero": numero})
+        for nota_id, numero in notas
+    ])
+
+
+# ---------- entrega (comando despachar_outbox) ----------
+def pendientes(limite=None):
+    limite = limite or getattr(settings, "OUTBOX_LOTE", 100)
+    return list(EventoSalida.objects.filter(entregado__isnull=True).order_by("id")[:limite])
+
+
+def enviar(eventos):
+    """POST del lote a OUTBOX_URL; ErrorEntrega si no responde 2xx."""
+    cuerpo = json.dumps({"eventos": [
+        {"id": e.id, "tipo": e.tipo, "creado": e.creado.isoformat(), "datos": e.datos} for e in eventos
+    ]}, ensure_ascii=False).encode()
+    pedido = urllib.request.Request(settings.OUTBOX_URL, data=cuerpo, method="POST",
+                                    headers={"Content-Type": "application/json"})
+    token = getattr(settings, "OUTBOX_TOKEN", "")
+    if token:
+        pedido.add_header("Authorization", f"Bearer {token}")
+    try:
+        with urllib.request.urlopen(pedido, timeout=getattr(settings, "OUTBOX_TIMEOUT", 10)) as respuesta:
+            respuesta.read()
+    except urllib.error.HTTPError as e:
+        raise ErrorEntrega(f"HTTP {e.code}: {e.read()[:200].decode(errors='replace')}") from e
+    except (urllib.error.URLError, OSError) as e:
+        raise ErrorEntrega(str(getattr(e, "reason", e))) from e
+
+
+def despachar_lote():
+    """Envía el próximo lote. Devuelve cuántos entregó; ErrorEntrega si falló (queda pendiente)."""
+    eventos = pendientes()
+    if not eventos:
+        return 0
+    ids = [e.id for e in eventos]
+    try:
+        enviar(eventos)
+    except ErrorEntrega as e:
+        EventoSalida.objects.filter(id__in=ids).update(intentos=F("intentos") + 1, ultimo_error=str(e)[:1000])
+        raise
+    EventoSalida.objects.filter(id__in=ids).update(entregado=timezone.now(), intentos=F("intentos") + 1)
+    return len(ids)
+
+
+def espera_reintento(fallos):
+    base = getattr(settings, "OUTBOX_REINTENTO_BASE", 1.0)
+    tope = getattr(settings, "OUTBOX_REINTENTO_MAX", 300.0)
+    espera = min(tope, base * 2 ** (fallos - 1))
+    return espera * random.uniform(0.8, 1.2)
+
+
+def correr(detener=None, hasta_vaciar=False):
+    """
+    Bucle del despachador: envía mientras haya pendientes y luego consulta cada
+    OUTBOX_INTERVALO segundos. Con hasta_vaciar vuelve cuando no queda nada.
+    Devuelve cuántos eventos entregó.
+    """
+    if connection.vendor != "sqlite":
+        logger.warning("Outbox: con %s el orden por id no garantiza el orden de confirmación (ver outbox.py)",
+                       connection.vendor)
+    detener = detener or threading.Event()
+    intervalo = getattr(settings, "OUTBOX_INTERVALO", 1.0)
+    fallos = entregados = 0
+    depurado = 0.0
+    while not detener.is_set():
+        try:
+            enviados = despachar_lote()
+        except ErrorEntrega as e:
+            fallos += 1
+            espera = espera_reintento(fallos)
+            logger.warning("Outbox: falló el envío (%s intentos seguidos): %s; reintento en %.1f s", fallos, e, espera)
+            detener.wait(espera)
+            continue
+        fallos = 0
+        entregados += enviados
+        if enviados:
+            continue
+        if hasta_vaciar:
+            break
+        if time.monotonic() - depurado > 3600:
+            depurar()
+            depurado = time.monotonic()
+        detener.wait(intervalo)
+    return entregados
+
+
+def depurar(dias=None):
+    """Borra los eventos entregados hace más de OUTBOX_RETENCION_DIAS."""
+    dias = dias or getattr(settings, "OUTBOX_RETENCION_DIAS", 7)
+    return EventoSalida.objects.filter(entregado__lt=timezone.now() - timedelta(days=dias)).delete()[0]
+
+
+def estado():
+    """Pendientes y el error del más antiguo, para el comando y el monitoreo."""
+    primero = EventoSalida.objects.filter(entregado__isnull=True).order_by("id").first()
+    return {
+        "pendientes": EventoSalida.objects.filter(entregado__isnull=True).count(),
+        "mas_antiguo": primero.creado.isoformat() if primero else None,
+        "intentos": primero.intentos if primero else 0,
+        "ultimo_error": primero.ultimo_error if primero else "",
+    }
@@ -0,0 +1,263 @@
+"""
+Perfil de consultas SQL: qué consultas de qué vista cuestan más.
+
+Cada conexión nueva recibe un execute_wrapper (instalar(), desde apps.py) que
+mide cada sentencia y la agrupa por su huella: el SQL con los literales y las
+listas IN/VALUES colapsados, así "WHERE id IN (%s, %s)" y el mismo filtro con
+500 ids cuentan como la misma consulta. Por huella y vista (la pone
+PerfilSqlMiddleware) se acumulan cantidad, tiempo total y máximo.
+
+Las sentencias que pasan SQL_LENTA_MS se registran en el logger "gestion.sql"
+y como línea JSON en SQL_LENTAS_ARCHIVO, junto con su plan (EXPLAIN) si son
+SELECT.
+
+Los acumulados viven en memoria y cada SQL_PERFIL_VOLCADO segundos se copian al
+cache compartido (una clave por proceso), así la página /diagnostico/sql/ y el
+comando consultas_lentas ven lo de todos los workers.
+
+Medir cada consulta tiene su costo (regex, lock, volcados, EXPLAIN de las
+lentas), así que está apagado por defecto: SQL_PERFIL=1 lo activa, por ejemplo
+mientras se investiga una vista lenta. El perfilador a pedido (perfilador.py)
+captura las consultas de su request aunque esté apagado.
+"""
+import json
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import lru_cache
+from hashlib import sha1
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.db.backends.signals import connection_created
+from django.utils import timezone
+
+logger = logging.getLogger("gestion.sql")
+
+MAXIMO_HUELLAS = 2000
+_CLAVE_PROCESOS = "sql:perfil:procesos"
+_PROCESO = f"sql:perfil:{os.getpid()}-{uuid.uuid4().hex[:8]}"
+_lock_archivo = threading.Lock()
+
+_vista = ContextVar("perfil_sql_vista", default=None)
+_interno = ContextVar("perfil_sql_interno", default=False)  # EXPLAIN y volcados no se miden
+_consultas = ContextVar("perfil_sql_consultas", default=None)  # lista del request perfilado (perfilador.py)
+
+_RE_CADENA = re.compile(r"'(?:[^']|'')*'")
+_RE_NUMERO = re.compile(r"(?<![\w\"])-?\d+(?:\.\d+)?\b")
+_RE_LISTA = re.compile(r"\(\s*(?:%s|\?)(?:\s*,\s*(?:%s|\?))*\s*\)")
+_RE_FILAS = re.compile(r"(\(\.\.\.\))(?:\s*,\s*\(\.\.\.\))+")
+_P = r"(?:%s|\?)"  # parámetro (execute_wrapper) o literal ya reemplazado (connection.queries)
+_RE_CASOS = re.compile(  # CASE WHEN id = ? THEN ? ... de bulk_update y de los UPDATE de stock
+    rf"(WHEN \([^()]*\) THEN (?:{_P}|\(CAST\({_P} AS \w+\)\)))(?:\s+WHEN \([^()]*\) THEN (?:{_P}|\(CAST\({_P} AS \w+\)\)))+"
+)
+_RE_SAVEPOINT = re.compile(r'(SAVEPOINT )"[^"]*"')
+_RE_ESPACIOS = re.compile(r"\s+")
+
+
+@lru_cache(maxsize=4096)
+def huella(sql):
+    """(id corto, SQL normalizado) de una sentencia."""
+    normal = _RE_CADENA.sub("?", sql)
+    normal = _RE_NUMERO.sub("?", normal)
+    normal = _RE_LISTA.sub("(...)", normal)
+    normal = _RE_FILAS.sub(r"\1", normal)   # VALUES (...), (...), ... de bulk_create
+    normal = _RE_CASOS.sub(r"\1 ...", normal)
+    normal = _RE_SAVEPOINT.sub(r'\1"?"', normal)
+    normal = _RE_ESPACIOS.sub(" ", normal).strip()
+    return sha1(normal.encode()).hexdigest()[:12], normal
+
+
+class Acumulado:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._datos = {}   # (huella, vista) -> [cantidad, total_ms, max_ms, sql]
+        self._volcado = time.monotonic()
+
+    def sumar(self, id_huella, sql, vista, ms):
+        with self._lock:
+            fila = self._datos.get((id_huella, vista))
+            if fila is None:
+                if len(self._datos) >= MAXIMO_HUELLAS:
+                    self._recortar()
+                fila = self._datos[(id_huella, vista)] = [0, 0.0, 0.0, sql]
+            fila[0] += 1
+            fila[1] += ms
+            fila[2] = max(fila[2], ms)
+            volcar = time.monotonic() - self._volcado >= getattr(settings, "SQL_PERFIL_VOLCADO", 30)
+            if volcar:
+                self._volcado = time.monotonic()
+        if volcar:
+            self.volcar()
+
+    def _recortar(self):
+        # se quedan las huellas que más tiempo acumulan
+        orden = sorted(self._datos.items(), key=lambda kv: kv[1][1], reverse=True)
+        self._datos = dict(orden[: MAXIMO_HUELLAS // 2])
+
+    def filas(self):
+        with self._lock:
+            return [[h, v, *fila] for (h, v), fila in self._datos.items()]
+
+    def volcar(self):
+        token = _interno.set(True)
+        try:
+            cache.set(_PROCESO, self.filas(), 86400)
+            procesos = cache.get(_CLAVE_PROCESOS) or []
+            if _PROCESO not in procesos:
+                cache.set(_CLAVE_PROCESOS, procesos[-50:] + [_PROCESO], None)
+        except Exception:
+            logger.exception("No se pudo volcar el perfil SQL al cache")
+        finally:
+            _interno.reset(token)
+
+    def reiniciar(self):
+        with self._lock:
+            self._datos = {}
+
+
+acumulado = Acumulado()
+
+
+@contextmanager
+def vista_actual(nombre):
+    token = _vista.set(nombre)
+    try:
+        yield
+    finally:
+        _vista.reset(token)
+
+
+@contextmanager
+def registrar_consultas():
+    """Junta en una lista (ms, huella, sql) las consultas del contexto actual."""
+    consultas = []
+    token = _consultas.set(consultas)
+    try:
+        yield consultas
+    finally:
+        _consultas.reset(token)
+
+
+@contextmanager
+def capturando():
+    """
+    capturar en la conexión del hilo actual mientras dure, si SQL_PERFIL no lo
+    instaló ya: así el request perfilado (perfilador.py) tiene sus consultas
+    aunque el perfil SQL esté apagado.
+    """
+    if capturar in connection.execute_wrappers:
+        yield
+        return
+    with connection.execute_wrapper(capturar):
+        yield
+
+
+def capturar(execute, sql, params, many, context):
+    """execute_wrapper: mide, acumula y registra las lentas."""
+    if _interno.get():
+        return execute(sql, params, many, context)
+    inicio = time.perf_counter()
+    fallo = False
+    try:
+        return execute(sql, params, many, context)
+    except Exception:
+        fallo = True
+        raise
+    finally:
+        ms = (time.perf_counter() - inicio) * 1000
+        id_huella, normal = huella(sql)
+        vista = _vista.get() or "-"
+        acumulado.sumar(id_huella, normal, vista, ms)
+        registro = _consultas.get()
+        if registro is not None:
+            registro.append((ms, id_huella, sql))
+        if ms >= getattr(settings, "SQL_LENTA_MS", 200):
+            plan = None if (fallo or many) else _explicar(context["connection"], sql, params)
+            _registrar_lenta(id_huella, vista, ms, sql, params, plan)
+
+
+def _explicar(conexion, sql, params):
+    if not sql.lstrip().upper().startswith(("SELECT", "WITH")):
+        return None
+    prefijo = "EXPLAIN QUERY PLAN " if conexion.vendor == "sqlite" else "EXPLAIN "
+    token = _interno.set(True)
+    try:
+        # cursor aparte: el de la consulta original todavía tiene filas por leer
+        with conexion.cursor() as cursor:
+            cursor.execute(prefijo + sql, params)
+            return [" ".join(str(c) for c in fila) for fila in cursor.fetchall()]
+    except Exception as e:
+        return [f"(sin plan: {e})"]
+    finally:
+        _interno.reset(token)
+
+
+def _registrar_lenta(id_huella, vista, ms, sql, params, plan):
+    registro = {
+        "fecha": timezone.now().isoformat(),
+        "vista": vista,
+        "huella": id_huella,
+        "ms": round(ms, 1),
+        "sql": sql[:4000],
+        "params": repr(params)[:500],
+        "plan": plan,
+    }
+    logger.warning("SQL lenta %.1f ms en %s [%s]: %s", ms, vista, id_huella, sql[:300])
+    archivo = getattr(settings, "SQL_LENTAS_ARCHIVO", "")
+    if archivo:
+        with _lock_archivo, open(archivo, "a", encoding="utf-8") as f:
+            f.write(json.dumps(registro, ensure_ascii=False) + "\n")
+
+
+def _al_conectar(sender, connection, **kwargs):
+    if capturar not in connection.execute_wrappers:
+        connection.execute_wrappers.append(capturar)
+
+
+def instalar():
+    if getattr(settings, "SQL_PERFIL", False):
+        connection_created.connect(_al_conectar, dispatch_uid="gestion.perfil_sql")
+
+
+# ---------- lectura (página y comando) ----------
+def top(n=20, orden="total", vista=None):
+    """Huellas más costosas sumando todos los procesos que volcaron al cache."""
+    acumulado.volcar()
+    procesos = cache.get(_CLAVE_PROCESOS) or []
+    totales = {}
+    for filas in cache.get_many(procesos).values():
+        for id_huella, v, cantidad, total, maximo, sql in filas:
+            if vista and v != vista:
+                continue
+            t = totales.setdefault((id_huella, v), {"huella": id_huella, "vista": v, "sql": sql,
+                                                    "cantidad": 0, "total_ms": 0.0, "max_ms": 0.0})
+            t["cantidad"] += cantidad
+            t["total_ms"] += total
+            t["max_ms"] = max(t["max_ms"], maximo)
+    for t in totales.values():
+        t["promedio_ms"] = t["total_ms"] / t["cantidad"] if t["cantidad"] else 0.0
+    clave = {"total": "total_ms", "max": "max_ms", "cantidad": "cantidad", "promedio": "promedio_ms"}[orden]
+    return sorted(totales.values(), key=lambda t: t[clave], reverse=True)[:n]
+
+
+def lentas(n=50):
+    """Últimas n sentencias lentas de SQL_LENTAS_ARCHIVO (la más reciente primero)."""
+    archivo = getattr(settings, "SQL_LENTAS_ARCHIVO", "")
+    if not archivo or not os.path.exists(archivo):
+        return []
+    with open(archivo, encoding="utf-8") as f:
+        lineas = deque(f, maxlen=n)
+    return [json.loads(linea) for linea in reversed(lineas) if linea.strip()]
+
+
+def reiniciar():
+    acumulado.reiniciar()
+    cache.delete_many((cache.get(_CLAVE_PROCESOS) or []) + [_CLAVE_PROCESOS])
@@ -0,0 +1,242 @@
+"""
+Perfilado a pedido de un request (index, api_productos, exportar PDF...) sin redesplegar.
+
+Lo activa PerfiladorMiddleware cuando el request trae el header X-Perfilar o el
+parámetro ?_perfilar=, solo para usuarios staff (sesión del admin) o con el
+header X-Perfilar-Token igual a PERFILAR_TOKEN. Sin eso el middleware mira un
+header y sigue: los requests normales no pagan nada.
+
+Modos (valor del header / parámetro):
+  muestreo (o 1): un hilo toma la pila de todos los hilos cada
+      PERFILAR_INTERVALO_MS y cuenta pilas. Salida "collapsed" (una pila por
+      línea con su cantidad) para flamegraph.pl, speedscope o inferno. Ve el
+      trabajo que corre en los hilos de sync_to_async y del pool del PDF; si hay
+      otros requests en curso sus muestras se mezclan.
+  cprofile: perfilador determinista (todas las llamadas, con tiempos exactos)
+      del hilo que atiende el request: .prof para snakeviz o `python -m pstats`.
+      Bajo ASGI las partes síncronas corren en otros hilos y no aparecen: ahí
+      conviene muestreo.
+
+Se guardan en PERFILAR_DIR el perfil y un .json con las consultas SQL del
+request (ver perfil_sql.registrar_consultas) y la respuesta lleva los headers
+X-Perfil (nombre de los archivos) y Server-Timing. Con ?_perfilar_salida=respuesta
+(o el header X-Perfilar-Salida: respuesta) se devuelve el informe en texto en
+lugar de la respuesta de la vista.
+"""
+import cProfile
+import hmac
+import io
+import json
+import os
+import pstats
+import re
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import Counter
+
+from django.conf import settings
+from django.http import HttpResponse
+from django.utils import timezone
+
+from .perfil_sql import registrar_consultas
+
+# hojas de pila de un hilo esperando (locks, colas, selector del event loop, pools sin tareas): no son trabajo
+_OCIOSOS = ("threading.py", "selectors.py", "queue.py")
+_OCIOSAS = {("thread.py", "_worker")}
+
+# sys.setswitchinterval es de todo el proceso: con varios muestreos a la vez se restaura al terminar el último
+_lock_cambio = threading.Lock()
+_muestreando = 0
+_cambio_original = None
+
+
+def modo_pedido(request):
+    """Modo pedido en el request ("muestreo" | "cprofile") o None."""
+    valor = (request.headers.get("X-Perfilar") or request.GET.get("_perfilar") or "").strip().lower()
+    if not valor or valor in ("0", "no"):
+        return None
+    return "cprofile" if valor == "cprofile" else "muestreo"
+
+
+def autorizado(request, usuario):
+    token = getattr(settings, "PERFILAR_TOKEN", "")
+    recibido = request.headers.get("X-Perfilar-Token", "")
+    if token and hmac.compare_digest(recibido.encode(), token.encode()):
+        return True
+    return bool(usuario and usuario.is_active and usuario.is_staff)
+
+
+def _etiqueta(code):
+    carpeta, archivo = os.path.split(code.co_filename)
+    return f"{code.co_name} ({os.path.basename(carpeta)}/{archivo}:{code.co_firstlineno})"
+
+
+def _pila(frame):
+    archivo = os.path.basename(frame.f_code.co_filename)
+    if archivo in _OCIOSOS or (archivo, frame.f_code.co_name) in _OCIOSAS:
+        return None
+    nombres = []
+    while frame is not None:
+        nombres.append(_etiqueta(frame.f_code))
+        frame = frame.f_back
+    return ";".join(reversed(nombres))
+
+
+def _acortar_cambio(intervalo):
+    global _muestreando, _cambio_original
+    with _lock_cambio:
+        if _muestreando == 0:
+            _cambio_original = sys.getswitchinterval()
+        _muestreando += 1
+        sys.setswitchinterval(min(sys.getswitchinterval(), intervalo))
+
+
+def _restaurar_cambio():
+    global _muestreando
+    with _lock_cambio:
+        _muestreando -= 1
+        if _muestreando == 0:
+            sys.setswitchinterval(_cambio_original)
+
+
+class Muestreador:
+    def __init__(self, intervalo):
+        self.intervalo = intervalo
+        self.pilas = Counter()
+        self.muestras = 0
+        self._parar = threading.Event()
+        self._hilo = threading.Thread(target=self._correr, name="perfilador", daemon=True)
+
+    def iniciar(self):
+        # el hilo del muestreador necesita el GIL a tiempo: se acorta el intervalo de cambio mientras dura
+        _acortar_cambio(self.intervalo)
+        self._inicio = time.perf_counter()
+        self._hilo.start()
+
+    def detener(self):
+        self._parar.set()
+        self._hilo.join()
+        self.duracion = time.perf_counter() - self._inicio
+        _restaurar_cambio()
+
+    def _correr(self):
+        propio = threading.get_ident()
+        while not self._parar.wait(self.intervalo):
+            self.muestras += 1
+            for ident, frame in sys._current_frames().items():
+                if ident == propio:
+                    continue
+                pila = _pila(frame)
+                if pila:
+                    self.pilas[pila] += 1
+
+    def collapsed(self):
+        return "".join(f"{pila} {n}\n" for pila, n in self.pilas.most_common())
+
+    def resumen(self, n=30):
+        propias, incluidas = Counter(), Counter()
+        for pila, cantidad in self.pilas.items():
+            marcos = pila.split(";")
+            propias[marcos[-1]] += cantidad
+            for marco in set(marcos):
+                incluidas[marco] += cantidad
+        # con el GIL ocupado las muestras se espacian más que el intervalo: se reparte el tiempo real
+        ms = self.duracion * 1000 / max(self.muestras, 1)
+        lineas = [f"{self.muestras} muestras, una cada {ms:.2f} ms en promedio", "", "Tiempo propio (hoja de la pila):"]
+        lineas += [f"  {c * ms:9.1f} ms  {m}" for m, c in propias.most_common(n)]
+        lineas += ["", "Tiempo incluido:"]
+        lineas += [f"  {c * ms:9.1f} ms  {m}" for m, c in incluidas.most_common(n)]
+        return "\n".join(lineas)
+
+
+class Perfil:
+    """Context manager alrededor de get_response; luego responder() arma la salida."""
+
+    def __init__(self, modo, vista, ruta):
+        self.modo = modo
+        self.vista = vista
+        self.ruta = ruta
+        self._consultas_cm = registrar_consultas()
+
+    def __enter__(self):
+        self.consultas = self._consultas_cm.__enter__()
+        if self.modo == "cprofile":
+            self._perfilador = cProfile.Profile()
+            self._perfilador.enable()
+        else:
+            self._perfilador = Muestreador(getattr(settings, "PERFILAR_INTERVALO_MS", 1) / 1000)
+            self._perfilador.iniciar()
+        self._inicio = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.total_ms = (time.perf_counter() - self._inicio) * 1000
+        if self.modo == "cprofile":
+            self._perfilador.disable()
+        else:
+            self._perfilador.detener()
+        self._consultas_cm.__exit__(*exc)
+        return False
+
+    def _resumen_perfil(self, n=30):
+        if self.modo != "cprofile":
+            return self._perfilador.resumen(n)
+        salida = io.StringIO()
+        pstats.Stats(self._perfilador, stream=salida).sort_stats("cumulative").print_stats(n)
+        return salida.getvalue()
+
+    def guardar(self):
+        carpeta = getattr(settings, "PERFILAR_DIR", "") or os.path.join(tempfile.gettempdir(), "cyr_perfiles")
+        os.makedirs(carpeta, exist_ok=True)
+        nombre = "{}-{}-{}".format(
+            timezone.localtime().strftime("%Y%m%d-%H%M%S"),
+            re.sub(r"[^\w.-]", "_", self.vista)[:60],
+            uuid.uuid4().hex[:6],
+        )
+        base = os.path.join(carpeta, nombre)
+        if self.modo == "cprofile":
+            self._perfilador.dump_stats(base + ".prof")
+        else:
+            with open(base + ".collapsed", "w", encoding="utf-8") as f:
+                f.write(self._perfilador.collapsed())
+        with open(base + ".json", "w", encoding="utf-8") as f:
+            json.dump(self.datos(), f, ensure_ascii=False, indent=1)
+        return nombre
+
+    def datos(self):
+        consultas = sorted(self.consultas, key=lambda c: c[0], reverse=True)
+        return {
+            "vista": self.vista,
+            "ruta": self.ruta,
+            "modo": self.modo,
+            "fecha": timezone.now().isoformat(),
+            "total_ms": round(self.total_ms, 1),
+            "sql_ms": round(sum(c[0] for c in consultas), 1),
+            "consultas": [{"ms": round(ms, 2), "huella": huella, "sql": sql} for ms, huella, sql in consultas],
+        }
+
+    def informe(self):
+        datos = self.datos()
+        lineas = [
+            f"{datos['vista']}  {datos['ruta']}  modo={self.modo}",
+            f"total {datos['total_ms']} ms; SQL {datos['sql_ms']} ms en {len(datos['consultas'])} consultas",
+            "",
+            "Consultas más lentas:",
+        ]
+        lineas += [f"  {c['ms']:9.2f} ms  [{c['huella']}] {c['sql'][:200]}" for c in datos["consultas"][:15]]
+        return "\n".join(lineas) + "\n\n" + self._resumen_perfil()
+
+    def responder(self, request, response):
+        nombre = self.guardar()
+        salida = (request.headers.get("X-Perfilar-Salida") or request.GET.get("_perfilar_salida") or "").lower()
+        if salida == "respuesta":
+            response = HttpResponse(self.informe(), content_type="text/plain; charset=utf-8")
+        sql_ms = sum(c[0] for c in self.consultas)
+        response["X-Perfil"] = nombre
+        response["Server-Timing"] = (
+            f'total;dur={self.total_ms:.1f}, db;dur={sql_ms:.1f};desc="{len(self.consultas)} consultas"'
+        )
+        return response
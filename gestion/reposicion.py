@@ -0,0 +1,125 @@
+"""
+Pronóstico de demanda y sugerencias de reposición.
+
+Para cada producto se toma la demanda diaria de las Salidas de los últimos
+`dias` (del acumulado MovimientoDiario, sumado por día en la BD) y se calculan
+con NumPy, para todos los productos a la vez:
+
+    d   = demanda diaria promedio      (días sin salidas cuentan como 0)
+    s   = desviación estándar diaria
+    L   = Proveedor.dias_entrega,  R = REPOSICION_DIAS_CICLO,  z = REPOSICION_Z
+
+    punto de reorden   = d·L + z·s·√L
+    nivel objetivo     = d·(L+R) + z·s·√(L+R)
+    cantidad sugerida  = nivel objetivo - stock   (solo si stock <= punto de reorden)
+
+El resultado queda en SugerenciaReposicion. Una corrida incremental recalcula
+solo los productos con movimientos desde la anterior (y los que aún no tienen
+sugerencia); la corrida completa conviene una vez al día porque la ventana
+avanza aunque no haya movimientos.
+"""
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max, Q, Sum
+from django.utils import timezone
+
+from .models import MovimientoDiario, Producto, SugerenciaReposicion
+from .rotacion import filas_cursor
+
+# margen sobre la corrida anterior: cubre escrituras que se confirmaron mientras corría
+SOLAPE = timedelta(minutes=5)
+
+
+def calcular(dias=None, completo=False):
+    """Recalcula las sugerencias. Devuelve {"productos", "incremental", "ms"}."""
+    import numpy as np
+
+    inicio = time.perf_counter()
+    dias = dias or getattr(settings, "REPOSICION_VENTANA_DIAS", 90)
+    z = getattr(settings, "REPOSICION_Z", 1.65)
+    ciclo = getattr(settings, "REPOSICION_DIAS_CICLO", 30)
+    ahora = timezone.now()
+    hoy = timezone.localdate()
+
+    productos = Producto.objects.order_by("id")
+    ultima = None
+    if not completo:
+        ultima = SugerenciaReposicion.objects.filter(ventana_dias=dias).aggregate(m=Max("calculado"))["m"]
+    if ultima is not None:
+        con_movimientos = MovimientoDiario.objects.filter(actualizado__gte=ultima - SOLAPE).values("producto_id")
+        productos = productos.filter(
+            Q(id__in=con_movimientos) | Q(sugerencia__isnull=True) | ~Q(sugerencia__ventana_dias=dias)
+        )
+
+    filas = list(productos.values_list("id", "proveedor_id", "stock", "proveedor__dias_entrega"))
+    if not filas:
+        return {"productos": 0, "incremental": ultima is not None, "ms": round((time.perf_counter() - inicio) * 1000, 1)}
+    datos = np.array(filas, dtype=np.int64).reshape(-1, 4)
+    ids, stock, entrega = datos[:, 0], datos[:, 2].astype(np.float64), datos[:, 3].astype(np.float64)
+
+    # salidas por producto y día, ya sumadas en la BD (varias filas por día si hubo varios clientes)
+    por_dia = (
+        MovimientoDiario.objects
+        .filter(tipo="Salida", fecha__gt=hoy - timedelta(days=dias), fecha__lte=hoy)
+        .values("producto_id", "fecha")
+        .annotate(total=Sum("cantidad"))
+        .values_list("producto_id", "total")
+        .order_by()
+    )
+    if ultima is not None:
+        por_dia = por_dia.filter(producto_id__in=productos.values("id"))
+    mov = np.array(filas_cursor(por_dia), dtype=np.float64).reshape(-1, 2)
+    pos = np.searchsorted(ids, mov[:, 0].astype(np.int64))
+    cantidad = mov[:, 1]
+
+    n = len(ids)
+    suma = np.bincount(pos, weights=cantidad, minlength=n)
+    suma_cuadrados = np.bincount(pos, weights=cantidad * cantidad, minlength=n)
+    demanda = suma / dias
+    desviacion = np.sqrt(np.maximum(suma_cuadrados / dias - demanda ** 2, 0))
+
+    punto_reorden = np.ceil(demanda * entrega + z * desviacion * np.sqrt(entrega))
+    objetivo = demanda * (entrega + ciclo) + z * desviacion * np.sqrt(entrega + ciclo)
+    cantidad_sugerida = np.where(stock <= punto_reorden, np.ceil(np.maximum(objetivo - stock, 0)), 0)
+
+    sugerencias = [
+        SugerenciaReposicion(
+            producto_id=int(ids[i]),
+            proveedor_id=int(datos[i, 1]),
+            ventana_dias=dias,
+            demanda_diaria=round(float(demanda[i]), 4),
+            desviacion_diaria=round(float(desviacion[i]), 4),
+            stock=int(stock[i]),
+            punto_reorden=int(punto_reorden[i]),
+            cantidad_sugerida=int(cantidad_sugerida[i]),
+            calculado=ahora,
+        )
+        for i in range(n)
+    ]
+    with transaction.atomic():
+        SugerenciaReposicion.objects.bulk_create(
+            sugerencias,
+            batch_size=1000,
+            update_conflicts=True,
+            unique_fields=["producto"],
+            update_fields=["proveedor", "ventana_dias", "demanda_diaria", "desviacion_diaria", "stock",
+                           "punto_reorden", "cantidad_sugerida", "calculado"],
+        )
+    return {"productos": n, "incremental": ultima is not None, "ms": round((time.perf_counter() - inicio) * 1000, 1)}
+
+
+def por_proveedor(proveedor_id=None, solo_pedir=True):
+    """Sugerencias agrupadas por proveedor, listas para armar órdenes de compra."""
+    sugerencias = (
+        SugerenciaReposicion.objects
+        .select_related("producto", "proveedor")
+        .order_by("proveedor__nombre", "-cantidad_sugerida", "producto__nombre")
+    )
+    if proveedor_id:
+        sugerencias = sugerencias.filter(proveedor_id=proveedor_id)
+    if solo_pedir:
+        sugerencias = sugerencias.filter(cantidad_sugerida__gt=0)
+    return sugerencias
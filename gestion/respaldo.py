@@ -0,0 +1,313 @@
+"""
+Respaldo en línea de la base de datos (comandos respaldar_bd, verificar_respaldo
+y restaurar_bd).
+
+Copiar db.sqlite3 con la app andando puede dejar una copia rota (tomada a mitad
+de una escritura), y detener la app corta el servicio. Con SQLite se usa la API
+de backup desde una conexión aparte, de a RESPALDO_PAGINAS páginas con una pausa
+de RESPALDO_PAUSA segundos entre pasos. Cada paso toma un bloqueo de lectura de
+milisegundos y las escrituras siguen entre un paso y otro. Si una escritura
+cambia la base a mitad de camino, SQLite reinicia la copia; pasados
+RESPALDO_REINTENTOS reinicios se copia de una vez (un solo bloqueo, más largo),
+así siempre termina con una foto consistente.
+
+La copia se escribe en un archivo temporal, se verifica (PRAGMA integrity_check)
+y recién entonces toma el nombre final, opcionalmente comprimida con gzip: nunca
+queda un respaldo a medias con el nombre de uno bueno.
+
+Restaurar también usa la API de backup, en sentido inverso, en un solo paso:
+las otras conexiones ven la base anterior o la restaurada, nunca una mezcla.
+
+Con PostgreSQL o MySQL en DATABASES se usan sus herramientas, que también toman
+una foto consistente sin frenar las escrituras: pg_dump en formato custom y
+pg_restore, o mysqldump --single-transaction y mysql.
+"""
+import gzip
+import os
+import shutil
+import sqlite3
+import subprocess
+import tempfile
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connections
+from django.utils import timezone
+
+EXTENSIONES = {"sqlite": ".sqlite3", "postgresql": ".dump", "mysql": ".sql"}
+
+
+class ErrorRespaldo(Exception):
+    pass
+
+
+class _DemasiadosReinicios(Exception):
+    pass
+
+
+def _config(alias):
+    conexion = connections[alias]
+    if conexion.vendor not in EXTENSIONES:
+        raise ErrorRespaldo(f"Motor no soportado para respaldos: {conexion.vendor}")
+    return conexion.vendor, conexion.settings_dict
+
+
+def carpeta():
+    return Path(getattr(settings, "RESPALDO_DIR", "") or Path(settings.BASE_DIR) / "respaldos")
+
+
+def nombre_por_defecto(alias="default", comprimir=False):
+    motor, _ = _config(alias)
+    nombre = f"{alias}-{timezone.localtime():%Y%m%d-%H%M%S}{EXTENSIONES[motor]}"
+    # el formato custom de pg_dump ya viene comprimido
+    if comprimir and motor != "postgresql":
+        nombre += ".gz"
+    return carpeta() / nombre
+
+
+def _temporal_junto_a(destino):
+    descriptor, ruta = tempfile.mkstemp(prefix=f".{destino.name}.", suffix=".tmp", dir=destino.parent)
+    os.close(descriptor)
+    return Path(ruta)
+
+
+def _comprimir(origen, destino):
+    with open(origen, "rb") as entrada, gzip.open(destino, "wb", compresslevel=6) as salida:
+        shutil.copyfileobj(entrada, salida, 1024 * 1024)
+
+
+@contextmanager
+def _descomprimido(archivo):
+    """Ruta al archivo sin comprimir (uno temporal si es .gz)."""
+    archivo = Path(archivo)
+    if archivo.suffix != ".gz":
+        yield archivo
+        return
+    temporal = _temporal_junto_a(Path(tempfile.gettempdir()) / archivo.stem)
+    try:
+        with gzip.open(archivo, "rb") as entrada, open(temporal, "wb") as salida:
+            shutil.copyfileobj(entrada, salida, 1024 * 1024)
+        yield temporal
+    finally:
+        temporal.unlink(missing_ok=True)
+
+
+# ---------- SQLite ----------
+def _solo_lectura(ruta):
+    return sqlite3.connect(Path(ruta).resolve().as_uri() + "?mode=ro", uri=True)
+
+
+def copiar_sqlite(origen, destino, paginas=None, pausa=None, reintentos=None):
+    """
+    Copia consistente de la base `origen` a `destino` con la API de backup, por pasos.
+    Devuelve {"paginas", "pasos", "reinicios", "de_una_vez"}.
+    """
+    paginas = paginas or getattr(settings, "RESPALDO_PAGINAS", 256)
+    pausa = getattr(settings, "RESPALDO_PAUSA", 0.01) if pausa is None else pausa
+    reintentos = getattr(settings, "RESPALDO_REINTENTOS", 5) if reintentos is None else reintentos
+    info = {"paginas": 0, "pasos": 0, "reinicios": 0, "de_una_vez": False}
+    restantes = [None]
+
+    def progreso(estado, quedan, total):
+        info["paginas"] = total
+        info["pasos"] += 1
+        # un paso que no avanza: otra conexión escribió y SQLite volvió a empezar
+        if estado == sqlite3.SQLITE_OK and restantes[0] is not None and quedan >= restantes[0]:
+            info["reinicios"] += 1
+            if info["reinicios"] > reintentos:
+                raise _DemasiadosReinicios
+        restantes[0] = quedan
+        # la pausa va aquí: el `sleep` de backup() solo se aplica cuando la base está ocupada
+        time.sleep(pausa)
+
+    fuente = _solo_lectura(origen)
+    copia = sqlite3.connect(destino)
+    try:
+        try:
+            fuente.backup(copia, pages=paginas, progress=progreso)
+        except _DemasiadosReinicios:
+            info["de_una_vez"] = True
+            fuente.backup(copia)
+    finally:
+        copia.close()
+        fuente.close()
+    return info
+
+
+def verificar_sqlite(ruta):
+    """{"ok", "detalle", "tablas", "migracion"}: integridad y última migración aplicada."""
+    conexion = _solo_lectura(ruta)
+    try:
+        detalle = [fila[0] for fila in conexion.execute("PRAGMA integrity_check")]
+        tablas = conexion.execute("SELECT count(*) FROM sqlite_master WHERE type = 'table'").fetchone()[0]
+        try:
+            migracion = conexion.execute(
+                "SELECT app || '.' || name FROM django_migrations WHERE app = 'gestion' ORDER BY id DESC LIMIT 1"
+            ).fetchone()
+        except sqlite3.DatabaseError:
+            migracion = None
+    except sqlite3.DatabaseError as e:
+        return {"ok": False, "detalle": [str(e)], "tablas": 0, "migracion": None}
+    finally:
+        conexion.close()
+    return {"ok": detalle == ["ok"], "detalle": detalle[:10], "tablas": tablas,
+            "migracion": migracion[0] if migracion else None}
+
+
+def restaurar_sqlite(respaldo, destino):
+    fuente = _solo_lectura(respaldo)
+    base = sqlite3.connect(destino, timeout=30)
+    try:
+        fuente.backup(base)  # un solo paso: bloqueo exclusivo sobre `destino` mientras dura
+    finally:
+        base.close()
+        fuente.close()
+
+
+# ---------- PostgreSQL / MySQL ----------
+def _argumentos_pg(config):
+    argumentos = []
+    for opcion, clave in (("-h", "HOST"), ("-p", "PORT"), ("-U", "USER")):
+        if config.get(clave):
+            argumentos += [opcion, str(config[clave])]
+    return argumentos, {**os.environ, "PGPASSWORD": config.get("PASSWORD") or ""}
+
+
+def _argumentos_mysql(config):
+    argumentos = []
+    for opcion, clave in (("-h", "HOST"), ("-P", "PORT"), ("-u", "USER")):
+        if config.get(clave):
+            argumentos += [opcion, str(config[clave])]
+    return argumentos, {**os.environ, "MYSQL_PWD": config.get("PASSWORD") or ""}
+
+
+def _ejecutar(comando, entorno):
+    try:
+        return subprocess.run(comando, env=entorno, check=True, capture_output=True)
+    except FileNotFoundError:
+        raise ErrorRespaldo(f"No se encontró {comando[0]}: instale el cliente de la base de datos")
+    except subprocess.CalledProcessError as e:
+        raise ErrorRespaldo(f"{comando[0]} falló: {e.stderr.decode(errors='replace')[:500]}")
+
+
+def _volcar(motor, config, temporal, comprimir):
+    if motor == "postgresql":
+        argumentos, entorno = _argumentos_pg(config)
+        _ejecutar(["pg_dump", "-Fc", "-f", str(temporal), *argumentos, config["NAME"]], entorno)
+        return
+    argumentos, entorno = _argumentos_mysql(config)
+    abrir = gzip.open if comprimir else open
+    with abrir(temporal, "wb") as salida:
+        proceso = subprocess.Popen(
+            ["mysqldump", "--single-transaction", "--quick", "--routines", *argumentos, config["NAME"]],
+            env=entorno, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+        )
+        shutil.copyfileobj(proceso.stdout, salida, 1024 * 1024)
+        if proceso.wait():
+            raise ErrorRespaldo(f"mysqldump falló: {proceso.stderr.read().decode(errors='replace')[:500]}")
+
+
+def _final(archivo, comprimido, tamano=4096):
+    """Últimos bytes del archivo (descomprimido)."""
+    if not comprimido:
+        with open(archivo, "rb") as f:
+            f.seek(max(f.seek(0, os.SEEK_END) - tamano, 0))
+            return f.read()
+    final = b""
+    with gzip.open(archivo, "rb") as f:
+        for trozo in iter(lambda: f.read(1024 * 1024), b""):
+            final = (final + trozo)[-tamano:]
+    return final
+
+
+def _verificar_volcado(motor, archivo, comprimido):
+    if motor == "postgresql":
+        # pg_restore --list lee el índice completo del archivo
+        salida = _ejecutar(["pg_restore", "--list", str(archivo)], os.environ).stdout.decode(errors="replace")
+        entradas = sum(1 for linea in salida.splitlines() if linea and not linea.startswith(";"))
+        return {"ok": entradas > 0, "detalle": [f"{entradas} entradas"], "tablas": None, "migracion": None}
+    ok = b"-- Dump completed" in _final(archivo, comprimido)
+    return {"ok": ok, "detalle": ["completo" if ok else "el volcado está cortado"], "tablas": None, "migracion": None}
+
+
+# ---------- operaciones ----------
+def respaldar(destino=None, alias="default", comprimir=False):
+    """
+    Respaldo consistente de la base `alias` en `destino` (por defecto en RESPALDO_DIR).
+    Devuelve {"archivo", "bytes", "segundos", "verificacion", ...}; ErrorRespaldo si falla.
+    """
+    motor, config = _config(alias)
+    destino = Path(destino) if destino else nombre_por_defecto(alias, comprimir)
+    comprimir = comprimir or destino.suffix == ".gz"
+    destino.parent.mkdir(parents=True, exist_ok=True)
+    inicio = time.monotonic()
+    temporal = _temporal_junto_a(destino)
+    info = {}
+    try:
+        if motor == "sqlite":
+            info = copiar_sqlite(config["NAME"], temporal)
+            verificacion = verificar_sqlite(temporal)
+            if verificacion["ok"] and comprimir:
+                plano, temporal = temporal, _temporal_junto_a(destino)
+                try:
+                    _comprimir(plano, temporal)
+                finally:
+                    plano.unlink(missing_ok=True)
+        else:
+            _volcar(motor, config, temporal, comprimir)
+            verificacion = _verificar_volcado(motor, temporal, comprimir)
+        if not verificacion["ok"]:
+            raise ErrorRespaldo(f"La copia no pasó la verificación: {verificacion['detalle']}")
+        os.replace(temporal, destino)
+    finally:
+        temporal.unlink(missing_ok=True)
+    return {
+        "archivo": str(destino),
+        "bytes": destino.stat().st_size,
+        "segundos": round(time.monotonic() - inicio, 2),
+        "verificacion": verificacion,
+        **info,
+    }
+
+
+def verificar(archivo, alias="default"):
+    motor, _ = _config(alias)
+    if not Path(archivo).exists():
+        raise ErrorRespaldo(f"No existe {archivo}")
+    if motor != "sqlite":
+        return _verificar_volcado(motor, archivo, str(archivo).endswith(".gz"))
+    with _descomprimido(archivo) as plano:
+        return verificar_sqlite(plano)
+
+
+def restaurar(archivo, alias="default"):
+    """
+    Reemplaza la base `alias` por el respaldo, que se verifica antes. Cierra la
+    conexión de Django de este proceso; los workers deberían estar detenidos o
+    reiniciarse después (sus caches en memoria siguen siendo de la base anterior).
+    """
+    motor, config = _config(alias)
+    verificacion = verificar(archivo, alias)
+    if not verificacion["ok"]:
+        raise ErrorRespaldo(f"El respaldo no pasó la verificación: {verificacion['detalle']}")
+    connections[alias].close()
+    if motor == "sqlite":
+        with _descomprimido(archivo) as plano:
+            restaurar_sqlite(plano, config["NAME"])
+    elif motor == "postgresql":
+        argumentos, entorno = _argumentos_pg(config)
+        _ejecutar(["pg_restore", "--clean", "--if-exists", "--no-owner", "-d", config["NAME"], *argumentos,
+                   str(archivo)], entorno)
+    else:
+        argumentos, entorno = _argumentos_mysql(config)
+        abrir = gzip.open if str(archivo).endswith(".gz") else open
+        with abrir(archivo, "rb") as entrada:
+            proceso = subprocess.Popen(["mysql", *argumentos, config["NAME"]], env=entorno,
+                                       stdin=subprocess.PIPE, stderr=subprocess.PIPE)
+            shutil.copyfileobj(entrada, proceso.stdin, 1024 * 1024)
+            proceso.stdin.close()
+            if proceso.wait():
+                raise ErrorRespaldo(f"mysql falló: {proceso.stderr.read().decode(errors='replace')[:500]}")
+    return verificacion
@@ -0,0 +1,111 @@
+from django.db import connection, transaction
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.utils import timezone
+from django.dispatch import receiver
+
+from . import cache_vistas, eventos, sincronizacion
+from .models import Cliente, NotaPedido, NotaPedidoItem, Producto, Proveedor
+from .typeahead import indice
+
+
+# —— Índice de autocompletado: se actualiza solo cuando la escritura se confirma
+@receiver(post_save, sender=Producto)
+def _producto_guardado(sender, instance, **kwargs):
+    transaction.on_commit(lambda: indice.producto_guardado(instance.pk))
+
+
+@receiver(post_delete, sender=Producto)
+def _producto_eliminado(sender, instance, **kwargs):
+    pk = instance.pk
+    transaction.on_commit(lambda: indice.producto_eliminado(pk))
+
+
+@receiver(post_save, sender=Proveedor)
+def _proveedor_guardado(sender, instance, created, **kwargs):
+    if not created:
+        transaction.on_commit(lambda: indice.proveedor_guardado(instance.pk, instance.nombre))
+
+
+# —— Cache de vistas: cualquier escritura confirmada cambia la versión del modelo
+@receiver(post_save, sender=NotaPedido)
+@receiver(post_delete, sender=NotaPedido)
+@receiver(post_save, sender=NotaPedidoItem)
+@receiver(post_delete, sender=NotaPedidoItem)
+@receiver(post_save, sender=Producto)
+@receiver(post_delete, sender=Producto)
+@receiver(post_save, sender=Proveedor)
+@receiver(post_delete, sender=Proveedor)
+@receiver(post_save, sender=Cliente)
+@receiver(post_delete, sender=Cliente)
+def _invalidar_cache_vistas(sender, **kwargs):
+    transaction.on_commit(lambda: cache_vistas.invalidar(sender))
+
+
+# —— Sincronización por diferencias (/api/sync/): registro de borrados
+_MODELO_ELIMINACION = {Producto: "producto", Proveedor: "proveedor", Cliente: "cliente", NotaPedido: "nota"}
+
+
+@receiver(post_delete, sender=Producto)
+@receiver(post_delete, sender=Proveedor)
+@receiver(post_delete, sender=Cliente)
+@receiver(post_delete, sender=NotaPedido)
+def _registrar_eliminacion(sender, instance, **kwargs):
+    sincronizacion.registrar_eliminacion(_MODELO_ELIMINACION[sender], instance.pk)
+
+
+@receiver(pre_delete, sender=Producto)
+def _notas_del_producto(sender, instance, **kwargs):
+    # borrar un producto quita sus items de notas ajenas: esas notas cambian
+    NotaPedido.objects.filter(items__producto=instance).update(actualizado=timezone.now())
+
+
+# —— Eventos en vivo (/api/eventos/): se publican al confirmarse la escritura
+@receiver(post_save, sender=NotaPedido)
+def _publicar_nota_guardada(sender, instance, created, **kwargs):
+    eventos.publicar("nota_guardada", {"id": instance.pk, "numero": instance.numero, "creada": created})
+
+
+@receiver(post_delete, sender=NotaPedido)
+def _publicar_nota_eliminada(sender, instance, **kwargs):
+    eventos.publicar("nota_eliminada", {"id": instance.pk})
+
+
+# —— Borrado por conjunto de notas (api_notas_eliminar, cierre): sin señales por fila
+LOTE_BORRADO = 500  # ids por DELETE: lejos del límite de parámetros de SQLite
+
+
+def _borrar_por_id(modelo, columna, ids):
+    tabla = connection.ops.quote_name(modelo._meta.db_table)
+    columna = connection.ops.quote_name(columna)
+    borradas = 0
+    with connection.cursor() as cursor:
+        for i in range(0, len(ids), LOTE_BORRADO):
+            lote = ids[i:i + LOTE_BORRADO]
+            cursor.execute(f"DELETE FROM {tabla} WHERE {columna} IN ({', '.join(['%s'] * len(lote))})", lote)
+            borradas += cursor.rowcount
+    return borradas
+
+
+def borrar_notas(ids):
+    """
+    Borra las notas `ids` y sus items con un DELETE por tabla, sin que Django
+    los cargue ni dispare post_delete por cada fila. Hace una sola vez para todo
+    el conjunto lo que harían los receptores de arriba: los registros de borrado
+    en un INSERT, una invalidación del cache por modelo y un evento
+    notas_eliminadas {"ids"}. Stock y analítica los revierte quien llama
+    (inventario.revertir_notas), antes de borrar. Devuelve cuántas notas borró.
+
+    El DELETE directo no aplica on_delete: la única FK hacia NotaPedido es
+    NotaPedidoItem.nota (CASCADE), que se borra aquí primero. Una FK nueva hacia
+    NotaPedido tiene que agregarse aquí (EliminarNotasTests lo verifica).
+    """
+    ids = list(ids)
+    if not ids:
+        return 0
+    with transaction.atomic():
+        _borrar_por_id(NotaPedidoItem, NotaPedidoItem._meta.get_field("nota").column, ids)
+        borradas = _borrar_por_id(NotaPedido, NotaPedido._meta.pk.column, ids)
+        sincronizacion.registrar_eliminaciones("nota", ids)
+    transaction.on_commit(lambda: cache_vistas.invalidar(NotaPedido, NotaPedidoItem))
+    eventos.publicar("notas_eliminadas", {"ids": ids})
+    return borradas
@@ -0,0 +1,88 @@
+"""
+Sincronización por diferencias ("cambios desde") para /api/sync/.
+
+El token que recibe el cliente es el instante (µs desde epoch) en que el
+servidor empezó a leer. En la siguiente llamada se devuelven las filas con
+`actualizado` posterior a ese instante menos SYNC_SOLAPE_SEGUNDOS: una
+transacción que escribió antes de la lectura pero confirmó después igual
+aparece. Las filas repetidas por el solape son inofensivas (el cliente
+reemplaza por id).
+
+Los borrados salen de Eliminacion (ver signals.py). Si el token es más viejo
+que SYNC_RETENCION_DIAS esos registros ya pueden no estar, así que se
+responde una foto completa ("completo": true) y el cliente reemplaza todo.
+"""
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import Cliente, Eliminacion, NotaPedido, Producto, Proveedor
+
+COLECCIONES = ("productos", "proveedores", "clientes", "notas")
+_MODELO_ELIMINACION = {"productos": "producto", "proveedores": "proveedor", "clientes": "cliente", "notas": "nota"}
+
+
+def crear_token(instante):
+    return str(int(instante.timestamp() * 1_000_000))
+
+
+def leer_token(token):
+    """Token -> datetime; ValueError si no es válido."""
+    micro = int(token)
+    if micro < 0:
+        raise ValueError("token inválido")
+    return datetime.fromtimestamp(micro / 1_000_000, tz=dt_timezone.utc)
+
+
+def retencion():
+    return timedelta(days=getattr(settings, "SYNC_RETENCION_DIAS", 90))
+
+
+def requiere_completo(desde, ahora):
+    return desde is None or desde < ahora - retencion()
+
+
+def consultas(desde, incluir=COLECCIONES):
+    """{coleccion: queryset} con lo modificado desde `desde` (todo si es None)."""
+    base = {
+        "productos": Producto.objects.order_by("id"),
+        "proveedores": Proveedor.objects.order_by("id"),
+        "clientes": Cliente.objects.order_by("id"),
+        "notas": NotaPedido.objects.prefetch_related("items").order_by("id"),
+    }
+    if desde is not None:
+        corte = desde - timedelta(seconds=getattr(settings, "SYNC_SOLAPE_SEGUNDOS", 30))
+        base = {k: qs.filter(actualizado__gte=corte) for k, qs in base.items()}
+    return {k: qs for k, qs in base.items() if k in incluir}
+
+
+def eliminados(desde, incluir=COLECCIONES):
+    """{coleccion: [ids]} borrados desde `desde` (mismo solape que consultas())."""
+    corte = desde - timedelta(seconds=getattr(settings, "SYNC_SOLAPE_SEGUNDOS", 30))
+    salida = {k: [] for k in incluir}
+    modelos = {_MODELO_ELIMINACION[k]: k for k in incluir}
+    for modelo, objeto_id in (
+        Eliminacion.objects
+        .filter(fecha__gte=corte, modelo__in=modelos)
+        .order_by("id")
+        .values_list("modelo", "objeto_id")
+    ):
+        salida[modelos[modelo]].append(objeto_id)
+    return salida
+
+
+def registrar_eliminacion(modelo, objeto_id):
+    """Anota el borrado (lo llama signals.py)."""
+    Eliminacion.objects.create(modelo=modelo, objeto_id=objeto_id)
+
+
+def registrar_eliminaciones(modelo, ids):
+    """Anota varios borrados con un solo INSERT (borrados por conjunto, ver signals.borrar_notas)."""
+    Eliminacion.objects.bulk_create([Eliminacion(modelo=modelo, objeto_id=objeto_id) for objeto_id in ids])
+
+
+def depurar(ahora=None):
+    """Borra los registros de eliminación fuera de la retención."""
+    ahora = ahora or timezone.now()
+    return Eliminacion.objects.filter(fecha__lt=ahora - retencion()).delete()[0]
@@ -1,3 +1,1781 @@
-from django.test import TestCase
+import asyncio
+import base64
+import gzip
+import json
+import os
+import re
+import runpy
+import sqlite3
+import subprocess
+import tempfile
+import time
+import sys
+import threading
+from collections import Counter
+from datetime import datetime, timedelta
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from unittest import mock, skipIf
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.core.cache import cache
+from django.db import IntegrityError, OperationalError, connection, transaction
+from django.http import HttpResponse
+from django.test import (
+    AsyncClient, AsyncRequestFactory, Client, SimpleTestCase, TestCase, TransactionTestCase, override_settings,
+)
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from . import (
+    admision, analitica, calentamiento, cierre, escritor, eventos, idempotencia, inventario, outbox, perfil_sql, perfilador,
+    reposicion, respaldo, rotacion, sincronizacion, views,
+)
+from .models import (
+    Almacen, Cierre, ClaveIdempotencia, Cliente, Eliminacion, Evento, EventoSalida, MovimientoDiario, NotaArchivada,
+    NotaPedido, NotaPedidoItem, Producto, Proveedor, SaldoInicial, StockAlmacen, SugerenciaReposicion,
+)
+from .perfil_sql import huella
+from .typeahead import indice
+from mi_proyecto.middleware import AsyncWhiteNoiseMiddleware, brotli, elegir_codificacion
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+
+
+class ArranqueTests(SimpleTestCase):
+    """
+    Lo que paga cada worker al arrancar (y cada comando de manage.py): cargar
+    Django, las urls y las vistas. Se mide en un proceso aparte, sin módulos
+    ya importados por el runner de tests.
+    """
+    # se importan solo al usarse (exportar.py, rotacion.py, reposicion.py)
+    MODULOS_DIFERIDOS = ("reportlab", "numpy", "PIL", "weasyprint")
+    # hoy ronda 0.35 s en frío: unas seis veces eso deja margen a un CI lento y aún
+    # detecta una dependencia pesada que vuelva al arranque. ARRANQUE_PRESUPUESTO_MS lo cambia
+    PRESUPUESTO_MS = int(os.environ.get("ARRANQUE_PRESUPUESTO_MS") or 2000)
+
+    SCRIPT = (
+        "import os, sys, time, warnings\n"
+        "warnings.simplefilter('ignore')\n"
+        "inicio = time.perf_counter()\n"
+        "os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'mi_proyecto.settings')\n"
+        "from django.core.wsgi import get_wsgi_application\n"
+        "get_wsgi_application()\n"
+        "import gestion.urls\n"
+        "ms = (time.perf_counter() - inicio) * 1000\n"
+        "print(round(ms))\n"
+        "print(','.join(sorted({m.split('.')[0] for m in sys.modules})))\n"
+    )
+
+    def _arrancar(self):
+        entorno = {k: v for k, v in os.environ.items() if k != "WARMUP"}
+        salida = subprocess.run(
+            [sys.executable, "-c", self.SCRIPT],
+            cwd=BASE_DIR, env=entorno, capture_output=True, text=True, timeout=120, check=True,
+        ).stdout.splitlines()
+        return int(salida[0]), set(salida[1].split(","))
+
+    def test_no_importa_dependencias_pesadas(self):
+        _, modulos = self._arrancar()
+        cargados = [m for m in self.MODULOS_DIFERIDOS if m in modulos]
+        self.assertEqual(cargados, [], f"Se importan al arrancar: {cargados}")
+
+    def test_tiempo_de_arranque(self):
+        # el mejor de tres: descarta el ruido de la máquina, no las regresiones
+        ms = min(self._arrancar()[0] for _ in range(3))
+        self.assertLessEqual(ms, self.PRESUPUESTO_MS, f"Arranque de {ms} ms (presupuesto {self.PRESUPUESTO_MS} ms)")
+
+
+# =====================
+# Cantidad de consultas por vista (N+1)
+# =====================
+AUTH = "Basic " + base64.b64encode(b"cyr:cyr1506").decode()
+
+
+def sembrar(n):
+    """
+    Datos proporcionales a n: n proveedores y n clientes, 2n productos (la mitad
+    bajo su stock mínimo), n notas de entrada y n de salida con 3 items cada una
+    repartidas entre dos almacenes, su acumulado diario y las sugerencias de
+    reposición. Más un proveedor y un cliente sin movimientos, para las escrituras,
+    y n entradas de hace dos años ya archivadas por un cierre.
+    """
+    almacenes = [Almacen.principal(), Almacen.objects.create(nombre="Sucursal")]
+    proveedores = Proveedor.objects.bulk_create([Proveedor(nombre=f"Proveedor {i}") for i in range(n)])
+    clientes = Cliente.objects.bulk_create([Cliente(nombre=f"Cliente {i}") for i in range(n)])
+    productos = [
+        Producto.objects.create(
+            nombre=f"Producto {i:03d}", precio=10 + i, proveedor=proveedores[i % n],
+            stock_minimo=100 if i % 2 == 0 else None,
+        )
+        for i in range(2 * n)
+    ]
+    hace_dos_anios = timezone.now() - timedelta(days=730)
+    for i in range(n):
+        nota = NotaPedido.objects.create(tipo="Entrada", proveedor=proveedores[i], almacen=almacenes[i % 2],
+                                         fecha=hace_dos_anios, orden_compra=f"OC-A{i}")
+        NotaPedidoItem.objects.bulk_create([
+            NotaPedidoItem(nota=nota, producto=productos[(i + k) % (2 * n)], cantidad=5, precio_unitario=1)
+            for k in range(3)
+        ])
+        inventario.registrar(nota)
+    cierre_anterior = cierre.cerrar(timezone.localdate() - timedelta(days=365))
+    notas = []
+    for i in range(2 * n):
+        entrada = i < n
+        nota = NotaPedido.objects.create(
+            tipo="Entrada" if entrada else "Salida",
+            proveedor=proveedores[i % n] if entrada else None,
+            cliente=None if entrada else clientes[i % n],
+            almacen=almacenes[i % 2],
+            orden_compra=f"OC-{i}",
+        )
+        NotaPedidoItem.objects.bulk_create([
+            NotaPedidoItem(nota=nota, producto=productos[(i + k) % (2 * n)], cantidad=10 if entrada else 1,
+                           precio_unitario=productos[(i + k) % (2 * n)].precio)
+            for k in range(3)
+        ])
+        inventario.registrar(nota)
+        notas.append(nota)
+    reposicion.calcular(completo=True)
+    return {
+        "almacenes": almacenes,
+        "proveedores": proveedores,
+        "clientes": clientes,
+        "productos": productos,
+        "notas": notas,
+        "cierre": cierre_anterior,
+        "proveedor_libre": Proveedor.objects.create(nombre="Proveedor sin movimientos"),
+        "cliente_libre": Cliente.objects.create(nombre="Cliente sin movimientos"),
+    }
+
+
+def _json(metodo, ruta, cuerpo):
+    return lambda c, d: getattr(c, metodo)(ruta(d), json.dumps(cuerpo(d)), content_type="application/json")
+
+
+def _get(ruta):
+    return lambda c, d: c.get(ruta if isinstance(ruta, str) else ruta(d))
+
+
+# (nombre, petición): la petición recibe el Client y lo que devolvió sembrar(n).
+# Las escrituras mandan tantos items / ids como filas haya en la escala.
+PAGINAS = [
+    ("index", _get("/")),
+    ("index ?q=", _get("/?q=producto")),
+    ("seguimiento", _get("/seguimiento/?q=oc")),
+    ("gestion_datos", _get("/gestion-datos/")),
+]
+API_CATALOGOS = [
+    ("proveedores GET", _get("/api/proveedores/")),
+    ("proveedores POST", _json("post", lambda d: "/api/proveedores/", lambda d: {"nombre": "Nuevo"})),
+    ("proveedor DELETE", lambda c, d: c.delete(f"/api/proveedores/{d['proveedor_libre'].id}/")),
+    ("clientes GET", _get("/api/clientes/")),
+    ("clientes POST", _json("post", lambda d: "/api/clientes/", lambda d: {"nombre": "Nuevo"})),
+    ("cliente DELETE", lambda c, d: c.delete(f"/api/clientes/{d['cliente_libre'].id}/")),
+    ("almacenes GET", _get("/api/almacenes/")),
+    ("almacenes POST", _json("post", lambda d: "/api/almacenes/", lambda d: {"nombre": "Nuevo"})),
+]
+API_PRODUCTOS = [
+    ("productos", _get("/api/productos/?page_size=200")),
+    ("productos normalizado", _get("/api/productos/?page_size=200&format=normalized")),
+    ("productos fields", _get("/api/productos/?page_size=200&fields=id,nombre,stock")),
+    ("productos por almacén", _get(lambda d: f"/api/productos/?page_size=200&almacen={d['almacenes'][1].id}")),
+    ("productos buscar", _get("/api/productos/buscar/?q=prod&k=50")),
+    ("productos alertas", _get("/api/productos/alertas/")),
+    ("producto crear", _json("post", lambda d: "/api/productos/crear/", lambda d: {
+        "nombre": "Nuevo", "adquisicion": "Compra", "proveedor": d["proveedores"][0].id, "precio": "5"})),
+    ("producto editar", _json("put", lambda d: f"/api/productos/{d['productos'][0].id}/editar/", lambda d: {
+        "nombre": "Editado", "codigo": "EDIT001", "unidad": "Und", "adquisicion": "Compra",
+        "precio": "7", "peso": "1", "proveedor": d["proveedores"][1 % len(d["proveedores"])].id})),
+]
+API_NOTAS_LECTURA = [
+    ("notas", _get("/api/notas/")),
+    ("notas q", _get("/api/notas/?q=producto")),
+    ("notas normalizado", _get("/api/notas/?format=normalized")),
+    ("notas fields sin items", _get("/api/notas/?fields=id,numero,proveedor,cliente")),
+    ("sync completo", _get("/api/sync/")),
+    ("sync desde token", _get("/api/sync/?since=1")),
+    ("eventos", _get("/api/eventos/")),
+    ("exportar pdf", _get("/api/notas/export/pdf/")),
+    ("exportar pdf ids", _get(lambda d: "/api/notas/export/pdf/?ids=" + ",".join(str(n.id) for n in d["notas"]))),
+]
+API_NOTAS_ESCRITURA = [
+    ("nota crear", _json("post", lambda d: "/api/notas/crear/", lambda d: {
+        "tipo": "entrada", "proveedor": d["proveedor_libre"].id,
+        "items": [{"producto": p.id, "cantidad": 2} for p in d["productos"]]})),
+    ("nota traslado", _json("post", lambda d: "/api/notas/crear/", lambda d: {
+        "tipo": "traslado", "almacen": d["almacenes"][0].id, "almacen_destino": d["almacenes"][1].id,
+        "items": [{"producto": p.id, "cantidad": 1} for p in d["productos"]]})),
+    # la nota tiene los productos 0, 1 y 2: cambia uno, quita dos y agrega el resto desde el 3
+    ("nota PUT", _json("put", lambda d: f"/api/notas/{d['notas'][0].id}/", lambda d: {
+        "items": [{"producto": d["productos"][0].id, "cantidad": 3}]
+                 + [{"producto": p.id, "cantidad": 1} for p in d["productos"][3:]]})),
+    ("nota PATCH cabecera", _json("patch", lambda d: f"/api/notas/{d['notas'][0].id}/", lambda d: {
+        "proveedor": d["proveedor_libre"].id})),
+    ("nota DELETE", lambda c, d: c.delete(f"/api/notas/{d['notas'][0].id}/")),
+    ("notas eliminar ids", _json("post", lambda d: "/api/notas/eliminar/", lambda d: {
+        "ids": [n.id for n in d["notas"]]})),
+    ("notas eliminar filtro", _json("post", lambda d: "/api/notas/eliminar/", lambda d: {"q": "oc"})),
+]
+API_ANALITICA = [
+    ("movimientos dia", _get("/api/analitica/movimientos/")),
+    ("movimientos mes", _get("/api/analitica/movimientos/?agrupar=mes")),
+    ("top productos", _get("/api/analitica/top/?n=100")),
+    ("top clientes monto", _get("/api/analitica/top/?por=cliente&metrica=monto&tipo=salida")),
+    ("abc", _get("/api/inventario/abc/")),
+    ("reposicion", _get("/api/inventario/reposicion/?todos=1")),
+]
+API_ARCHIVO = [
+    ("archivo notas", _get("/api/archivo/notas/?page_size=200")),
+    ("archivo notas ?q=", _get("/api/archivo/notas/?q=producto&page_size=200")),
+    ("archivo cierres", _get("/api/archivo/cierres/")),
+    ("archivo saldos", _get(lambda d: f"/api/archivo/cierres/{d['cierre'].id}/saldos/?page_size=1000")),
+]
+
+
+def _por_huella(consultas):
+    conteo, ejemplo = Counter(), {}
+    for c in consultas:
+        h, _ = huella(c["sql"])
+        conteo[h] += 1
+        ejemplo.setdefault(h, c["sql"])
+    return conteo, ejemplo
+
+
+def _diferencias(chico, grande):
+    """Consultas cuya cantidad cambia con la escala, con su SQL."""
+    conteo_chico, _ = _por_huella(chico)
+    conteo_grande, ejemplo = _por_huella(grande)
+    _, ejemplo_chico = _por_huella(chico)
+    lineas = []
+    for h in sorted(conteo_chico.keys() | conteo_grande.keys(), key=lambda h: -conteo_grande[h]):
+        if conteo_chico[h] != conteo_grande[h]:
+            sql = ejemplo.get(h) or ejemplo_chico[h]
+            lineas.append(f"  {conteo_chico[h]:4d} -> {conteo_grande[h]:4d}  {sql[:400]}")
+    return "\n".join(lineas)
+
+
+@override_settings(
+    ADMISION_ACTIVA=False,
+    ALERTAS_STOCK_ARCHIVO="",
+    SQL_LENTAS_ARCHIVO="",
+    OUTBOX_URL="http://127.0.0.1:9/",  # las escrituras registran su evento (no se envía)
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}},
+)
+class ConsultasPorVistaTests(TestCase):
+    """
+    Cada vista y endpoint ejecuta la misma cantidad de consultas con pocos datos
+    que con muchos: un N+1 (una consulta por fila o por item) hace fallar el
+    test con las consultas que crecieron.
+    """
+    ESCALAS = (3, 15)
+
+    def setUp(self):
+        self.client.defaults["HTTP_AUTHORIZATION"] = AUTH
+
+    def _consultas(self, n, peticion):
+        # cada escala en su propio savepoint, que se descarta al terminar
+        with transaction.atomic():
+            datos = sembrar(n)
+            cache.clear()
+            indice.invalidar()
+            with CaptureQueriesContext(connection) as contexto:
+                respuesta = peticion(self.client, datos)
+                if respuesta.streaming:
+                    b"".join(respuesta.streaming_content)
+            transaction.set_rollback(True)
+        self.assertLess(respuesta.status_code, 300, getattr(respuesta, "content", b"")[:500])
+        return contexto.captured_queries
+
+    def _verificar(self, casos):
+        for nombre, peticion in casos:
+            with self.subTest(nombre):
+                chico, grande = (self._consultas(n, peticion) for n in self.ESCALAS)
+                if len(chico) != len(grande):
+                    self.fail(
+                        f"{nombre}: {len(chico)} consultas con n={self.ESCALAS[0]}, "
+                        f"{len(grande)} con n={self.ESCALAS[1]}\n{_diferencias(chico, grande)}"
+                    )
+
+    def test_paginas(self):
+        self._verificar(PAGINAS)
+
+    def test_api_catalogos(self):
+        self._verificar(API_CATALOGOS)
+
+    def test_api_productos(self):
+        self._verificar(API_PRODUCTOS)
+
+    def test_api_notas_lectura(self):
+        self._verificar(API_NOTAS_LECTURA)
+
+    def test_api_notas_escritura(self):
+        self._verificar(API_NOTAS_ESCRITURA)
+
+    def test_api_analitica(self):
+        self._verificar(API_ANALITICA)
+
+    def test_api_archivo(self):
+        self._verificar(API_ARCHIVO)
+
+    def test_informe_lista_las_consultas_que_crecen(self):
+        chico = [{"sql": "SELECT 1 FROM t WHERE id = 1"}]
+        grande = chico + [{"sql": "SELECT nombre FROM p WHERE id = %d" % i} for i in range(5)]
+        informe = _diferencias(chico, grande)
+        self.assertIn("0 ->    5  SELECT nombre FROM p WHERE id = 0", informe)
+        self.assertNotIn("FROM t", informe)
+
+
+@override_settings(ALERTAS_STOCK_ARCHIVO="", CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+class CatalogoTests(TestCase):
+    """El dashboard trae solo la primera página; el resto sale de /api/productos/."""
+
+    def setUp(self):
+        cache.clear()
+        self.client.defaults["HTTP_AUTHORIZATION"] = AUTH
+        proveedor = Proveedor.objects.create(nombre="Proveedor")
+        Producto.objects.bulk_create([Producto(nombre=f"Producto {i:02d}", proveedor=proveedor) for i in range(30)])
+
+    def test_index_renderiza_la_primera_pagina(self):
+        pagina = self.client.get("/").context["pagina"]
+        self.assertEqual([p.nombre for p in pagina.productos()], [f"Producto {i:02d}" for i in range(24)])
+        self.assertTrue(pagina.hay_mas())
+
+    def test_api_productos_sigue_desde_la_pagina_pedida(self):
+        datos = self.client.get("/api/productos/?page=2&page_size=24").json()
+        self.assertEqual([p["nombre"] for p in datos["results"]], [f"Producto {i:02d}" for i in range(24, 30)])
+        self.assertEqual((datos["total"], datos["has_next"]), (30, False))
+        # valores inválidos vuelven a los de por defecto
+        datos = self.client.get("/api/productos/?page=x&page_size=0").json()
+        self.assertEqual((datos["page"], datos["page_size"], len(datos["results"])), (1, 1, 1))
+
+
+class TypeaheadTests(TestCase):
+    """El índice de prefijos se mantiene con las señales, sin reconstruirse."""
+
+    def setUp(self):
+        self.proveedor = Proveedor.objects.create(nombre="Aceros Lima")
+        self.tornillo = Producto.objects.create(nombre="Tornillo galvanizado", codigo="TOR001", proveedor=self.proveedor)
+        Producto.objects.create(nombre="Tuerca hexagonal", codigo="TUE001", proveedor=self.proveedor)
+        indice.invalidar()
+        self.addCleanup(indice.invalidar)
+
+    def _nombres(self, q):
+        return [r["nombre"] for r in indice.buscar(q)]
+
+    def test_busca_por_prefijo_sin_tildes_y_por_tramos_de_codigo(self):
+        Producto.objects.create(nombre="Galón de pintura", proveedor=self.proveedor)
+        self.assertEqual(self._nombres("galon"), ["Galón de pintura"])
+        self.assertEqual(self._nombres("gal"), ["Galón de pintura", "Tornillo galvanizado"])
+        self.assertEqual(self._nombres("tor gal"), ["Tornillo galvanizado"])
+        self.assertEqual(self._nombres("tue 001"), ["Tuerca hexagonal"])
+        # el código exacto va primero
+        self.assertEqual(self._nombres("tor001")[0], "Tornillo galvanizado")
+
+    def test_escrituras_confirmadas_actualizan_el_indice(self):
+        self.assertEqual(self._nombres("aceros"), ["Tornillo galvanizado", "Tuerca hexagonal"])
+        construido = indice._construido_en
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Producto.objects.create(nombre="Arandela", proveedor=self.proveedor)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.tornillo.nombre = "Perno galvanizado"
+            self.tornillo.save()
+        self.assertEqual(self._nombres("aran"), ["Arandela"])
+        self.assertEqual(self._nombres("perno"), ["Perno galvanizado"])
+        self.assertEqual(self._nombres("tornillo"), [])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.proveedor.nombre = "Ferretería Sur"
+            self.proveedor.save()
+        self.assertEqual(self._nombres("aceros"), [])
+        self.assertEqual(len(self._nombres("ferreteria")), 3)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.tornillo.delete()
+        self.assertEqual(self._nombres("perno"), [])
+        self.assertEqual(indice._construido_en, construido)
+
+
+class NumeracionTests(TransactionTestCase):
+    """Numeración por año de las notas (SecuenciaNota), con commits reales entre hilos."""
+
+    def setUp(self):
+        Almacen.principal()
+        self.proveedor = Proveedor.objects.create(nombre="Proveedor")
+
+    def _crear(self, **campos):
+        return NotaPedido.objects.create(tipo="Entrada", proveedor=self.proveedor, **campos)
+
+    def test_cada_anio_tiene_su_correlativo(self):
+        este_anio = timezone.localdate().year
+        self.assertEqual(self._crear().numero, f"N{este_anio}_0001")
+        self.assertEqual(self._crear(fecha=timezone.now() - timedelta(days=400)).numero, f"N{este_anio - 1}_0001")
+        nota = self._crear()
+        self.assertEqual(nota.numero, f"N{este_anio}_0002")
+        # editar la fecha no renumera
+        nota.fecha = timezone.now() - timedelta(days=400)
+        nota.save()
+        nota.refresh_from_db()
+        self.assertEqual(nota.numero, f"N{este_anio}_0002")
+
+    def test_creacion_concurrente_sin_repetidos_ni_huecos(self):
+        hilos, por_hilo = 6, 4
+        largada = threading.Barrier(hilos)
+        errores = []
+
+        def crear():
+            try:
+                largada.wait()
+                for _ in range(por_hilo):
+                    # la BD de tests en memoria no espera al bloqueo: se reintenta la transacción completa
+                    while True:
+                        try:
+                            with transaction.atomic():
+                                self._crear()
+                            break
+                        except OperationalError as e:
+                            if "locked" not in str(e):
+                                raise
+                            time.sleep(0.001)
+            except Exception as e:
+                errores.append(e)
+            finally:
+                connection.close()
+
+        trabajadores = [threading.Thread(target=crear) for _ in range(hilos)]
+        for hilo in trabajadores:
+            hilo.start()
+        for hilo in trabajadores:
+            hilo.join()
+
+        self.assertEqual(errores, [])
+        anio = timezone.localdate().year
+        self.assertEqual(
+            sorted(NotaPedido.objects.values_list("numero", flat=True)),
+            [f"N{anio}_{i:04d}" for i in range(1, hilos * por_hilo + 1)],
+        )
+
+
+class CompresionTests(TestCase):
+    @skipIf(brotli is None, "Brotli no está instalado")
+    def test_elige_por_q_y_respeta_q_cero(self):
+        casos = {
+            "gzip, deflate, br": "br",
+            "br;q=0, gzip": "gzip",
+            "br; q=0.0, gzip;q=0.5": "gzip",
+            "gzip;q=1, br;q=0.5": "gzip",
+            "BR;Q=0.8, gzip;q=0.8": "br",
+            "*": "br",
+            "*;q=0, gzip": "gzip",
+            "br;q=0, gzip;q=0": None,
+            "identity": None,
+            "br;q=abc, gzip": "gzip",
+            "": None,
+        }
+        for cabecera, esperada in casos.items():
+            with self.subTest(cabecera):
+                self.assertEqual(elegir_codificacion(cabecera), esperada)
+
+    @override_settings(JSON_COMPRESS_MIN_BYTES=10)
+    def test_respuesta_json_con_brotli_rechazado(self):
+        self.client.defaults["HTTP_AUTHORIZATION"] = AUTH
+        proveedor = Proveedor.objects.create(nombre="Proveedor")
+        Producto.objects.bulk_create([Producto(nombre=f"Producto {i}", proveedor=proveedor) for i in range(20)])
+        respuesta = self.client.get("/api/productos/", HTTP_ACCEPT_ENCODING="br;q=0, gzip")
+        self.assertEqual(respuesta["Content-Encoding"], "gzip")
+        self.assertEqual(len(json.loads(gzip.decompress(respuesta.content))["results"]), 20)
+
+
+@override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+class CacheVistasTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client.defaults["HTTP_AUTHORIZATION"] = AUTH
+        self.proveedor = Proveedor.objects.create(nombre="Proveedor")
+
+    def _x_cache(self, ruta):
+        return self.client.get(ruta)["X-Cache"]
+
+    def test_una_escritura_confirmada_invalida_las_vistas_que_dependen_del_modelo(self):
+        self.assertEqual([self._x_cache("/seguimiento/"), self._x_cache("/seguimiento/")], ["MISS", "HIT"])
+        self.assertEqual(self._x_cache("/seguimiento/?q=oc"), "MISS")  # otros parámetros, otra clave
+        self.assertEqual([self._x_cache("/"), self._x_cache("/")], ["MISS", "HIT"])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Cliente.objects.create(nombre="Cliente")
+        # index no depende de Cliente
+        self.assertEqual([self._x_cache("/seguimiento/"), self._x_cache("/")], ["MISS", "HIT"])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Producto.objects.create(nombre="Tornillo", proveedor=self.proveedor)
+        respuesta = self.client.get("/")
+        self.assertEqual(respuesta["X-Cache"], "MISS")
+        self.assertContains(respuesta, "Tornillo")
+
+    def test_sin_commit_no_se_invalida(self):
+        self._x_cache("/")
+        with transaction.atomic():
+            Producto.objects.create(nombre="Tornillo", proveedor=self.proveedor)
+            transaction.set_rollback(True)
+        self.assertEqual(self._x_cache("/"), "HIT")
+
+    def test_el_calentamiento_deja_la_clave_de_un_get_real(self):
+        Producto.objects.create(nombre="Tornillo", proveedor=self.proveedor)
+        calentamiento._index()
+        respuesta = self.client.get("/")
+        self.assertEqual(respuesta["X-Cache"], "HIT")
+        self.assertContains(respuesta, "Tornillo")
+
+
+@override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+class StockTests(TestCase):
+    """Producto.stock guardado frente a recalcular(), y los cruces del stock mínimo."""
+
+    def setUp(self):
+        self.client.defaults["HTTP_AUTHORIZATION"] = AUTH
+        Almacen.principal()
+        self.proveedor = Proveedor.objects.create(nombre="Proveedor")
+        self.cliente = Cliente.objects.create(nombre="Cliente")
+        self.tornillo = Producto.objects.create(nombre="Tornillo", proveedor=self.proveedor, stock_minimo=5)
+        self.tuerca = Producto.objects.create(nombre="Tuerca", proveedor=self.proveedor)
+        archivo = tempfile.NamedTemporaryFile(suffix=".jsonl", delete=False)
+        archivo.close()
+        self.archivo = Path(archivo.name)
+        self.addCleanup(self.archivo.unlink, missing_ok=True)
+
+    def _enviar(self, metodo, ruta, cuerpo=None):
+        with self.settings(ALERTAS_STOCK_ARCHIVO=str(self.archivo)), self.captureOnCommitCallbacks(execute=True):
+            respuesta = getattr(self.client, metodo)(ruta, json.dumps(cuerpo), content_type="application/json")
+        self.assertLess(respuesta.status_code, 300, respuesta.content)
+        return respuesta.json()
+
+    def _nota(self, tipo, contraparte, **cantidades):
+        productos = {"tornillo": self.tornillo, "tuerca": self.tuerca}
+        return self._enviar("post", "/api/notas/crear/", {
+            "tipo": tipo, contraparte: getattr(self, contraparte).id,
+            "items": [{"producto": productos[k].id, "cantidad": c} for k, c in cantidades.items()],
+        })["nota_id"]
+
+    def _stock(self):
+        """Stock guardado, comprobando que coincide con el reconstruido desde los items."""
+        guardado = dict(Producto.objects.values_list("id", "stock"))
+        self.assertEqual(inventario.recalcular(), 0)
+        self.assertEqual(dict(Producto.objects.values_list("id", "stock")), guardado)
+        return guardado[self.tornillo.id], guardado[self.tuerca.id]
+
+    def _alertas(self):
+        return [(a["evento"], a["stock"]) for a in map(json.loads, self.archivo.read_text().splitlines())]
+
+    def test_stock_tras_crear_editar_y_borrar_coincide_con_recalcular(self):
+        entrada = self._nota("entrada", "proveedor", tornillo=20, tuerca=7)
+        salida = self._nota("salida", "cliente", tornillo=12)
+        self.assertEqual(self._stock(), (8, 7))
+
+        self._enviar("patch", f"/api/notas/{salida}/", {"items": [{"producto": self.tuerca.id, "cantidad": 2}]})
+        self.assertEqual(self._stock(), (20, 5))
+        self._enviar("patch", f"/api/notas/{entrada}/", {"tipo": "salida", "cliente": self.cliente.id})
+        self.assertEqual(self._stock(), (-20, -9))
+
+        self._enviar("delete", f"/api/notas/{entrada}/")
+        self.assertEqual(self._stock(), (0, -2))
+        self._enviar("post", "/api/notas/eliminar/", {"ids": [salida]})
+        self.assertEqual(self._stock(), (0, 0))
+
+    def test_cruzar_el_minimo_cambia_bajo_minimo_en_ambos_sentidos(self):
+        entrada = self._nota("entrada", "proveedor", tornillo=10)
+        salida = self._nota("salida", "cliente", tornillo=5)  # queda en 5: en el mínimo
+        self.tornillo.refresh_from_db()
+        self.assertTrue(self.tornillo.bajo_minimo)
+        alertas = self.client.get("/api/productos/alertas/").json()["results"]
+        self.assertEqual([(a["nombre"], a["faltante"]) for a in alertas], [("Tornillo", 0)])
+
+        self._enviar("delete", f"/api/notas/{salida}/")
+        self.tornillo.refresh_from_db()
+        self.assertFalse(self.tornillo.bajo_minimo)
+        self.assertEqual(self.client.get("/api/productos/alertas/").json()["total"], 0)
+
+        # la entrada inicial ya cruzó "repuesto" (de 0 a 10); moverse sin cruzar no agrega líneas
+        self._enviar("patch", f"/api/notas/{entrada}/", {"items": [{"producto": self.tornillo.id, "cantidad": 9}]})
+        self.assertEqual(self._alertas(), [("repuesto", 10), ("bajo_minimo", 5), ("repuesto", 10)])
+
+    def test_alertas_solo_al_confirmar(self):
+        with self.settings(ALERTAS_STOCK_ARCHIVO=str(self.archivo)), transaction.atomic():
+            nota = NotaPedido.objects.create(tipo="Entrada", proveedor=self.proveedor)
+            NotaPedidoItem.objects.create(nota=nota, producto=self.tornillo, cantidad=10)
+            self.assertEqual(len(inventario.registrar(nota)), 1)
+            transaction.set_rollback(True)
+        self.assertEqual(self.archivo.read_text(), "")
+
+    def test_editar_con_codigo_vacio_lo_genera_sin_tocar_el_stock(self):
+        Producto.objects.filter(pk=self.tuerca.pk).update(codigo=None, stock=12)
+        respuesta = self.client.post(f"/producto/{self.tuerca.pk}/editar/", {
+            "codigo": "", "nombre": "Tuerca", "unidad": "Und", "adquisicion": "Compra",
+            "precio": "1", "peso": "0", "proveedor": self.proveedor.pk,
+        })
+        self.assertEqual(respuesta.status_code, 302)
+        self.tuerca.refresh_from_db()
+        self.assertEqual(self.tuerca.codigo, "M1TUE001")
+        self.assertEqual(self.tuerca.stock, 12)
+
+
+def _acumulado():
+    """{(fecha, tipo, proveedor, cliente, producto): (cantidad, monto)} sin las filas que quedaron en cero."""
+    return {
+        (f, t, pr, cl, p): (c, m)
+        for f, t, pr, cl, p, c, m in MovimientoDiario.objects.values_list(
+            "fecha", "tipo", "proveedor_id", "cliente_id", "producto_id", "cantidad", "monto")
+        if c or m
+    }
+
+
+class AnaliticaTests(TestCase):
+    def setUp(self):
+        Almacen.principal()
+        self.proveedor = Proveedor.objects.create(nombre="Proveedor")
+        self.clientes = Cliente.objects.bulk_create([Cliente(nombre="Cliente A"), Cliente(nombre="Cliente B")])
+        self.producto = Producto.objects.create(nombre="Tornillo", proveedor=self.proveedor)
+        self.hoy = timezone.localdate()
+        self.ayer = self.hoy - timedelta(days=1)
+
+    def _nota(self, dia, cantidad, **campos):
+        nota = NotaPedido.objects.create(fecha=timezone.make_aware(datetime(dia.year, dia.month, dia.day, 12)), **campos)
+        NotaPedidoItem.objects.create(nota=nota, producto=self.producto, cantidad=cantidad, precio_unitario=2)
+        inventario.registrar(nota)
+        return nota
+
+    def test_misma_fecha_y_producto_con_distinta_contraparte(self):
+        a = self._nota(self.hoy, 3, tipo="Salida", cliente=self.clientes[0])
+        b = self._nota(self.hoy, 5, tipo="Salida", cliente=self.clientes[1])
+        c = self._nota(self.ayer, 10, tipo="Entrada", proveedor=self.proveedor)
+        # entran en el filtro fecha__in / tipo__in de varias claves sin ser de esas claves
+        self._nota(self.ayer, 7, tipo="Salida", cliente=self.clientes[0])
+        self._nota(self.hoy, 11, tipo="Entrada", proveedor=self.proveedor)
+        pid = self.producto.id
+        esperado = {
+            (self.hoy, "Salida", None, self.clientes[0].id, pid): (3, Decimal("6.00")),
+            (self.hoy, "Salida", None, self.clientes[1].id, pid): (5, Decimal("10.00")),
+            (self.ayer, "Entrada", self.proveedor.id, None, pid): (10, Decimal("20.00")),
+            (self.ayer, "Salida", None, self.clientes[0].id, pid): (7, Decimal("14.00")),
+            (self.hoy, "Entrada", self.proveedor.id, None, pid): (11, Decimal("22.00")),
+        }
+        self.assertEqual(_acumulado(), esperado)
+
+        # revertir_notas() resta las tres claves en una sola llamada a acumular_varios()
+        inventario.revertir_notas(NotaPedido.objects.filter(id__in=[a.id, b.id, c.id]))
+        NotaPedido.objects.filter(id__in=[a.id, b.id, c.id]).delete()
+        restantes = {k: esperado[k] for k in (
+            (self.ayer, "Salida", None, self.clientes[0].id, pid), (self.hoy, "Entrada", self.proveedor.id, None, pid),
+        )}
+        self.assertEqual(_acumulado(), restantes)
+        analitica.reconstruir()
+        self.assertEqual(_acumulado(), restantes)
+
+    def test_acumular_varios_crea_y_suma_por_clave(self):
+        pid = self.producto.id
+        a, b = (self.hoy, "Salida", None, self.clientes[0].id), (self.hoy, "Salida", None, self.clientes[1].id)
+        analitica.acumular_varios({a: {pid: (2, Decimal("4"))}}, 1)
+        analitica.acumular_varios({a: {pid: (1, Decimal("2"))}, b: {pid: (4, Decimal("8"))}}, 1)
+        self.assertEqual(_acumulado(), {a + (pid,): (3, Decimal("6.00")), b + (pid,): (4, Decimal("8.00"))})
+        self.assertEqual(MovimientoDiario.objects.count(), 2)
+
+
+class RotacionTests(TestCase):
+    def setUp(self):
+        Almacen.principal()
+        self.proveedor = Proveedor.objects.create(nombre="Proveedor")
+        self.cliente = Cliente.objects.create(nombre="Cliente")
+
+    def _nota(self, tipo, cantidades, dias=10, **campos):
+        nota = NotaPedido.objects.create(tipo=tipo, fecha=timezone.now() - timedelta(days=dias), **campos)
+        NotaPedidoItem.objects.bulk_create([
+            NotaPedidoItem(nota=nota, producto=p, cantidad=c, precio_unitario=p.precio) for p, c in cantidades.items()
+        ])
+        inventario.registrar(nota)
+
+    def test_limites_de_clase_abc(self):
+        # valor consumido 50 / 30 / 10 / 6 / 4 / 0 sobre 100: el que cruza el 80 % sigue en A,
+        # el que empieza justo en el 80 % ya es B
+        productos = [Producto.objects.create(nombre=f"P{i}", precio=p, proveedor=self.proveedor)
+                     for i, p in enumerate((5, 3, 1, 2, 4, 1))]
+        self._nota("Entrada", {p: 100 for p in productos}, dias=30, proveedor=self.proveedor)
+        self._nota("Salida", dict(zip(productos, (10, 10, 10, 3, 1))), cliente=self.cliente)
+        # un traslado no es consumo
+        self._nota("Traslado", {productos[5]: 50}, almacen=Almacen.principal(),
+                   almacen_destino=Almacen.objects.create(nombre="Sucursal"))
+
+        datos = rotacion.analizar(dias=365)
+        clases = {p["nombre"]: (p["clase"], p["participacion_acumulada"]) for p in datos["productos"]}
+        self.assertEqual(clases, {
+            "P0": ("A", 0.5), "P1": ("A", 0.8), "P2": ("B", 0.9), "P3": ("B", 0.96), "P4": ("C", 1.0), "P5": ("C", 1.0),
+        })
+        self.assertEqual([p["nombre"] for p in datos["productos"]], ["P0", "P1", "P2", "P3", "P4", "P5"])
+        self.assertEqual({c: r["productos"] for c, r in datos["resumen"]["clases"].items()}, {"A": 2, "B": 2, "C": 2})
+
+        sin_salidas = next(p for p in datos["productos"] if p["nombre"] == "P5")
+        self.assertEqual((sin_salidas["salidas"], sin_salidas["stock_muerto"], sin_salidas["rotacion"]), (0, True, 0.0))
+        p0 = datos["productos"][0]
+        # stock 90, al inicio de la ventana 0: promedio 45
+        self.assertEqual((p0["rotacion"], p0["stock_muerto"]), (round(10 / 45, 2), False))
+
+    def test_sin_salidas_todo_es_c(self):
+        producto = Producto.objects.create(nombre="P", precio=1, proveedor=self.proveedor)
+        self._nota("Entrada", {producto: 5}, proveedor=self.proveedor)
+        self.assertEqual([p["clase"] for p in rotacion.analizar()["productos"]], ["C"])
+
+
+@override_settings(REPOSICION_Z=1.65, REPOSICION_DIAS_CICLO=30)
+class ReposicionTests(TestCase):
+    def setUp(self):
+        Almacen.principal()
+        self.proveedor = Proveedor.objects.create(nombre="Proveedor", dias_entrega=4)
+        self.cliente = Cliente.objects.create(nombre="Cliente")
+        self.productos = [Producto.objects.create(nombre=f"P{i}", proveedor=self.proveedor) for i in range(3)]
+
+    def _nota(self, tipo, cantidades, **campos):
+        nota = NotaPedido.objects.create(tipo=tipo, **campos)
+        NotaPedidoItem.objects.bulk_create([
+            NotaPedidoItem(nota=nota, producto=p, cantidad=c) for p, c in cantidades.items()
+        ])
+        inventario.registrar(nota)
+
+    def _sugerencias(self):
+        return {
+            s[0]: s[1:] for s in SugerenciaReposicion.objects.order_by("producto_id").values_list(
+                "producto_id", "demanda_diaria", "desviacion_diaria", "stock", "punto_reorden", "cantidad_sugerida")
+        }
+
+    def test_punto_de_reorden_y_cantidad(self):
+        p = self.productos[0]
+        self._nota("Entrada", {p: 40}, proveedor=self.proveedor)
+        self._nota("Salida", {p: 20}, cliente=self.cliente)
+        reposicion.calcular(dias=10, completo=True)
+        # d = 20/10 = 2, s = sqrt(400/10 - 4) = 6, L = 4: reorden = ceil(8 + 1.65·6·2) = 28;
+        # objetivo = 2·34 + 1.65·6·√34 = 125.73 y el stock (20) está bajo el punto de reorden
+        self.assertEqual(self._sugerencias()[p.id], (2.0, 6.0, 20, 28, 106))
+
+    def test_incremental_recalcula_solo_lo_que_se_movio_y_coincide_con_el_completo(self):
+        self._nota("Entrada", {p: 50 for p in self.productos}, proveedor=self.proveedor)
+        self._nota("Salida", {self.productos[0]: 10, self.productos[1]: 5}, cliente=self.cliente)
+        self.assertEqual(reposicion.calcular(dias=10)["incremental"], False)
+        # lo ya calculado queda fuera del solape de la próxima corrida
+        hace_un_dia = timezone.now() - timedelta(days=1)
+        MovimientoDiario.objects.update(actualizado=hace_un_dia)
+        SugerenciaReposicion.objects.update(calculado=hace_un_dia + timedelta(hours=1))
+
+        self._nota("Salida", {self.productos[1]: 30}, cliente=self.cliente)
+        nuevo = Producto.objects.create(nombre="Nuevo", proveedor=self.proveedor)
+        resultado = reposicion.calcular(dias=10)
+        self.assertEqual((resultado["incremental"], resultado["productos"]), (True, 2))  # P1 y el nuevo
+        incremental = self._sugerencias()
+
+        reposicion.calcular(dias=10, completo=True)
+        self.assertEqual(incremental, self._sugerencias())
+        self.assertEqual(incremental[self.productos[1].id][2], 15)
+        self.assertIn(nuevo.id, incremental)
+
+
+@override_settings(SYNC_SOLAPE_SEGUNDOS=0, SYNC_RETENCION_DIAS=90)
+class SincronizacionTests(TestCase):
+    def setUp(self):
+        self.client.defaults["HTTP_AUTHORIZATION"] = AUTH
+        Almacen.principal()
+        self.proveedor = Proveedor.objects.create(nombre="Proveedor")
+        self.clientes = Cliente.objects.bulk_create([Cliente(nombre="Cliente A"), Cliente(nombre="Cliente B")])
+        self.productos = [Producto.objects.create(nombre=f"P{i}", proveedor=self.proveedor) for i in range(3)]
+
+    def _sync(self, token=None):
+        respuesta = self.client.get("/api/sync/", {"since": token} if token else {})
+        self.assertEqual(respuesta.status_code, 200, respuesta.content)
+        return respuesta.json()
+
+    def test_token_devuelve_solo_cambios_y_eliminados(self):
+        primera = self._sync()
+        self.assertTrue(primera["completo"])
+        self.assertEqual(len(primera["productos"]), 3)
+        self.assertEqual(primera["eliminados"]["clientes"], [])
+
+        self.assertEqual(
+            {k: v for k, v in self._sync(primera["token"]).items() if k in sincronizacion.COLECCIONES},
+            {"productos": [], "proveedores": [], "clientes": [], "notas": []},
+        )
+
+        self.productos[1].nombre = "Editado"
+        self.productos[1].save()
+        borrado = self.clientes[0].id
+        self.clientes[0].delete()
+        nota = NotaPedido.objects.create(tipo="Entrada", proveedor=self.proveedor)
+        NotaPedidoItem.objects.create(nota=nota, producto=self.productos[2], cantidad=4)
+        inventario.registrar(nota)
+        cambios = self._sync(primera["token"])
+        self.assertFalse(cambios["completo"])
+        # el stock de P2 cambió con la nota: también viaja
+        self.assertEqual(sorted(p["nombre"] for p in cambios["productos"]), ["Editado", "P2"])
+        self.assertEqual([n["id"] for n in cambios["notas"]], [nota.id])
+        self.assertEqual(cambios["eliminados"]["clientes"], [borrado])
+
+        self.client.post("/api/notas/eliminar/", json.dumps({"ids": [nota.id]}), content_type="application/json")
+        siguiente = self._sync(cambios["token"])
+        self.assertEqual(siguiente["eliminados"], {"productos": [], "proveedores": [], "clientes": [], "notas": [nota.id]})
+        self.assertEqual(siguiente["notas"], [])
+
+    def test_token_vencido_o_invalido(self):
+        self.clientes[0].delete()
+        viejo = sincronizacion.crear_token(timezone.now() - timedelta(days=91))
+        datos = self._sync(viejo)
+        self.assertTrue(datos["completo"])
+        self.assertEqual(len(datos["clientes"]), 1)
+        self.assertEqual(datos["eliminados"]["clientes"], [])
+        # la foto completa depura los registros de borrado vencidos
+        Eliminacion.objects.update(fecha=timezone.now() - timedelta(days=91))
+        self._sync(viejo)
+        self.assertFalse(Eliminacion.objects.exists())
+
+        for token in ("abc", "-5"):
+            self.assertEqual(self.client.get("/api/sync/", {"since": token}).status_code, 400)
+        self.assertEqual(self.client.get("/api/sync/?incluir=otra").status_code, 400)
+        self.assertEqual(set(self.client.get("/api/sync/?incluir=clientes").json()),
+                         {"token", "completo", "clientes", "eliminados"})
+
+
+class EventosTests(TestCase):
+    """Con varios workers cada proceso tiene su hub: lo publicado en uno debe llegar por la BD."""
+
+    def _leer(self, n, ultimo_id):
+        async def leer():
+            flujo = eventos.flujo(ultimo_id)
+            try:
+                return [await anext(flujo) for _ in range(n)]
+            finally:
+                await flujo.aclose()
+        return async_to_sync(leer)()
+
+    def test_lo_publicado_en_un_worker_llega_a_otro_por_la_bd(self):
+        otro_worker = eventos.Hub()
+        with self.settings(EVENTOS_BACKEND="memoria"), self.captureOnCommitCallbacks(execute=True):
+            eventos.publicar("nota_eliminada", {"id": 1})
+        self.assertEqual(eventos.hub.desde(f"{eventos.hub.arranque}-0")[-1][1:], ("nota_eliminada", {"id": 1}))
+        self.assertEqual(otro_worker.desde(f"{otro_worker.arranque}-0"), [])
+
+        with self.settings(EVENTOS_BACKEND="bd", EVENTOS_INTERVALO=0.01):
+            with self.captureOnCommitCallbacks(execute=True):
+                eventos.publicar("nota_guardada", {"id": 2, "numero": "N2026_0002", "creada": True})
+                eventos.publicar("nota_eliminada", {"id": 2})
+            primero, segundo = Evento.objects.order_by("id").values_list("id", flat=True)
+            self.assertEqual(self._leer(3, "0"), [
+                "retry: 3000\n\n",
+                eventos.formatear(primero, "nota_guardada", {"id": 2, "numero": "N2026_0002", "creada": True}),
+                eventos.formatear(segundo, "nota_eliminada", {"id": 2}),
+            ])
+            # al reconectar con Last-Event-ID sigue desde ahí
+            self.assertEqual(self._leer(2, str(primero))[1], eventos.formatear(segundo, "nota_eliminada", {"id": 2}))
+
+    def _config_gunicorn(self, **entorno):
+        with mock.patch.dict(os.environ, entorno):
+            if "EVENTOS_BACKEND" not in entorno:
+                os.environ.pop("EVENTOS_BACKEND", None)
+            config = runpy.run_path(str(BASE_DIR / "gunicorn_asgi.conf.py"))
+            return config["workers"], os.environ["EVENTOS_BACKEND"]
+
+    def test_perfil_asgi_con_varios_workers_usa_la_bd(self):
+        self.assertEqual(self._config_gunicorn(WEB_CONCURRENCY="3"), (3, "bd"))
+        self.assertEqual(self._config_gunicorn(WEB_CONCURRENCY="1"), (1, "memoria"))
+        with self.assertRaisesMessage(RuntimeError, "EVENTOS_BACKEND=memoria no funciona con 3 workers"):
+            self._config_gunicorn(WEB_CONCURRENCY="3", EVENTOS_BACKEND="memoria")
+
+
+@override_settings(ALERTAS_STOCK_ARCHIVO="", CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+class EditarNotaTests(TestCase):
+    """Tras cada edición, stock y acumulado diario deben coincidir con reconstruirlos desde los items."""
+
+    def setUp(self):
+        self.client.defaults["HTTP_AUTHORIZATION"] = AUTH
+        self.principal = Almacen.principal()
+        self.sucursal = Almacen.objects.create(nombre="Sucursal")
+        self.proveedores = Proveedor.objects.bulk_create([Proveedor(nombre=f"Proveedor {c}") for c in "AB"])
+        self.cliente = Cliente.objects.create(nombre="Cliente")
+        self.p = [Producto.objects.create(nombre=f"P{i}", precio=i + 1, proveedor=self.proveedores[0])
+                  for i in range(4)]
+        respuesta = self.client.post("/api/notas/crear/", json.dumps({
+            "tipo": "entrada", "proveedor": self.proveedores[0].id,
+            "items": [{"producto": self.p[0].id, "cantidad": 10}, {"producto": self.p[1].id, "cantidad": 5}],
+        }), content_type="application/json")
+        self.nota = respuesta.json()["nota_id"]
+        # una segunda nota en la misma fila del acumulado, que no debe tocarse
+        self.client.post("/api/notas/crear/", json.dumps({
+            "tipo": "entrada", "proveedor": self.proveedores[0].id,
+            "items": [{"producto": self.p[0].id, "cantidad": 1}],
+        }), content_type="application/json")
+
+    def _editar(self, metodo, cuerpo):
+        respuesta = getattr(self.client, metodo)(f"/api/notas/{self.nota}/", json.dumps(cuerpo),
+                                                 content_type="application/json")
+        self.assertEqual(respuesta.status_code, 200, respuesta.content)
+        self._verificar()
+        return respuesta.json()
+
+    def _verificar(self):
+        stock = dict(Producto.objects.values_list("id", "stock"))
+        acumulado = _acumulado()
+        self.assertEqual(inventario.recalcular(), 0)
+        self.assertEqual(inventario.recalcular_almacenes(), 0)
+        self.assertEqual(dict(Producto.objects.values_list("id", "stock")), stock)
+        analitica.reconstruir()
+        self.assertEqual(_acumulado(), acumulado)
+
+    def _stock(self):
+        return list(Producto.objects.order_by("id").values_list("stock", flat=True))
+
+    def test_items_agregados_quitados_y_cambiados(self):
+        respuesta = self._editar("put", {"items": [
+            {"producto": self.p[0].id, "cantidad": 7},   # cambia
+            {"producto": self.p[2].id, "cantidad": 2},   # nuevo
+            {"producto": self.p[2].id, "cantidad": 1},   # repetido: se suma
+        ]})                                              # p1 se quita
+        self.assertEqual(respuesta["cambios"], {"insertados": 1, "actualizados": 1, "eliminados": 1})
+        self.assertEqual(self._stock(), [8, 0, 3, 0])
+        self.assertEqual(sorted((i["producto"], i["cantidad"]) for i in respuesta["nota"]["items"]),
+                         [(self.p[0].id, 7), (self.p[2].id, 3)])
+
+        # los items que quedan conservan su precio aunque cambie el del catálogo
+        Producto.objects.filter(id=self.p[0].id).update(precio=100)
+        items = [{"producto": self.p[0].id, "cantidad": 9}, {"producto": self.p[2].id, "cantidad": 3}]
+        self._editar("patch", {"items": items})
+        fila = MovimientoDiario.objects.get(producto=self.p[0], proveedor=self.proveedores[0])
+        self.assertEqual(fila.monto, Decimal("10.00"))  # 9 a 1.00 de esta nota + 1 de la otra
+
+        sin_cambios = self._editar("patch", {"items": items})
+        self.assertEqual(sin_cambios["cambios"], {"insertados": 0, "actualizados": 0, "eliminados": 0})
+
+    def test_cambios_de_cabecera(self):
+        self._editar("patch", {"proveedor": self.proveedores[1].id})
+        # la fecha se edita desde el formulario HTML: la nota pasa a otra fila del acumulado
+        hace_tres_dias = timezone.localtime() - timedelta(days=3)
+        respuesta = self.client.post(f"/nota/{self.nota}/editar/", {
+            "fecha": hace_tres_dias.strftime("%Y-%m-%d %H:%M:%S"), "tipo": "Entrada",
+            "proveedor": self.proveedores[1].id, "almacen": self.principal.id,
+        })
+        self.assertEqual(respuesta.status_code, 302)
+        self._verificar()
+        self.assertEqual(set(MovimientoDiario.objects.filter(proveedor=self.proveedores[1], cantidad__gt=0)
+                             .values_list("fecha", flat=True)), {hace_tres_dias.date()})
+        self._editar("patch", {"tipo": "salida", "cliente": self.cliente.id, "items": [
+            {"producto": self.p[0].id, "cantidad": 4}, {"producto": self.p[3].id, "cantidad": 2},
+        ]})
+        self.assertEqual(self._stock(), [-3, 0, 0, -2])
+        self._editar("patch", {"tipo": "traslado", "almacen": self.principal.id, "almacen_destino": self.sucursal.id})
+        self.assertEqual(self._stock(), [1, 0, 0, 0])
+        self.assertEqual(
+            dict(StockAlmacen.objects.filter(producto=self.p[0]).values_list("almacen_id", "stock")),
+            {self.principal.id: -3, self.sucursal.id: 4},
+        )
+        self._editar("patch", {"tipo": "entrada", "proveedor": self.proveedores[0].id, "almacen": self.sucursal.id})
+        self.assertEqual(self._stock(), [5, 0, 0, 2])
+
+    def test_errores_no_cambian_nada(self):
+        stock = self._stock()
+        for cuerpo, error in (
+            ({"items": [{"producto": 999, "cantidad": 1}]}, "Producto no existe"),
+            ({"items": [{"producto": self.p[0].id, "cantidad": 0}]}, "Cada item requiere producto y cantidad > 0"),
+            ({"tipo": "salida"}, "cliente requerido para Salida"),
+        ):
+            respuesta = self.client.patch(f"/api/notas/{self.nota}/", json.dumps(cuerpo),
+                                          content_type="application/json")
+            self.assertEqual((respuesta.status_code, respuesta.json()["error"]), (400, error))
+        self.assertEqual(self.client.put(f"/api/notas/{self.nota}/", "{}", content_type="application/json").status_code, 400)
+        self.assertEqual(self.client.patch("/api/notas/999/", "{}", content_type="application/json").status_code, 404)
+        self.assertEqual(self._stock(), stock)
+        self._verificar()
+
+
+@override_settings(ALERTAS_STOCK_ARCHIVO="", EVENTOS_BACKEND="bd",
+                   CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+class EliminarNotasTests(TestCase):
+    """Borrar 1 o N notas por /api/notas/eliminar/ cuesta lo mismo: consultas, callbacks y eventos."""
+
+    def setUp(self):
+        self.client.defaults["HTTP_AUTHORIZATION"] = AUTH
+        Almacen.principal()
+        self.proveedor = Proveedor.objects.create(nombre="Proveedor")
+        self.productos = [Producto.objects.create(nombre=f"P{i}", proveedor=self.proveedor) for i in range(3)]
+
+    def _notas(self, n):
+        ids = []
+        for _ in range(n):
+            nota = NotaPedido.objects.create(tipo="Entrada", proveedor=self.proveedor)
+            NotaPedidoItem.objects.bulk_create([NotaPedidoItem(nota=nota, producto=p, cantidad=2) for p in self.productos])
+            inventario.registrar(nota)
+            ids.append(nota.id)
+        return ids
+
+    def _eliminar(self, ids):
+        Evento.objects.all().delete()
+        with CaptureQueriesContext(connection) as consultas, self.captureOnCommitCallbacks(execute=True) as callbacks:
+            respuesta = self.client.post("/api/notas/eliminar/", json.dumps({"ids": ids}), content_type="application/json")
+        self.assertEqual(respuesta.json()["eliminadas"], len(ids))
+        return len(consultas), len(callbacks), list(Evento.objects.order_by("id").values_list("tipo", "datos"))
+
+    def test_una_o_muchas_notas_cuestan_lo_mismo(self):
+        una = self._eliminar(self._notas(1))
+        ids = self._notas(25)
+        muchas = self._eliminar(ids)
+        self.assertEqual(una[:2], muchas[:2])
+        self.assertEqual([tipo for tipo, _ in muchas[2]], ["stock", "notas_eliminadas"])
+        self.assertEqual(muchas[2][1][1], {"ids": ids})
+
+        self.assertFalse(NotaPedido.objects.exists())
+        self.assertFalse(NotaPedidoItem.objects.exists())
+        self.assertEqual(Eliminacion.objects.filter(modelo="nota").count(), 26)
+        self.assertEqual(inventario.recalcular(), 0)
+        self.assertEqual(set(Producto.objects.values_list("stock", flat=True)), {0})
+
+    def test_el_cache_se_invalida_una_vez(self):
+        ids = self._notas(3)
+        with mock.patch("gestion.cache_vistas.invalidar") as invalidar, self.captureOnCommitCallbacks(execute=True):
+            self.client.post("/api/notas/eliminar/", json.dumps({"ids": ids}), content_type="application/json")
+        modelos = [m for llamada in invalidar.call_args_list for m in llamada.args]
+        self.assertEqual(sorted(m.__name__ for m in modelos), ["NotaPedido", "NotaPedidoItem", "Producto"])
+
+    def test_borrar_notas_conoce_todas_las_fk_hacia_notas(self):
+        # signals.borrar_notas borra con DELETE directo: una FK nueva quedaría colgando
+        relaciones = [(r.related_model.__name__, r.field.name, r.on_delete.__name__)
+                      for r in NotaPedido._meta.related_objects]
+        self.assertEqual(relaciones, [("NotaPedidoItem", "nota", "CASCADE")])
+
+
+@override_settings(ALERTAS_STOCK_ARCHIVO="", CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}},
+                   IDEMPOTENCIA_TTL_HORAS=24)
+class IdempotenciaTests(TestCase):
+    def setUp(self):
+        self.client.defaults["HTTP_AUTHORIZATION"] = AUTH
+        Almacen.principal()
+        self.proveedor = Proveedor.objects.create(nombre="Proveedor")
+        self.producto = Producto.objects.create(nombre="Tornillo", proveedor=self.proveedor)
+
+    def _crear(self, clave, cantidad=5):
+        cuerpo = {"tipo": "entrada", "proveedor": self.proveedor.id, "items": [{"producto": self.producto.id, "cantidad": cantidad}]}
+        return self.client.post("/api/notas/crear/", json.dumps(cuerpo), content_type="application/json",
+                                HTTP_IDEMPOTENCY_KEY=clave)
+
+    def _stock(self):
+        self.producto.refresh_from_db()
+        return self.producto.stock
+
+    def test_reintento_devuelve_la_respuesta_guardada(self):
+        primera = self._crear("alta-1")
+        self.assertEqual(primera.status_code, 201, primera.content)
+        self.assertNotIn("Idempotent-Replayed", primera)
+
+        repetida = self._crear("alta-1")
+        self.assertEqual(repetida.status_code, 201)
+        self.assertEqual(repetida["Idempotent-Replayed"], "true")
+        self.assertEqual(repetida.json(), primera.json())
+        self.assertEqual(NotaPedido.objects.count(), 1)
+        self.assertEqual(self._stock(), 5)
+
+        # otra clave sí crea otra nota
+        self.assertEqual(self._crear("alta-2").status_code, 201)
+        self.assertEqual(NotaPedido.objects.count(), 2)
+        self.assertEqual(self._stock(), 10)
+
+    def test_otro_cuerpo_con_la_misma_clave_es_422(self):
+        self._crear("alta-1")
+        respuesta = self._crear("alta-1", cantidad=7)
+        self.assertEqual(respuesta.status_code, 422)
+        self.assertEqual(NotaPedido.objects.count(), 1)
+        self.assertEqual(self._stock(), 5)
+
+    def test_los_errores_5xx_no_se_guardan(self):
+        with mock.patch("gestion.views._crear_nota", side_effect=RuntimeError("caída")):
+            self.assertEqual(self._crear("alta-1").status_code, 500)
+        self.assertFalse(ClaveIdempotencia.objects.exists())
+        self.assertEqual(self._crear("alta-1").status_code, 201)
+        self.assertEqual(self._stock(), 5)
+
+    def test_clave_en_curso_es_409(self):
+        # reservada por otro request que aún no terminó (sin respuesta guardada)
+        self._crear("alta-1")
+        ClaveIdempotencia.objects.update(estado=None, cuerpo=b"")
+        respuesta = self._crear("alta-1")
+        self.assertEqual(respuesta.status_code, 409)
+        self.assertEqual(respuesta["Retry-After"], "1")
+        self.assertEqual(NotaPedido.objects.count(), 1)
+
+    def test_clave_depurada_tras_perder_el_insert(self):
+        # otro request tenía la clave al hacer el INSERT, pero la depuraron antes de leerla
+        crear = ClaveIdempotencia.objects.create
+        intentos = []
+
+        def insert_perdido(**campos):
+            intentos.append(campos)
+            if len(intentos) == 1:
+                raise IntegrityError("UNIQUE constraint failed")
+            return crear(**campos)
+
+        with mock.patch.object(ClaveIdempotencia.objects, "create", side_effect=insert_perdido):
+            self.assertEqual(self._crear("alta-1").status_code, 201)
+        self.assertEqual(len(intentos), 2)
+        self.assertEqual(NotaPedido.objects.count(), 1)
+
+        with mock.patch.object(ClaveIdempotencia.objects, "create", side_effect=IntegrityError("UNIQUE")):
+            respuesta = self._crear("alta-2")
+        self.assertEqual(respuesta.status_code, 409)
+        self.assertEqual(respuesta["Retry-After"], "1")
+        self.assertEqual(NotaPedido.objects.count(), 1)
+
+    def test_borrado_en_lote_repetido_no_vuelve_a_borrar(self):
+        ids = [self._crear(f"alta-{i}").json()["nota_id"] for i in range(2)]
+        cuerpo = json.dumps({"ids": ids})
+        primera = self.client.post("/api/notas/eliminar/", cuerpo, content_type="application/json", HTTP_IDEMPOTENCY_KEY="baja")
+        self.assertEqual(primera.json()["eliminadas"], 2)
+
+        repetida = self.client.post("/api/notas/eliminar/", cuerpo, content_type="application/json", HTTP_IDEMPOTENCY_KEY="baja")
+        self.assertEqual(repetida["Idempotent-Replayed"], "true")
+        self.assertEqual(repetida.json(), primera.json())
+        self.assertEqual(Eliminacion.objects.filter(modelo="nota").count(), 2)
+        self.assertEqual(self._stock(), 0)
+
+    def test_claves_vencidas_se_depuran(self):
+        self._crear("vieja")
+        ClaveIdempotencia.objects.update(creada=timezone.now() - timedelta(hours=25))
+
+        # vencida pero sin depurar: cuenta como nueva
+        self.assertNotIn("Idempotent-Replayed", self._crear("vieja"))
+        self.assertEqual(NotaPedido.objects.count(), 2)
+
+        ClaveIdempotencia.objects.update(creada=timezone.now() - timedelta(hours=25))
+        with mock.patch.object(idempotencia, "DEPURAR_CADA", 1):
+            self._crear("nueva")
+        self.assertEqual(ClaveIdempotencia.objects.count(), 1)
+        self.assertEqual(idempotencia.depurar(timezone.now() + timedelta(hours=25)), 1)
+        self.assertFalse(ClaveIdempotencia.objects.exists())
+
+
+@override_settings(ALERTAS_STOCK_ARCHIVO="", CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+class IdempotenciaConcurrenteTests(TransactionTestCase):
+    """Dos requests con la misma clave a la vez: el segundo no ejecuta la vista."""
+
+    def setUp(self):
+        # TransactionTestCase vacía las tablas: el almacén de la migración puede no estar
+        if Almacen.principal() is None:
+            Almacen.objects.create(nombre="Principal")
+        self.proveedor = Proveedor.objects.create(nombre="Proveedor")
+        self.producto = Producto.objects.create(nombre="Tornillo", proveedor=self.proveedor)
+
+    def test_misma_clave_en_curso_es_409(self):
+        from . import views
+        cuerpo = json.dumps({"tipo": "entrada", "proveedor": self.proveedor.id,
+                             "items": [{"producto": self.producto.id, "cantidad": 5}]})
+        dentro, soltar = threading.Event(), threading.Event()
+        original = views._crear_nota
+        respuestas = {}
+
+        def lenta(datos):
+            dentro.set()
+            soltar.wait(10)
+            return original(datos)
+
+        def enviar(nombre):
+            try:
+                respuestas[nombre] = Client(HTTP_AUTHORIZATION=AUTH).post(
+                    "/api/notas/crear/", cuerpo, content_type="application/json", HTTP_IDEMPOTENCY_KEY="alta")
+            finally:
+                connection.close()
+
+        with mock.patch.object(views, "_crear_nota", lenta):
+            primero = threading.Thread(target=enviar, args=("primero",))
+            primero.start()
+            self.assertTrue(dentro.wait(10))
+            enviar("segundo")  # la clave está reservada en la transacción del primero
+            soltar.set()
+            primero.join()
+
+        self.assertEqual(respuestas["primero"].status_code, 201, respuestas["primero"].content)
+        self.assertEqual(respuestas["segundo"].status_code, 409)
+        self.assertEqual(respuestas["segundo"]["Retry-After"], "1")
+
+        tercero = Client(HTTP_AUTHORIZATION=AUTH).post(
+            "/api/notas/crear/", cuerpo, content_type="application/json", HTTP_IDEMPOTENCY_KEY="alta")
+        self.assertEqual(tercero["Idempotent-Replayed"], "true")
+        self.assertEqual(tercero.json(), respuestas["primero"].json())
+        self.assertEqual(NotaPedido.objects.count(), 1)
+        self.producto.refresh_from_db()
+        self.assertEqual(self.producto.stock, 5)
+
+
+@override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}},
+                   ADMISION_ACTIVA=True, ADMISION_PROXY=False,
+                   ADMISION={"listado": {"tasa": 0.5, "rafaga": 2, "concurrencia": 1, "cola": 0, "espera": 3}})
+class AdmisionTests(TestCase):
+    def setUp(self):
+        self.client.defaults["HTTP_AUTHORIZATION"] = AUTH
+        # las clases se construyen una vez por proceso: que tomen los settings de este test
+        admision._clases.clear()
+        self.addCleanup(admision._clases.clear)
+
+    def _listar(self, **headers):
+        return self.client.get("/api/notas/", REMOTE_ADDR="10.0.0.1", **headers)
+
+    def test_cubeta_vacia_es_429_con_retry_after(self):
+        self.assertEqual([self._listar().status_code for _ in range(2)], [200, 200])
+        respuesta = self._listar()
+        self.assertEqual(respuesta.status_code, 429)
+        self.assertEqual(respuesta["Retry-After"], "2")  # 1 ficha a 0.5 por segundo
+        # otro cliente tiene su propia cubeta
+        self.assertEqual(self.client.get("/api/notas/", REMOTE_ADDR="10.0.0.2").status_code, 200)
+
+    def test_la_cubeta_se_repone_con_el_tiempo(self):
+        cubeta = admision.Cubeta(tasa=0.5, rafaga=2)
+        with mock.patch("gestion.admision.time.monotonic", return_value=100.0) as reloj:
+            self.assertEqual([cubeta.tomar("a"), cubeta.tomar("a")], [0, 0])
+            self.assertEqual(cubeta.tomar("a"), 2.0)
+            reloj.return_value = 101.0
+            self.assertEqual(cubeta.tomar("a"), 1.0)   # media ficha repuesta
+            reloj.return_value = 102.0
+            self.assertEqual(cubeta.tomar("a"), 0)
+
+    def test_x_forwarded_for_se_ignora_sin_proxy(self):
+        for ip in ("1.1.1.1", "2.2.2.2"):
+            self.assertEqual(self._listar(HTTP_X_FORWARDED_FOR=ip).status_code, 200)
+        # cambiar el header no da fichas nuevas: cuenta REMOTE_ADDR
+        self.assertEqual(self._listar(HTTP_X_FORWARDED_FOR="3.3.3.3").status_code, 429)
+
+        with self.settings(ADMISION_PROXY=True):
+            self.assertEqual(self._listar(HTTP_X_FORWARDED_FOR="3.3.3.3, 10.0.0.1").status_code, 200)
+            self.assertEqual(admision.cliente(mock.Mock(headers={"X-Forwarded-For": "3.3.3.3, 10.0.0.1"})), "3.3.3.3")
+
+    def test_sin_lugar_ni_cola_es_429(self):
+        limite = admision.clase("listado").limite
+        self.assertTrue(async_to_sync(limite.entrar)())   # otro request ocupa el único lugar
+        try:
+            respuesta = self._listar()
+        finally:
+            limite.salir()
+        self.assertEqual(respuesta.status_code, 429)
+        self.assertEqual(respuesta["Retry-After"], "3")
+        self.assertEqual(self._listar().status_code, 200)
+
+    def test_la_espera_en_cola_vence(self):
+        limite = admision.Limite(maximo=1, cola=1, espera=0.05)
+
+        async def escenario():
+            self.assertTrue(await limite.entrar())
+            en_cola = asyncio.ensure_future(limite.entrar())
+            await asyncio.sleep(0)
+            self.assertFalse(await limite.entrar())   # cola llena: rechazo inmediato
+            self.assertFalse(await en_cola)           # venció la espera
+            self.assertEqual(len(limite._esperando), 0)
+            limite.salir()
+            self.assertEqual(limite._en_curso, 0)
+
+            # al salir, el lugar pasa directo al que espera
+            self.assertTrue(await limite.entrar())
+            limite.espera = 5
+            en_cola = asyncio.ensure_future(limite.entrar())
+            await asyncio.sleep(0)
+            limite.salir()
+            self.assertTrue(await en_cola)
+            self.assertEqual(limite._en_curso, 1)
+            limite.salir()
+            self.assertEqual(limite._en_curso, 0)
+
+        asyncio.run(escenario())
+
+
+class HuellaTests(SimpleTestCase):
+    """Normalización de perfil_sql.huella: la misma consulta con otros valores da la misma huella."""
+
+    def assertMisma(self, *sentencias, normal=None):
+        huellas = {huella(sql) for sql in sentencias}
+        self.assertEqual(len(huellas), 1, huellas)
+        if normal is not None:
+            self.assertEqual(huellas.pop()[1], normal)
+
+    def test_literales(self):
+        self.assertMisma(
+            "SELECT * FROM t WHERE nombre = 'Perno' AND stock > 10 AND precio < 2.50",
+            "SELECT * FROM t WHERE nombre = 'O''Brien, 3' AND stock > -4 AND precio < 7",
+            normal="SELECT * FROM t WHERE nombre = ? AND stock > ? AND precio < ?",
+        )
+        # los dígitos de identificadores no son literales
+        self.assertEqual(huella('SELECT "t1"."col2" FROM gestion_t1 LIMIT 21')[1], 'SELECT "t1"."col2" FROM gestion_t1 LIMIT ?')
+
+    def test_listas_in_y_filas_values(self):
+        self.assertMisma(
+            "SELECT * FROM t WHERE id IN (%s)",
+            "SELECT * FROM t WHERE id IN (%s, %s, %s)",
+            "SELECT * FROM t WHERE id IN (1, 2, 3, 4)",
+            normal="SELECT * FROM t WHERE id IN (...)",
+        )
+        self.assertMisma(
+            "INSERT INTO t (a, b) VALUES (%s, %s)",
+            "INSERT INTO t (a, b) VALUES (%s, %s), (%s, %s), (%s, %s)",
+            normal="INSERT INTO t (a, b) VALUES (...)",
+        )
+        self.assertNotEqual(huella("SELECT * FROM t WHERE id IN (%s)")[0], huella("SELECT * FROM u WHERE id IN (%s)")[0])
+
+    def test_case_de_bulk_update(self):
+        def case(n, cast=False):
+            valor = "(CAST({} AS integer))" if cast else "{}"
+            casos = " ".join(f'WHEN ("t"."id" = {i}) THEN {valor.format(i * 3)}' for i in range(1, n + 1))
+            return f"UPDATE t SET s = CASE {casos} ELSE NULL END"
+
+        self.assertMisma(case(2), case(40), normal='UPDATE t SET s = CASE WHEN ("t"."id" = ?) THEN ? ... ELSE NULL END')
+        self.assertMisma(case(2, cast=True), case(40, cast=True))
+        # como la ve el execute_wrapper: con %s en lugar de los valores
+        self.assertMisma(case(2).replace("= 1", "= %s").replace("THEN 3", "THEN %s"),
+                         'UPDATE t SET s = CASE WHEN ("t"."id" = %s) THEN %s WHEN ("t"."id" = %s) THEN %s '
+                         'WHEN ("t"."id" = %s) THEN %s ELSE NULL END',
+                         normal='UPDATE t SET s = CASE WHEN ("t"."id" = %s) THEN %s ... ELSE NULL END')
+
+    def test_savepoints_y_espacios(self):
+        self.assertMisma('SAVEPOINT "s140_x1"', 'SAVEPOINT "s2_x99"', normal='SAVEPOINT "?"')
+        self.assertMisma("SELECT a\n   FROM  t ", "SELECT a FROM t", normal="SELECT a FROM t")
+
+
+@override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}},
+                   PERFILAR_TOKEN="secreto")
+class PerfiladorTests(TestCase):
+    def setUp(self):
+        self.client.defaults["HTTP_AUTHORIZATION"] = AUTH
+        carpeta = tempfile.TemporaryDirectory()
+        self.addCleanup(carpeta.cleanup)
+        self.enterContext(self.settings(PERFILAR_DIR=carpeta.name))
+
+    def _perfilado(self, **headers):
+        return "X-Perfil" in self.client.get("/api/productos/", HTTP_X_PERFILAR="cprofile", **headers)
+
+    def test_solo_con_token_o_staff(self):
+        from django.contrib.auth.models import User
+        self.assertNotIn("X-Perfil", self.client.get("/api/productos/", HTTP_X_PERFILAR_TOKEN="secreto"))
+        self.assertFalse(self._perfilado())
+        self.assertFalse(self._perfilado(HTTP_X_PERFILAR_TOKEN="secret"))
+        self.assertFalse(self._perfilado(HTTP_X_PERFILAR_TOKEN="secreto-y-mas"))
+        self.assertTrue(self._perfilado(HTTP_X_PERFILAR_TOKEN="secreto"))
+        with self.settings(PERFILAR_TOKEN=""):
+            self.assertFalse(self._perfilado(HTTP_X_PERFILAR_TOKEN=""))
+
+        self.client.force_login(User.objects.create_user("operario"))
+        self.assertFalse(self._perfilado())
+        self.client.force_login(User.objects.create_user("jefe", is_staff=True))
+        self.assertTrue(self._perfilado())
+
+    @override_settings(SQL_PERFIL=False)
+    def test_registra_las_consultas_sin_perfil_sql(self):
+        Producto.objects.create(nombre="Tornillo", proveedor=Proveedor.objects.create(nombre="Proveedor"))
+        self.assertFalse(any(w is perfil_sql.capturar for w in connection.execute_wrappers))
+        sincrono = self.client.get("/api/productos/", HTTP_X_PERFILAR="cprofile", HTTP_X_PERFILAR_TOKEN="secreto")
+        asincrono = async_to_sync(AsyncClient().get)(
+            "/api/productos/", headers={"Authorization": AUTH, "X-Perfilar": "cprofile", "X-Perfilar-Token": "secreto"})
+        for respuesta in (sincrono, asincrono):
+            consultas = int(re.search(r'desc="(\d+) consultas"', respuesta["Server-Timing"]).group(1))
+            self.assertGreater(consultas, 0)
+        # se quita al terminar el request
+        self.assertFalse(any(w is perfil_sql.capturar for w in connection.execute_wrappers))
+
+    def test_muestreos_simultaneos_restauran_el_intervalo_al_final(self):
+        original = sys.getswitchinterval()
+        uno, dos = perfilador.Muestreador(0.0005), perfilador.Muestreador(0.0002)
+        uno.iniciar()
+        dos.iniciar()
+        self.assertAlmostEqual(sys.getswitchinterval(), 0.0002)
+        uno.detener()
+        self.assertAlmostEqual(sys.getswitchinterval(), 0.0002)  # dos sigue muestreando
+        dos.detener()
+        self.assertEqual(sys.getswitchinterval(), original)
+
+
+class WhiteNoiseAsyncTests(SimpleTestCase):
+    """
+    AsyncWhiteNoiseMiddleware repite la búsqueda de WhiteNoise (find_file, files,
+    serve): si una versión nueva de WhiteNoise la cambia, falla aquí.
+    """
+
+    def setUp(self):
+        carpeta = tempfile.TemporaryDirectory()
+        self.addCleanup(carpeta.cleanup)
+        self.raiz = Path(carpeta.name)
+        self.css = b"".join(b".c%d { color: red; }\n" % i for i in range(200))
+        (self.raiz / "app.css").write_bytes(self.css)
+        (self.raiz / "app.css.gz").write_bytes(gzip.compress(self.css))
+
+    def _middleware(self, **ajustes):
+        async def vista(request):
+            return HttpResponse("vista")
+
+        with self.settings(STATIC_ROOT=str(self.raiz), **ajustes):
+            middleware = AsyncWhiteNoiseMiddleware(vista)
+        self.assertTrue(asyncio.iscoroutinefunction(middleware))
+        return middleware
+
+    def _get(self, middleware, ruta, **headers):
+        respuesta = async_to_sync(middleware)(AsyncRequestFactory().get(ruta, headers=headers))
+        cuerpo = b"".join(respuesta.streaming_content) if respuesta.streaming else respuesta.content
+        return respuesta, cuerpo
+
+    def test_sirve_el_estatico_sin_pasar_por_la_vista(self):
+        middleware = self._middleware(WHITENOISE_AUTOREFRESH=False)
+        respuesta, cuerpo = self._get(middleware, "/static/app.css")
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(cuerpo, self.css)
+        self.assertTrue(respuesta["Content-Type"].startswith("text/css"))
+        self.assertEqual(respuesta["Content-Length"], str(len(cuerpo)))
+        self.assertIn("max-age=", respuesta["Cache-Control"])
+        self.assertIn("Last-Modified", respuesta)
+
+        respuesta, cuerpo = self._get(middleware, "/static/app.css", **{"Accept-Encoding": "gzip"})
+        self.assertEqual(respuesta["Content-Encoding"], "gzip")
+        self.assertEqual(gzip.decompress(cuerpo), self.css)
+        self.assertIn("Accept-Encoding", respuesta["Vary"])
+
+        # lo que no es un estático sigue a la vista
+        respuesta, cuerpo = self._get(middleware, "/api/productos/")
+        self.assertEqual(cuerpo, b"vista")
+        self.assertEqual(self._get(middleware, "/static/no-existe.css")[1], b"vista")
+
+    def test_con_autorefresh_encuentra_archivos_nuevos(self):
+        middleware = self._middleware(WHITENOISE_AUTOREFRESH=True, WHITENOISE_USE_FINDERS=False)
+        (self.raiz / "nuevo.js").write_text("console.log(1);\n")
+        respuesta, cuerpo = self._get(middleware, "/static/nuevo.js")
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(cuerpo, b"console.log(1);\n")
+
+
+@override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+class VistasAsyncTests(TestCase):
+    """Las APIs de lectura son async (ORM async): se llaman por AsyncClient, como bajo ASGI."""
+
+    def setUp(self):
+        Almacen.principal()
+        self.proveedor = Proveedor.objects.create(nombre="Proveedor", dias_entrega=3)
+        self.producto = Producto.objects.create(nombre="Tornillo", proveedor=self.proveedor)
+        nota = NotaPedido.objects.create(tipo="Entrada", proveedor=self.proveedor, orden_compra="OC-1")
+        NotaPedidoItem.objects.create(nota=nota, producto=self.producto, cantidad=4)
+        self.nota = nota
+
+    def test_las_apis_de_lectura_son_async(self):
+        for vista in (views.api_proveedores, views.api_productos, views.api_notas_list, views.api_sync):
+            self.assertTrue(asyncio.iscoroutinefunction(vista), vista.__name__)
+
+    async def test_lectura_y_alta_por_asgi(self):
+        cliente = AsyncClient()
+
+        async def pedir(metodo, ruta, **kwargs):
+            return await getattr(cliente, metodo)(ruta, headers={"Authorization": AUTH}, **kwargs)
+
+        respuesta = await pedir("get", "/api/proveedores/")
+        self.assertEqual(respuesta.json(), [{"id": self.proveedor.id, "nombre": "Proveedor", "dias_entrega": 3}])
+
+        # el POST pasa por sync_to_async
+        respuesta = await pedir("post", "/api/proveedores/", data=json.dumps({"nombre": "Otro"}),
+                                content_type="application/json")
+        self.assertEqual(respuesta.status_code, 201, respuesta.content)
+        self.assertEqual(await Proveedor.objects.acount(), 2)
+
+        notas = (await pedir("get", "/api/notas/", query_params={"q": "OC-1"})).json()
+        self.assertEqual([n["id"] for n in notas], [self.nota.id])
+        self.assertEqual([(i["producto"], i["cantidad"]) for i in notas[0]["items"]], [(self.producto.id, 4)])
+
+        productos = (await pedir("get", "/api/productos/", query_params={"fields": "id,nombre"})).json()
+        self.assertEqual(productos["results"], [{"id": self.producto.id, "nombre": "Tornillo"}])
+
+
+@override_settings(ALERTAS_STOCK_ARCHIVO="", CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+class AlmacenesTests(TestCase):
+    def setUp(self):
+        self.client.defaults["HTTP_AUTHORIZATION"] = AUTH
+        self.principal = Almacen.principal()
+        self.sucursal = Almacen.objects.create(nombre="Sucursal")
+        self.proveedor = Proveedor.objects.create(nombre="Proveedor")
+        self.producto = Producto.objects.create(nombre="Tornillo", proveedor=self.proveedor)
+
+    def _crear(self, **cuerpo):
+        cuerpo.setdefault("items", [{"producto": self.producto.id, "cantidad": 10}])
+        respuesta = self.client.post("/api/notas/crear/", json.dumps(cuerpo), content_type="application/json")
+        self.assertEqual(respuesta.status_code, 201, respuesta.content)
+        return respuesta.json()["nota_id"]
+
+    def _saldos(self):
+        self.producto.refresh_from_db()
+        saldos = dict(StockAlmacen.objects.filter(producto=self.producto).values_list("almacen_id", "stock"))
+        return self.producto.stock, saldos.get(self.principal.id, 0), saldos.get(self.sucursal.id, 0)
+
+    def test_traslado_mueve_stock_entre_almacenes_sin_cambiar_el_total(self):
+        self._crear(tipo="entrada", proveedor=self.proveedor.id)  # al almacén principal
+        traslado = self._crear(tipo="traslado", almacen=self.principal.id, almacen_destino=self.sucursal.id,
+                               items=[{"producto": self.producto.id, "cantidad": 4}])
+        self.assertEqual(self._saldos(), (10, 6, 4))
+
+        respuesta = self.client.patch(f"/api/notas/{traslado}/", json.dumps({
+            "items": [{"producto": self.producto.id, "cantidad": 7}]}), content_type="application/json")
+        self.assertEqual(respuesta.status_code, 200, respuesta.content)
+        self.assertEqual(respuesta.json()["nota"]["almacen_destino"]["nombre"], "Sucursal")
+        self.assertEqual(self._saldos(), (10, 3, 7))
+        self.assertEqual(inventario.recalcular_almacenes(), 0)
+
+        self.client.delete(f"/api/notas/{traslado}/")
+        self.assertEqual(self._saldos(), (10, 10, 0))
+
+        respuesta = self.client.get(f"/api/productos/?almacen={self.principal.id}")
+        self.assertEqual(respuesta.json()["results"][0]["stock"], 10)
+
+    def test_traslado_requiere_almacenes_distintos(self):
+        cuerpo = {"tipo": "traslado", "almacen": self.principal.id, "almacen_destino": self.principal.id,
+                  "items": [{"producto": self.producto.id, "cantidad": 1}]}
+        respuesta = self.client.post("/api/notas/crear/", json.dumps(cuerpo), content_type="application/json")
+        self.assertEqual(respuesta.status_code, 400)
+        self.assertEqual(NotaPedido.objects.count(), 0)
+
+
+@override_settings(ALERTAS_STOCK_ARCHIVO="", CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+class CierreTests(TestCase):
+    def setUp(self):
+        self.client.defaults["HTTP_AUTHORIZATION"] = AUTH
+        self.principal = Almacen.principal()
+        self.sucursal = Almacen.objects.create(nombre="Sucursal")
+        self.proveedor = Proveedor.objects.create(nombre="Proveedor")
+        self.cliente = Cliente.objects.create(nombre="Cliente")
+        self.producto = Producto.objects.create(nombre="Tornillo", proveedor=self.proveedor)
+
+    def _nota(self, dias, cantidad=10, **campos):
+        nota = NotaPedido.objects.create(fecha=timezone.now() - timedelta(days=dias), **campos)
+        NotaPedidoItem.objects.create(nota=nota, producto=self.producto, cantidad=cantidad, precio_unitario=2)
+        inventario.registrar(nota)
+        return nota
+
+    def _stock(self):
+        self.producto.refresh_from_db()
+        saldos = dict(StockAlmacen.objects.filter(producto=self.producto).values_list("almacen_id", "stock"))
+        return self.producto.stock, saldos.get(self.principal.id, 0), saldos.get(self.sucursal.id, 0)
+
+    def test_cierre_archiva_sin_cambiar_el_stock(self):
+        vieja = self._nota(400, tipo="Entrada", proveedor=self.proveedor, almacen=self.principal)
+        self._nota(390, 4, tipo="Traslado", almacen=self.principal, almacen_destino=self.sucursal)
+        self._nota(380, 3, tipo="Salida", cliente=self.cliente, almacen=self.sucursal)
+        self._nota(10, 2, tipo="Salida", cliente=self.cliente, almacen=self.principal)
+        self.assertEqual(self._stock(), (5, 4, 1))
+        movimientos = MovimientoDiario.objects.count()
+
+        hecho = cierre.cerrar(timezone.localdate() - timedelta(days=365))
+        self.assertEqual((hecho.notas, hecho.items), (3, 3))
+        self.assertEqual(NotaPedido.objects.count(), 1)
+        self.assertEqual(self._stock(), (5, 4, 1))
+        saldos = dict(SaldoInicial.objects.filter(cierre=hecho).values_list("almacen_id", "stock"))
+        self.assertEqual(saldos, {self.principal.id: 6, self.sucursal.id: 1})
+
+        # los recálculos parten del saldo inicial y el acumulado del periodo cerrado se conserva
+        self.assertEqual(inventario.recalcular(), 0)
+        self.assertEqual(inventario.recalcular_almacenes(), 0)
+        analitica.reconstruir()
+        self.assertEqual(MovimientoDiario.objects.count(), movimientos)
+
+        archivada = self.client.get(f"/api/archivo/notas/?q={vieja.numero}").json()["results"]
+        self.assertEqual(len(archivada), 1)
+        self.assertEqual(archivada[0]["proveedor"]["nombre"], "Proveedor")
+        self.assertEqual(archivada[0]["items"][0]["producto_nombre"], "Tornillo")
+        self.assertEqual(archivada[0]["cierre"], hecho.id)
+        self.assertEqual(self.client.get("/api/archivo/notas/").json()["total"], 3)
+
+    def test_cierres_sucesivos_acumulan_el_saldo(self):
+        self._nota(800, tipo="Entrada", proveedor=self.proveedor, almacen=self.principal)
+        primero = cierre.cerrar(timezone.localdate() - timedelta(days=700))
+        self._nota(400, 4, tipo="Salida", cliente=self.cliente, almacen=self.principal)
+        with self.assertRaises(ValueError):
+            cierre.cerrar(primero.fecha_corte)
+        segundo = cierre.cerrar(timezone.localdate() - timedelta(days=365))
+        self.assertEqual(Cierre.ultimo(), segundo)
+        self.assertEqual(list(segundo.saldos.values_list("stock", flat=True)), [6])
+        self.assertEqual(NotaArchivada.objects.count(), 2)
+        self.assertEqual(inventario.recalcular(), 0)
+        self.assertEqual(self._stock(), (6, 6, 0))
+
+
+class ErpDePrueba(ThreadingHTTPServer):
+    """Receptor local del outbox: responde 503 a los primeros `fallar` POST y guarda los lotes aceptados."""
+
+    def __init__(self, fallar=0):
+        self.fallar = fallar
+        self.lotes = []
+        super().__init__(("127.0.0.1", 0), _ReceptorErp)
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}/eventos"
+
+
+class _ReceptorErp(BaseHTTPRequestHandler):
+    def do_POST(self):
+        cuerpo = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        if self.server.fallar:
+            self.server.fallar -= 1
+            self.send_response(503)
+        else:
+            self.server.lotes.append(cuerpo["eventos"])
+            self.send_response(200)
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+@override_settings(ALERTAS_STOCK_ARCHIVO="", CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}},
+                   OUTBOX_LOTE=2, OUTBOX_REINTENTO_BASE=0.01)
+class OutboxTests(TestCase):
+    def setUp(self):
+        self.client.defaults["HTTP_AUTHORIZATION"] = AUTH
+        Almacen.principal()
+        self.proveedor = Proveedor.objects.create(nombre="Proveedor")
+        self.producto = Producto.objects.create(nombre="Tornillo", proveedor=self.proveedor)
+        self.erp = ErpDePrueba()
+        self.addCleanup(self.erp.server_close)
+        self.addCleanup(self.erp.shutdown)
+
+    def _escrituras(self):
+        """Crea dos notas, edita la primera y borra la segunda: cuatro eventos."""
+        ids = []
+        for cantidad in (5, 7):
+            respuesta = self.client.post("/api/notas/crear/", json.dumps({
+                "tipo": "entrada", "proveedor": self.proveedor.id,
+                "items": [{"producto": self.producto.id, "cantidad": cantidad}],
+            }), content_type="application/json")
+            ids.append(respuesta.json()["nota_id"])
+        self.client.patch(f"/api/notas/{ids[0]}/", json.dumps({"items": [{"producto": self.producto.id, "cantidad": 6}]}),
+                          content_type="application/json")
+        self.client.post("/api/notas/eliminar/", json.dumps({"ids": [ids[1]]}), content_type="application/json")
+        return ids
+
+    def test_entrega_en_orden_reintentando_los_fallos(self):
+        with self.settings(OUTBOX_URL=self.erp.url):
+            ids = self._escrituras()
+            self.erp.fallar = 2
+            with self.assertLogs("gestion.outbox", "WARNING") as registro:
+                self.assertEqual(outbox.correr(hasta_vaciar=True), 4)
+        self.assertIn("HTTP 503", registro.output[0])
+
+        eventos = [e for lote in self.erp.lotes for e in lote]
+        self.assertEqual([len(lote) for lote in self.erp.lotes], [2, 2])
+        self.assertEqual([e["id"] for e in eventos], sorted(e["id"] for e in eventos))
+        self.assertEqual([(e["tipo"], e["datos"]["id"]) for e in eventos], [
+            ("nota_creada", ids[0]), ("nota_creada", ids[1]), ("nota_modificada", ids[0]), ("nota_eliminada", ids[1]),
+        ])
+        self.assertEqual(eventos[2]["datos"]["items"], [{"producto": self.producto.id, "cantidad": 6, "precio_unitario": 0.0}])
+        # el primer lote se intentó tres veces; nada queda pendiente
+        self.assertEqual(sorted(EventoSalida.objects.values_list("intentos", flat=True)), [1, 1, 3, 3])
+        self.assertEqual(outbox.estado()["pendientes"], 0)
+
+    def test_sin_url_no_se_registra(self):
+        self._escrituras()
+        self.assertFalse(EventoSalida.objects.exists())
+
+
+class RespaldoTests(SimpleTestCase):
+    """Respaldo por pasos de un archivo SQLite mientras otro hilo escribe."""
+
+    def setUp(self):
+        carpeta = tempfile.TemporaryDirectory()
+        self.addCleanup(carpeta.cleanup)
+        self.carpeta = Path(carpeta.name)
+        self.base = self.carpeta / "base.sqlite3"
+        with sqlite3.connect(self.base) as conexion:
+            conexion.execute("CREATE TABLE movimiento (id INTEGER PRIMARY KEY, relleno TEXT)")
+            conexion.executemany("INSERT INTO movimiento (relleno) VALUES (?)", [("x" * 500,)] * 2000)
+
+    def _contar(self, ruta):
+        conexion = sqlite3.connect(ruta)
+        try:
+            return conexion.execute("SELECT count(*) FROM movimiento").fetchone()[0]
+        finally:
+            conexion.close()
+
+    def test_copia_consistente_con_escrituras_en_curso(self):
+        detener = threading.Event()
+
+        def escribir():
+            conexion = sqlite3.connect(self.base, timeout=10)
+            while not detener.is_set():
+                with conexion:  # dos filas por transacción: una copia consistente tiene una cantidad par
+                    conexion.executemany("INSERT INTO movimiento (relleno) VALUES (?)", [("y" * 500,)] * 2)
+                time.sleep(0.001)
+            conexion.close()
+
+        escritor = threading.Thread(target=escribir)
+        escritor.start()
+        try:
+            copia = self.carpeta / "copia.sqlite3"
+            info = respaldo.copiar_sqlite(self.base, copia, paginas=20, pausa=0.002, reintentos=2)
+        finally:
+            detener.set()
+            escritor.join()
+
+        self.assertEqual(info["de_una_vez"], info["reinicios"] > 2)
+        self.assertTrue(respaldo.verificar_sqlite(copia)["ok"])
+        filas = self._contar(copia)
+        self.assertEqual(filas % 2, 0)
+        self.assertTrue(2000 <= filas <= self._contar(self.base))
+
+    def test_verificar_y_restaurar_comprimido(self):
+        copia = self.carpeta / "copia.sqlite3"
+        info = respaldo.copiar_sqlite(self.base, copia, paginas=20, pausa=0)
+        self.assertEqual((info["reinicios"], info["de_una_vez"]), (0, False))
+        self.assertGreater(info["pasos"], 10)
+        comprimido = self.carpeta / "copia.sqlite3.gz"
+        respaldo._comprimir(copia, comprimido)
+        self.assertTrue(respaldo.verificar(comprimido)["ok"])
+
+        with sqlite3.connect(self.base) as conexion:
+            conexion.execute("DELETE FROM movimiento")
+        with respaldo._descomprimido(comprimido) as plano:
+            respaldo.restaurar_sqlite(plano, self.base)
+        self.assertEqual(self._contar(self.base), 2000)
+
+        roto = self.carpeta / "roto.sqlite3.gz"
+        with gzip.open(roto, "wb") as f:
+            f.write(copia.read_bytes()[:4096] + b"\0" * 4096)
+        self.assertFalse(respaldo.verificar(roto)["ok"])
+
+
+@override_settings(ALERTAS_STOCK_ARCHIVO="", CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}},
+                   ESCRITURA_AGRUPADA=True, ESCRITURA_ESPERA_MS=200, ESCRITURA_LOTE_MAX=50)
+class EscrituraAgrupadaTests(TransactionTestCase):
+    """El hilo escritor usa su propia conexión: hace falta que los datos estén confirmados."""
+
+    def setUp(self):
+        Almacen.principal()
+        self.proveedor = Proveedor.objects.create(nombre="Proveedor")
+        self.producto = Producto.objects.create(nombre="Tornillo", proveedor=self.proveedor)
+
+    def _rafaga(self, cuerpos):
+        respuestas = [None] * len(cuerpos)
+        largada = threading.Barrier(len(cuerpos))
+
+        def enviar(i):
+            cliente = Client(HTTP_AUTHORIZATION=AUTH)
+            largada.wait()
+            respuestas[i] = cliente.post("/api/notas/crear/", json.dumps(cuerpos[i]), content_type="application/json")
+
+        hilos = [threading.Thread(target=enviar, args=(i,)) for i in range(len(cuerpos))]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+        return respuestas
+
+    def test_rafaga_en_pocos_commits_con_resultado_por_request(self):
+        cuerpos = [{"tipo": "entrada", "proveedor": self.proveedor.id,
+                    "items": [{"producto": self.producto.id, "cantidad": 1 + i}]} for i in range(8)]
+        cuerpos.append({"tipo": "entrada", "proveedor": self.proveedor.id, "items": [{"producto": 999, "cantidad": 1}]})
+        lotes = escritor.escritor.lotes
+
+        respuestas = self._rafaga(cuerpos)
+
+        self.assertEqual([r.status_code for r in respuestas], [201] * 8 + [400])
+        self.assertEqual(respuestas[-1].json()["error"], "Producto no existe")
+        ids = [r.json()["nota_id"] for r in respuestas[:-1]]
+        self.assertEqual(len(set(ids)), 8)
+        self.assertEqual(sorted(NotaPedido.objects.values_list("id", flat=True)), sorted(ids))
+        self.producto.refresh_from_db()
+        self.assertEqual(self.producto.stock, sum(range(1, 9)))
+        self.assertLessEqual(escritor.escritor.lotes - lotes, 2)
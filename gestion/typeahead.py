@@ -0,0 +1,208 @@
+"""
+Índice en memoria para el autocompletado de productos.
+
+Cada proceso (worker de gunicorn) mantiene su propio índice de prefijos sobre
+nombre, código y proveedor. Se construye perezosamente en la primera búsqueda,
+se actualiza de forma incremental con las señales de Producto/Proveedor
+(ver signals.py) y se reconstruye completo cada TYPEAHEAD_TTL segundos para
+recoger escrituras hechas en otros workers.
+
+El stock no se indexa (cambia con cada nota): se lee de Producto.stock en una
+sola query solo para los k resultados devueltos.
+"""
+import heapq
+import re
+import threading
+import time
+import unicodedata
+from bisect import bisect_left, insort
+
+from django.conf import settings
+
+from .models import Producto
+
+_SEPARADOR = re.compile(r"[^0-9a-z]+")
+_TRAMOS_CODIGO = re.compile(r"[a-z]+|[0-9]+")
+
+
+def normalizar(texto):
+    """Minúsculas y sin tildes: 'Galón' -> 'galon'."""
+    texto = unicodedata.normalize("NFKD", str(texto or "").lower())
+    return "".join(c for c in texto if not unicodedata.combining(c))
+
+
+def _tokens(entrada):
+    nombre = normalizar(entrada["nombre"])
+    codigo = normalizar(entrada["codigo"])
+    proveedor = normalizar(entrada["proveedor_nombre"])
+    tokens = set(_SEPARADOR.split(nombre)) | set(_SEPARADOR.split(proveedor))
+    if codigo:
+        # el código completo y sus tramos: 'm1pro001' -> m, 1, pro, 001
+        tokens.add(codigo.replace(" ", ""))
+        tokens.update(_TRAMOS_CODIGO.findall(codigo))
+    tokens.discard("")
+    return tokens
+
+
+def _entrada(p):
+    return {
+        "id": p["id"],
+        "nombre": p["nombre"],
+        "codigo": p["codigo"],
+        "unidad": p["unidad"],
+        "adquisicion": p["adquisicion"],
+        "precio": float(p["precio"]),
+        "peso": float(p["peso"]),
+        "proveedor": p["proveedor_id"],
+        "proveedor_nombre": p["proveedor__nombre"],
+        "stock_minimo": p["stock_minimo"],
+    }
+
+
+_CAMPOS = ("id", "nombre", "codigo", "unidad", "adquisicion", "precio", "peso",
+           "proveedor_id", "proveedor__nombre", "stock_minimo")
+
+
+class IndiceProductos:
+    def __init__(self, ttl=None):
+        self._lock = threading.RLock()
+        self._ttl = ttl
+        self._construido_en = None
+        self._entradas = {}      # id -> dict con los campos de la API
+        self._tokens = {}        # id -> set(tokens)
+        self._orden = {}         # id -> (nombre, codigo) normalizados, para el ranking
+        self._claves = []        # lista ordenada de (token, id)
+        self._por_proveedor = {}  # proveedor_id -> set(ids)
+
+    @property
+    def ttl(self):
+        if self._ttl is not None:
+            return self._ttl
+        return getattr(settings, "TYPEAHEAD_TTL", 300)
+
+    # ---------- construcción ----------
+    def construir(self):
+        filas = Producto.objects.values(*_CAMPOS)
+        entradas = {p["id"]: _entrada(p) for p in filas}
+        tokens = {pid: _tokens(e) for pid, e in entradas.items()}
+        orden = {pid: (normalizar(e["nombre"]), normalizar(e["codigo"])) for pid, e in entradas.items()}
+        claves = sorted((t, pid) for pid, ts in tokens.items() for t in ts)
+        por_proveedor = {}
+        for pid, e in entradas.items():
+            por_proveedor.setdefault(e["proveedor"], set()).add(pid)
+        with self._lock:
+            self._entradas = entradas
+            self._tokens = tokens
+            self._orden = orden
+            self._claves = claves
+            self._por_proveedor = por_proveedor
+            self._construido_en = time.monotonic()
+
+    def _asegurar(self):
+        if self._construido_en is None or time.monotonic() - self._construido_en > self.ttl:
+            self.construir()
+
+    def invalidar(self):
+        with self._lock:
+            self._construido_en = None
+
+    # ---------- mantenimiento incremental ----------
+    def _quitar(self, pid):
+        for t in self._tokens.pop(pid, ()):
+            i = bisect_left(self._claves, (t, pid))
+            if i < len(self._claves) and self._claves[i] == (t, pid):
+                del self._claves[i]
+        self._orden.pop(pid, None)
+        entrada = self._entradas.pop(pid, None)
+        if entrada:
+            self._por_proveedor.get(entrada["proveedor"], set()).discard(pid)
+
+    def _poner(self, entrada):
+        pid = entrada["id"]
+        self._entradas[pid] = entrada
+        self._tokens[pid] = _tokens(entrada)
+        self._orden[pid] = (normalizar(entrada["nombre"]), normalizar(entrada["codigo"]))
+        for t in self._tokens[pid]:
+            insort(self._claves, (t, pid))
+        self._por_proveedor.setdefault(entrada["proveedor"], set()).add(pid)
+
+    def producto_guardado(self, producto_id):
+        with self._lock:
+            if self._construido_en is None:
+                return
+            fila = Producto.objects.filter(id=producto_id).values(*_CAMPOS).first()
+            self._quitar(producto_id)
+            if fila:
+                self._poner(_entrada(fila))
+
+    def producto_eliminado(self, producto_id):
+        with self._lock:
+            if self._construido_en is not None:
+                self._quitar(producto_id)
+
+    def proveedor_guardado(self, proveedor_id, nombre):
+        with self._lock:
+            if self._construido_en is None:
+                return
+            for pid in list(self._por_proveedor.get(proveedor_id, ())):
+                entrada = dict(self._entradas[pid], proveedor_nombre=nombre)
+                self._quitar(pid)
+                self._poner(entrada)
+
+    # ---------- búsqueda ----------
+    def _ids_con_prefijo(self, prefijo):
+        ids = set()
+        i = bisect_left(self._claves, (prefijo,))
+        while i < len(self._claves) and self._claves[i][0].startswith(prefijo):
+            ids.add(self._claves[i][1])
+            i += 1
+        return ids
+
+    def buscar(self, q, k=10):
+        """Devuelve hasta k entradas cuyos tokens empiezan por cada término de q."""
+        self._asegurar()
+        terminos = [t for t in _SEPARADOR.split(normalizar(q)) if t]
+        with self._lock:
+            if not terminos:
+                ids = self._entradas.keys()
+            else:
+                ids = None
+                # los términos más largos primero: conjuntos más chicos
+                for t in sorted(terminos, key=len, reverse=True):
+                    encontrados = self._ids_con_prefijo(t)
+                    ids = encontrados if ids is None else ids & encontrados
+                    if not ids:
+                        return []
+
+            q_norm = " ".join(terminos)
+            orden = self._orden
+
+            def rango(pid):
+                nombre, codigo = orden[pid]
+                palabras = _SEPARADOR.split(nombre)
+                return (
+                    0 if codigo and codigo == q_norm else 1,
+                    0 if nombre.startswith(q_norm) else 1,
+                    -sum(1 for t in terminos if t in palabras),  # términos completos primero
+                    nombre,
+                    pid,
+                )
+
+            return [dict(self._entradas[pid]) for pid in heapq.nsmallest(k, ids, key=rango)]
+
+
+def stock_de(producto_ids):
+    """Stock actual de los productos indicados en una sola consulta."""
+    return dict(Producto.objects.filter(id__in=producto_ids).values_list("id", "stock"))
+
+
+indice = IndiceProductos()
+
+
+def buscar_productos(q, k=10):
+    resultados = indice.buscar(q, k)
+    if resultados:
+        stock = stock_de([r["id"] for r in resultados])
+        for r in resultados:
+            r["stock"] = stock.get(r["id"], 0)
+    return resultados
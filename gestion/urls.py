@@ -29,16 +29,39 @@ urlpatterns = [
     path("api/clientes/", views.api_clientes, name="api_clientes"),                          # GET, POST
     path("api/clientes/<int:cliente_id>/", views.api_cliente_delete, name="api_cliente_delete"),          # DELETE  <-- NUEVO
 
+    # APIs Almacenes (sedes)
+    path("api/almacenes/", views.api_almacenes, name="api_almacenes"),                       # GET, POST
+
     # APIs Productos
     path("api/productos/", views.api_productos, name="api_productos"),
+    path("api/productos/buscar/", views.api_productos_buscar, name="api_productos_buscar"),  # GET (autocompletado)
+    path("api/productos/alertas/", views.api_productos_alertas, name="api_productos_alertas"),  # GET (bajo stock mínimo)
     path("api/productos/crear/", views.api_producto_crear, name="api_producto_crear"),
     path("api/productos/<int:producto_id>/editar/", views.api_producto_editar, name="api_producto_editar"),
 
     # APIs Notas
     path("api/notas/", views.api_notas_list, name="api_notas_list"),          # GET
     path("api/notas/crear/", views.api_notas_crear, name="api_notas_crear"),  # POST
-    path("api/notas/<int:nota_id>/", views.api_notas_delete, name="api_notas_delete"),  # DELETE
+    path("api/notas/eliminar/", views.api_notas_eliminar, name="api_notas_eliminar"),  # POST (varias)
+    path("api/notas/<int:nota_id>/", views.api_nota_detalle, name="api_nota_detalle"),  # PUT, PATCH, DELETE
 
     path("api/notas/export/pdf/", views.api_notas_export_pdf, name="api_notas_export_pdf"),
 
+    # Sincronización por diferencias (productos, proveedores, clientes, notas)
+    path("api/sync/", views.api_sync, name="api_sync"),  # GET ?since=<token>
+    path("api/eventos/", views.api_eventos, name="api_eventos"),  # GET (Server-Sent Events)
+
+    # APIs Analítica (acumulado diario de movimientos)
+    path("api/analitica/movimientos/", views.api_analitica_movimientos, name="api_analitica_movimientos"),  # GET
+    path("api/analitica/top/", views.api_analitica_top, name="api_analitica_top"),                          # GET
+    path("api/inventario/abc/", views.api_inventario_abc, name="api_inventario_abc"),                       # GET
+    path("api/inventario/reposicion/", views.api_reposicion, name="api_reposicion"),                        # GET
+
+    # Archivo de notas de periodos cerrados (solo lectura, ver cierre.py)
+    path("api/archivo/notas/", views.api_archivo_notas, name="api_archivo_notas"),                          # GET
+    path("api/archivo/cierres/", views.api_archivo_cierres, name="api_archivo_cierres"),                    # GET
+    path("api/archivo/cierres/<int:cierre_id>/saldos/", views.api_archivo_saldos, name="api_archivo_saldos"),  # GET
+
+    # Diagnóstico (solo staff, con sesión del admin)
+    path("diagnostico/sql/", views.diagnostico_sql, name="diagnostico_sql"),
 ]
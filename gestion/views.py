@@ -1,63 +1,136 @@
 from django.shortcuts import render, get_object_or_404, redirect
-from django.http import JsonResponse, HttpResponse
-from django.db.models import Q, Sum, Case, When, IntegerField, F, Value
+from django.http import JsonResponse, HttpResponse, StreamingHttpResponse
+from django.db.models import OuterRef, Q, Subquery, Value
 from django.db.models.functions import Coalesce
 from django.db import IntegrityError, transaction
+from django.contrib.admin.views.decorators import staff_member_required
 from django.core.exceptions import ValidationError
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
 
-from .models import NotaPedido, NotaPedidoItem, Producto, Cliente, Proveedor
+from .models import (
+    Almacen, Cierre, NotaArchivada, NotaArchivadaItem, NotaPedido, NotaPedidoItem, Producto, Cliente,
+    Proveedor, SaldoInicial, StockAlmacen,
+)
 from .forms import ProductoForm, NotaForm
-
+from .typeahead import buscar_productos
+from .idempotencia import idempotente
+from .admision import admitir
+from .signals import borrar_notas
+from .consultas import filtrar_notas
+from .cache_vistas import DEPENDENCIAS, cache_vista, invalidar, versiones
+from . import (
+    analitica, escritor, eventos, idempotencia, inventario, outbox, perfil_sql, reposicion, rotacion, sincronizacion,
+)
+
+from asgiref.sync import sync_to_async
 from decimal import Decimal
+from django.conf import settings
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from django.utils.functional import cached_property
+import asyncio
+import copy
 import json
 
-# —— PDF con ReportLab (sin dependencias nativas en Windows)
-from reportlab.lib.pagesizes import A4, landscape
-from reportlab.lib import colors
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-import io
 
 
 # =====================
-# Dashboard principal
+# Helpers de consulta
 # =====================
-def index(request):
-    q = (request.GET.get("q") or "").strip()
+PAGE_SIZE_DASHBOARD = 24
+
+
+def _productos_con_stock():
+    """Productos con su proveedor; el stock ya viene guardado en Producto.stock (ver inventario.py)."""
+    return Producto.objects.select_related('proveedor')
 
-    productos = (
-        Producto.objects
-        .select_related('proveedor')
-        .annotate(
-            stock=Coalesce(
-                Sum(
-                    Case(
-                        When(notapedidoitem__nota__tipo='Entrada', then=F('notapedidoitem__cantidad')),
-                        When(notapedidoitem__nota__tipo='Salida', then=-F('notapedidoitem__cantidad')),
-                        default=Value(0),
-                        output_field=IntegerField(),
-                    )
-                ),
-                Value(0)
-            )
-        )
-    )
 
+def _filtrar_productos(productos, q):
     if q:
         productos = productos.filter(
             Q(nombre__icontains=q) |
             Q(codigo__icontains=q) |
             Q(proveedor__nombre__icontains=q)
         )
+    return productos
+
+
+def _paginacion(request, page_size_default=30, page_size_max=200):
+    """Lee page / page_size del querystring tolerando valores inválidos."""
+    try:
+        page = max(int(request.GET.get("page", 1)), 1)
+    except (TypeError, ValueError):
+        page = 1
+    try:
+        page_size = min(max(int(request.GET.get("page_size", page_size_default)), 1), page_size_max)
+    except (TypeError, ValueError):
+        page_size = page_size_default
+    return page, page_size
+
+
+def _campos(request, parametro="fields"):
+    """?fields=id,nombre -> {"id", "nombre"}; None si no se pidió proyección."""
+    fields = request.GET.get(parametro)
+    if not fields:
+        return None
+    return {f.strip() for f in fields.split(",") if f.strip()}
+
+
+def _proyectar(fila, campos):
+    if not campos:
+        return fila
+    return {k: v for k, v in fila.items() if k in campos}
+
+
+def _es_normalizado(request):
+    return request.GET.get("format") == "normalized"
+
+
+class _PrimeraPagina:
+    """Primera página del catálogo, evaluada recién cuando la plantilla la usa."""
+
+    def __init__(self, productos, page_size):
+        self._productos = productos
+        self._page_size = page_size
+
+    @cached_property
+    def _filas(self):
+        return list(self._productos[:self._page_size + 1])
+
+    def productos(self):
+        return self._filas[:self._page_size]
+
+    def hay_mas(self):
+        return len(self._filas) > self._page_size
+
+
+# =====================
+# Dashboard principal
+# =====================
+@cache_vista("index")
+def index(request):
+    """
+    Renderiza solo la primera página del catálogo; el resto (scroll y búsqueda)
+    se pide a /api/productos/ desde el navegador.
+    """
+    q = (request.GET.get("q") or "").strip()
 
-    notas = NotaPedido.objects.all().order_by("-fecha")
+    productos = _filtrar_productos(_productos_con_stock(), q).order_by("nombre", "id")
 
     return render(
         request,
         "index.html",
-        {"productos": productos, "notas": notas, "active_tab": "dashboard"}
+        {
+            # perezoso: si el fragmento del catálogo está en cache no se consulta la BD
+            "pagina": _PrimeraPagina(productos, PAGE_SIZE_DASHBOARD),
+            "page_size": PAGE_SIZE_DASHBOARD,
+            "q": q,
+            "active_tab": "dashboard",
+            # fragmento del catálogo cacheado aparte (ver index.html)
+            "cache_version": versiones(DEPENDENCIAS["index"]),
+            "cache_timeout": getattr(settings, "VISTAS_CACHE_TIMEOUT", 300),
+        }
     )
 
 # =====================
@@ -69,27 +142,17 @@ def gestion_datos(request):
 # =====================
 # Seguimiento de pedidos (con filtros)
 # =====================
+@cache_vista("seguimiento")
 def seguimiento(request):
     notas = NotaPedido.objects.prefetch_related("items__producto").all().order_by("-fecha")
 
     # --- filtros ---
-    search = request.GET.get("q")
-    start_date = request.GET.get("start_date")
-    end_date = request.GET.get("end_date")
-
-    if search:
-        notas = notas.filter(
-            Q(items__producto__nombre__icontains=search) |
-            Q(orden_compra__icontains=search) |
-            Q(proveedor__nombre__icontains=search) |
-            Q(cliente__nombre__icontains=search)
-        ).distinct()
-
-    if start_date:
-        notas = notas.filter(fecha__date__gte=start_date)
-
-    if end_date:
-        notas = notas.filter(fecha__date__lte=end_date)
+    notas = filtrar_notas(
+        notas,
+        request.GET.get("q"),
+        request.GET.get("start_date"),
+        request.GET.get("end_date"),
+    )
 
     return render(request, "seguimiento.html", {"notas": notas, "active_tab": "seguimiento"})
 
@@ -129,7 +192,8 @@ def crear_nota(request):
     if request.method == "POST":
         form = NotaForm(request.POST)
         if form.is_valid():
-            form.save()
+            with transaction.atomic():
+                outbox.nota_guardada(form.save(), creada=True)
             return redirect("seguimiento")
     else:
         form = NotaForm()
@@ -137,10 +201,14 @@ def crear_nota(request):
 
 def editar_nota(request, pk):
     nota = get_object_or_404(NotaPedido, pk=pk)
+    anterior = copy.copy(nota)
     if request.method == "POST":
         form = NotaForm(request.POST, instance=nota)
         if form.is_valid():
-            form.save()
+            with transaction.atomic():
+                form.save()
+                inventario.nota_editada(nota, anterior)
+                outbox.nota_guardada(nota)
             return redirect("seguimiento")
     else:
         form = NotaForm(instance=nota)
@@ -148,7 +216,10 @@ def editar_nota(request, pk):
 
 def eliminar_nota(request, pk):
     nota = get_object_or_404(NotaPedido, pk=pk)
-    nota.delete()
+    with transaction.atomic():
+        inventario.revertir(nota)
+        outbox.notas_eliminadas([(nota.id, nota.numero)])
+        nota.delete()
     return redirect("seguimiento")
 
 # =====================
@@ -165,20 +236,7 @@ def get_clientes(request):
 def get_productos(request):
     # Si sigues usando esta ruta, mejor ya devolver stock también
     productos = (
-        Producto.objects
-        .annotate(
-            stock=Coalesce(
-                Sum(
-                    Case(
-                        When(notapedidoitem__nota__tipo='Entrada', then=F('notapedidoitem__cantidad')),
-                        When(notapedidoitem__nota__tipo='Salida', then=-F('notapedidoitem__cantidad')),
-                        default=Value(0),
-                        output_field=IntegerField(),
-                    )
-                ),
-                Value(0)
-            )
-        )
+        _productos_con_stock()
         .values("id", "nombre", "codigo", "precio", "unidad", "stock")
     )
     return JsonResponse(list(productos), safe=False)
@@ -194,114 +252,213 @@ def agregar_nota(request):
 # =====================
 # APIs para Proveedores
 # =====================
+def _proveedor_crear(request):
+    try:
+        data = json.loads(request.body)
+        nombre = data.get('nombre', '').strip()
+        if not nombre:
+            return JsonResponse({'error': 'El nombre del proveedor es requerido'}, status=400)
+        dias_entrega = int(data.get('dias_entrega') or 7)
+        if dias_entrega < 0:
+            return JsonResponse({'error': 'dias_entrega no puede ser negativo'}, status=400)
+        proveedor = Proveedor.objects.create(nombre=nombre, dias_entrega=dias_entrega)
+        return JsonResponse({'id': proveedor.id, 'nombre': proveedor.nombre, 'dias_entrega': proveedor.dias_entrega,
+                             'mensaje': 'Proveedor creado exitosamente'}, status=201)
+    except IntegrityError:
+        return JsonResponse({'error': 'Ya existe un proveedor con ese nombre'}, status=400)
+    except json.JSONDecodeError:
+        return JsonResponse({'error': 'Datos JSON inválidos'}, status=400)
+    except ValueError:
+        return JsonResponse({'error': 'dias_entrega debe ser un entero'}, status=400)
+    except Exception as e:
+        return JsonResponse({'error': f'Error interno del servidor: {str(e)}'}, status=500)
+
+
 @csrf_exempt
 @require_http_methods(["GET", "POST"])
-def api_proveedores(request):
-    """API para gestionar proveedores"""
+async def api_proveedores(request):
+    """API para gestionar proveedores (GET async; POST se ejecuta en el hilo de la BD)"""
     if request.method == "GET":
-        proveedores = Proveedor.objects.all().values('id', 'nombre')
-        return JsonResponse(list(proveedores), safe=False)
-    elif request.method == "POST":
-        try:
-            data = json.loads(request.body)
-            nombre = data.get('nombre', '').strip()
-            if not nombre:
-                return JsonResponse({'error': 'El nombre del proveedor es requerido'}, status=400)
-            proveedor = Proveedor.objects.create(nombre=nombre)
-            return JsonResponse({'id': proveedor.id, 'nombre': proveedor.nombre, 'mensaje': 'Proveedor creado exitosamente'}, status=201)
-        except IntegrityError:
-            return JsonResponse({'error': 'Ya existe un proveedor con ese nombre'}, status=400)
-        except json.JSONDecodeError:
-            return JsonResponse({'error': 'Datos JSON inválidos'}, status=400)
-        except Exception as e:
-            return JsonResponse({'error': f'Error interno del servidor: {str(e)}'}, status=500)
+        proveedores = [p async for p in Proveedor.objects.all().values('id', 'nombre', 'dias_entrega')]
+        return JsonResponse(proveedores, safe=False)
+    return await sync_to_async(_proveedor_crear)(request)
 
 # =====================
 # APIs para Clientes
 # =====================
+def _cliente_crear(request):
+    try:
+        data = json.loads(request.body)
+        nombre = data.get('nombre', '').strip()
+        if not nombre:
+            return JsonResponse({'error': 'El nombre del cliente es requerido'}, status=400)
+        cliente = Cliente.objects.create(nombre=nombre)
+        return JsonResponse({'id': cliente.id, 'nombre': cliente.nombre, 'mensaje': 'Cliente creado exitosamente'}, status=201)
+    except IntegrityError:
+        return JsonResponse({'error': 'Ya existe un cliente con ese nombre'}, status=400)
+    except json.JSONDecodeError:
+        return JsonResponse({'error': 'Datos JSON inválidos'}, status=400)
+    except Exception as e:
+        return JsonResponse({'error': f'Error interno del servidor: {str(e)}'}, status=500)
+
+
 @csrf_exempt
 @require_http_methods(["GET", "POST"])
-def api_clientes(request):
-    """API para gestionar clientes"""
+async def api_clientes(request):
+    """API para gestionar clientes (GET async; POST se ejecuta en el hilo de la BD)"""
     if request.method == "GET":
-        clientes = Cliente.objects.all().values('id', 'nombre')
-        return JsonResponse(list(clientes), safe=False)
-    elif request.method == "POST":
-        try:
-            data = json.loads(request.body)
-            nombre = data.get('nombre', '').strip()
-            if not nombre:
-                return JsonResponse({'error': 'El nombre del cliente es requerido'}, status=400)
-            cliente = Cliente.objects.create(nombre=nombre)
-            return JsonResponse({'id': cliente.id, 'nombre': cliente.nombre, 'mensaje': 'Cliente creado exitosamente'}, status=201)
-        except IntegrityError:
-            return JsonResponse({'error': 'Ya existe un cliente con ese nombre'}, status=400)
-        except json.JSONDecodeError:
-            return JsonResponse({'error': 'Datos JSON inválidos'}, status=400)
-        except Exception as e:
-            return JsonResponse({'error': f'Error interno del servidor: {str(e)}'}, status=500)
+        clientes = [c async for c in Cliente.objects.all().values('id', 'nombre')]
+        return JsonResponse(clientes, safe=False)
+    return await sync_to_async(_cliente_crear)(request)
+
+# =====================
+# APIs para Almacenes
+# =====================
+def _almacen_crear(request):
+    try:
+        data = json.loads(request.body)
+        nombre = data.get('nombre', '').strip()
+        if not nombre:
+            return JsonResponse({'error': 'El nombre del almacén es requerido'}, status=400)
+        almacen = Almacen.objects.create(nombre=nombre)
+        return JsonResponse({'id': almacen.id, 'nombre': almacen.nombre, 'mensaje': 'Almacén creado exitosamente'}, status=201)
+    except IntegrityError:
+        return JsonResponse({'error': 'Ya existe un almacén con ese nombre'}, status=400)
+    except json.JSONDecodeError:
+        return JsonResponse({'error': 'Datos JSON inválidos'}, status=400)
+    except Exception as e:
+        return JsonResponse({'error': f'Error interno del servidor: {str(e)}'}, status=500)
+
+
+@csrf_exempt
+@require_http_methods(["GET", "POST"])
+async def api_almacenes(request):
+    """API para gestionar almacenes (sedes). El stock de cada uno: /api/productos/?almacen=<id>"""
+    if request.method == "GET":
+        almacenes = [a async for a in Almacen.objects.order_by('id').values('id', 'nombre')]
+        return JsonResponse(almacenes, safe=False)
+    return await sync_to_async(_almacen_crear)(request)
+
+
+def _almacen(valor):
+    """Almacén indicado por id o, si no viene, el principal."""
+    if valor:
+        return Almacen.objects.get(id=valor)
+    almacen = Almacen.principal()
+    if almacen is None:
+        raise ValidationError("No hay almacenes registrados")
+    return almacen
 
 # =====================
 # APIs para Productos
 # =====================
 @require_http_methods(["GET"])
-def api_productos(request):
+async def api_productos(request):
+    """
+    Listado paginado. Modos compactos opcionales:
+      ?fields=id,nombre,stock  -> solo esos campos
+      ?format=normalized       -> sin proveedor_nombre por fila; los proveedores van una vez en 'proveedores'
+    Con ?almacen=<id>, 'stock' es el saldo en ese almacén (StockAlmacen) en lugar del total.
+    """
     q = (request.GET.get("q") or "").strip()
+    campos = _campos(request)
+    normalizado = _es_normalizado(request)
+
+    productos = _filtrar_productos(_productos_con_stock(), q)
+    almacen_id = request.GET.get("almacen")
+    if almacen_id:
+        if not almacen_id.isdigit():
+            return JsonResponse({"error": "almacen inválido"}, status=400)
+        # una búsqueda por el índice único (almacen, producto) por fila de la página
+        saldo = StockAlmacen.objects.filter(almacen_id=int(almacen_id), producto_id=OuterRef("pk")).values("stock")[:1]
+        productos = productos.annotate(stock_almacen=Coalesce(Subquery(saldo), Value(0)))
 
-    productos = (
-        Producto.objects
-        .select_related('proveedor')
-        .annotate(
-            stock=Coalesce(
-                Sum(
-                    Case(
-                        When(notapedidoitem__nota__tipo='Entrada', then=F('notapedidoitem__cantidad')),
-                        When(notapedidoitem__nota__tipo='Salida', then=-F('notapedidoitem__cantidad')),
-                        default=Value(0),
-                        output_field=IntegerField(),
-                    )
-                ),
-                Value(0)
-            )
-        )
-    )
+    # paginado robusto
+    page, page_size = _paginacion(request)
 
-    if q:
-        productos = productos.filter(
-            Q(nombre__icontains=q) |
-            Q(codigo__icontains=q) |
-            Q(proveedor__nombre__icontains=q)
-        )
+    start = (page - 1) * page_size
+    end = start + page_size
+    total = await productos.acount()
+    productos = productos.order_by('nombre', 'id')[start:end]
+
+    results = []
+    proveedores = {}
+    async for p in productos:
+        fila = {
+            'id': p.id,
+            'nombre': p.nombre,
+            'codigo': p.codigo,
+            'unidad': p.unidad,
+            'adquisicion': p.adquisicion,
+            'precio': float(p.precio),
+            'peso': float(p.peso),
+            'proveedor': p.proveedor.id,
+            'proveedor_nombre': p.proveedor.nombre,
+            'stock': p.stock_almacen if almacen_id else p.stock,
+            'stock_minimo': p.stock_minimo,
+            'bajo_minimo': p.bajo_minimo,
+        }
+        if normalizado:
+            del fila['proveedor_nombre']
+            proveedores[p.proveedor.id] = p.proveedor.nombre
+        results.append(_proyectar(fila, campos))
+
+    data = {
+        'results': results,
+        'total': total,
+        'page': page,
+        'page_size': page_size,
+        'has_next': end < total,
+    }
+    if normalizado:
+        data['proveedores'] = proveedores
+    if almacen_id:
+        data['almacen'] = int(almacen_id)
+    return JsonResponse(data)
 
-    # paginado robusto
-    try:
-        page = int(request.GET.get("page", 1))
-    except (TypeError, ValueError):
-        page = 1
+
+@require_http_methods(["GET"])
+def api_productos_buscar(request):
+    """
+    Autocompletado: GET /api/productos/buscar/?q=tor&k=10
+    Responde desde el índice en memoria (typeahead.py); pensado para llamarse en cada tecla.
+    """
+    q = (request.GET.get("q") or "").strip()
     try:
-        page_size = min(int(request.GET.get("page_size", 30)), 200)
+        k = min(max(int(request.GET.get("k", 10)), 1), 50)
     except (TypeError, ValueError):
-        page_size = 30
+        k = 10
+    return JsonResponse({"results": buscar_productos(q, k), "q": q})
 
-    start = (page - 1) * page_size
-    end = start + page_size
-    total = productos.count()
-    productos = productos.order_by('nombre')[start:end]
 
+@require_http_methods(["GET"])
+async def api_productos_alertas(request):
+    """
+    Productos en o bajo su stock mínimo (los más faltantes primero).
+    Lee el índice Producto.bajo_minimo, que inventario.py mantiene con cada nota.
+    """
     results = [{
         'id': p.id,
         'nombre': p.nombre,
         'codigo': p.codigo,
         'unidad': p.unidad,
-        'adquisicion': p.adquisicion,
-        'precio': float(p.precio),
-        'peso': float(p.peso),
-        'proveedor': p.proveedor.id,
+        'stock': p.stock,
+        'stock_minimo': p.stock_minimo,
+        'faltante': p.stock_minimo - p.stock,
+        'proveedor': p.proveedor_id,
         'proveedor_nombre': p.proveedor.nombre,
-        'stock': p.stock or 0,
-    } for p in productos]
+    } async for p in inventario.alertas()]
+    return JsonResponse({'results': results, 'total': len(results)})
 
-    return JsonResponse({'results': results, 'total': total, 'page': page, 'page_size': page_size})
+
+def _stock_minimo(valor):
+    """'' o None = sin umbral; si no, entero >= 0."""
+    if valor is None or str(valor).strip() == '':
+        return None
+    minimo = int(valor)
+    if minimo < 0:
+        raise ValueError('el stock mínimo no puede ser negativo')
+    return minimo
 
 
 @csrf_exempt
@@ -331,7 +488,8 @@ def api_producto_crear(request):
             adquisicion=data['adquisicion'],
             precio=Decimal(str(data.get('precio', '0.00'))),
             peso=Decimal(str(data.get('peso', '0.00'))),
-            proveedor=proveedor
+            proveedor=proveedor,
+            stock_minimo=_stock_minimo(data.get('stock_minimo')),
         )
 
         return JsonResponse({
@@ -344,6 +502,9 @@ def api_producto_crear(request):
             'peso': float(producto.peso),
             'proveedor': producto.proveedor.id,
             'proveedor_nombre': producto.proveedor.nombre,
+            'stock': producto.stock,
+            'stock_minimo': producto.stock_minimo,
+            'bajo_minimo': producto.bajo_minimo,
             'mensaje': 'Producto creado exitosamente'
         }, status=201)
 
@@ -386,9 +547,12 @@ def api_producto_editar(request, producto_id):
         producto.precio = float(data['precio'])
         producto.peso = float(data['peso'])
         producto.proveedor = proveedor
+        if 'stock_minimo' in data:
+            producto.stock_minimo = _stock_minimo(data['stock_minimo'])
 
         producto.full_clean()  # Validación del modelo
         producto.save()
+        producto.refresh_from_db(fields=['stock', 'bajo_minimo'])
 
         return JsonResponse({
             'id': producto.id,
@@ -400,6 +564,9 @@ def api_producto_editar(request, producto_id):
             'peso': float(producto.peso),
             'proveedor': producto.proveedor.id,
             'proveedor_nombre': producto.proveedor.nombre,
+            'stock': producto.stock,
+            'stock_minimo': producto.stock_minimo,
+            'bajo_minimo': producto.bajo_minimo,
             'mensaje': 'Producto actualizado exitosamente'
         })
 
@@ -415,146 +582,546 @@ def api_producto_editar(request, producto_id):
 # =====================
 # API NUEVA: crear Nota + Items (impacta stock)
 # =====================
+def _leer_nota(payload):
+    """Validación del JSON de api_notas_crear, sin tocar la BD. ValidationError con el mensaje para el cliente."""
+    # ✅ normaliza el tipo
+    tipo_raw = str(payload.get("tipo", "")).strip().lower()
+    if tipo_raw not in ("entrada", "salida", "traslado"):
+        raise ValidationError("tipo inválido (Entrada | Salida | Traslado)")
+
+    items = payload.get("items", [])
+    if not items or not isinstance(items, list):
+        raise ValidationError("items es requerido y debe ser lista")
+
+    return {
+        "tipo": tipo_raw.capitalize(),
+        "proveedor": payload.get("proveedor"),
+        "cliente": payload.get("cliente"),
+        "almacen": payload.get("almacen"),
+        "almacen_destino": payload.get("almacen_destino"),
+        # admite 'orden', 'orden_compra' o 'orden_venta'
+        "orden": payload.get("orden") or payload.get("orden_compra") or payload.get("orden_venta") or None,
+        "items": items,
+    }
+
+
+def _crear_nota(datos):
+    """Crea la nota y sus items y aplica el stock, en una transacción. Devuelve el cuerpo de la respuesta 201."""
+    items = datos["items"]
+    with transaction.atomic():
+        nota = NotaPedido(
+            tipo=datos["tipo"],
+            proveedor=Proveedor.objects.get(id=datos["proveedor"]) if datos["proveedor"] else None,
+            cliente=Cliente.objects.get(id=datos["cliente"]) if datos["cliente"] else None,
+            orden_compra=datos["orden"],
+            almacen=_almacen(datos["almacen"]),
+            almacen_destino=Almacen.objects.get(id=datos["almacen_destino"]) if datos["almacen_destino"] else None,
+        )
+        _validar_cabecera(nota)
+        nota.save()
+
+        creado = []
+        for it in items:
+            prod_id = it.get("producto")
+            cantidad = it.get("cantidad")
+            if not prod_id or not cantidad or int(cantidad) <= 0:
+                raise ValidationError("Cada item requiere producto y cantidad > 0")
+            creado.append(prod_id)
+
+        # una lectura de precios y un INSERT para todos los items
+        precios = dict(Producto.objects.filter(id__in=creado).values_list("id", "precio"))
+        if any(int(pid) not in precios for pid in creado):
+            raise Producto.DoesNotExist
+        filas = NotaPedidoItem.objects.bulk_create([
+            NotaPedidoItem(nota=nota, producto_id=int(it["producto"]), cantidad=int(it["cantidad"]),
+                           precio_unitario=precios[int(it["producto"])])
+            for it in items
+        ])
+        # bulk_create no dispara señales
+        transaction.on_commit(lambda: invalidar(NotaPedidoItem))
+
+        inventario.registrar(nota)
+        outbox.nota_guardada(nota, [(f.producto_id, f.cantidad, f.precio_unitario) for f in filas], creada=True)
+
+    return {"status": "ok", "nota_id": nota.id, "numero": nota.numero, "items": creado}
+
+
+def _error_crear_nota(e):
+    if isinstance(e, Proveedor.DoesNotExist):
+        return JsonResponse({"error": "Proveedor no existe"}, status=400)
+    if isinstance(e, Cliente.DoesNotExist):
+        return JsonResponse({"error": "Cliente no existe"}, status=400)
+    if isinstance(e, Producto.DoesNotExist):
+        return JsonResponse({"error": "Producto no existe"}, status=400)
+    if isinstance(e, Almacen.DoesNotExist):
+        return JsonResponse({"error": "Almacén no existe"}, status=400)
+    if isinstance(e, ValidationError):
+        return JsonResponse({"error": e.messages[0]}, status=400)
+    if isinstance(e, json.JSONDecodeError):
+        return JsonResponse({"error": "JSON inválido"}, status=400)
+    return JsonResponse({"error": f"Error interno: {e}"}, status=500)
+
+
+@idempotente
+def _notas_crear_directa(request):
+    try:
+        return JsonResponse(_crear_nota(_leer_nota(json.loads(request.body))), status=201)
+    except Exception as e:
+        return _error_crear_nota(e)
+
+
 @csrf_exempt
 @require_http_methods(["POST"])
-def api_notas_crear(request):
+async def api_notas_crear(request):
     """
     JSON:
     {
-      "tipo": "Entrada" | "Salida" | "entrada" | "salida",
+      "tipo": "Entrada" | "Salida" | "Traslado" (sin distinguir mayúsculas),
       "proveedor": <id> (si Entrada),
       "cliente": <id> (si Salida),
+      "almacen": <id> (opcional: por defecto el principal; en Traslado, el de origen),
+      "almacen_destino": <id> (si Traslado),
       "orden": "texto" (se guarda en orden_compra),
       "items": [{"producto": <id>, "cantidad": <int>}...]
     }
+    Un Traslado mueve el stock entre almacenes: no cambia el total ni la analítica.
+    Con el header Idempotency-Key un reintento devuelve la respuesta original sin crear otra nota.
+    Con ESCRITURA_AGRUPADA la nota se escribe en un lote junto con las de otros
+    requests (ver escritor.py), salvo que traiga Idempotency-Key.
     """
+    if not escritor.activo() or idempotencia.HEADER in request.headers:
+        return await sync_to_async(_notas_crear_directa)(request)
     try:
-        payload = json.loads(request.body)
+        datos = _leer_nota(json.loads(request.body))
+        return JsonResponse(
+            await asyncio.wrap_future(escritor.escritor.enviar(lambda: _crear_nota(datos))), status=201
+        )
+    except Exception as e:
+        return _error_crear_nota(e)
 
-        # ✅ normaliza el tipo
-        tipo_raw = str(payload.get("tipo", "")).strip().lower()
-        if tipo_raw not in ("entrada", "salida"):
-            return JsonResponse({"error": "tipo inválido (Entrada | Salida)"}, status=400)
-        tipo = "Entrada" if tipo_raw == "entrada" else "Salida"
 
-        proveedor_id = payload.get("proveedor")
-        cliente_id = payload.get("cliente")
 
-        if tipo == "Entrada" and not proveedor_id:
-            return JsonResponse({"error": "proveedor requerido para Entrada"}, status=400)
-        if tipo == "Salida" and not cliente_id:
-            return JsonResponse({"error": "cliente requerido para Salida"}, status=400)
 
-        # admite 'orden', 'orden_compra' o 'orden_venta'
-        orden = payload.get("orden") or payload.get("orden_compra") or payload.get("orden_venta") or None
+def _validar_cabecera(nota):
+    """Contrapartes y almacenes que exige cada tipo de nota (al crear y al editar)."""
+    if nota.tipo == "Entrada" and not nota.proveedor_id:
+        raise ValidationError("proveedor requerido para Entrada")
+    if nota.tipo == "Salida" and not nota.cliente_id:
+        raise ValidationError("cliente requerido para Salida")
+    if nota.tipo == "Traslado":
+        if not nota.almacen_destino_id:
+            raise ValidationError("almacen_destino requerido para Traslado")
+        if nota.almacen_destino_id == nota.almacen_id:
+            raise ValidationError("almacen_destino debe ser distinto de almacen")
+        # un traslado es interno: no tiene proveedor ni cliente
+        nota.proveedor = nota.cliente = None
+    else:
+        nota.almacen_destino = None
+    if not nota.almacen_id:
+        raise ValidationError("almacen requerido")
 
-        items = payload.get("items", [])
-        if not items or not isinstance(items, list):
-            return JsonResponse({"error": "items es requerido y debe ser lista"}, status=400)
 
-        with transaction.atomic():
-            proveedor = Proveedor.objects.get(id=proveedor_id) if proveedor_id else None
-            cliente = Cliente.objects.get(id=cliente_id) if cliente_id else None
-
-            nota = NotaPedido.objects.create(
-                tipo=tipo,
-                proveedor=proveedor,
-                cliente=cliente,
-                orden_compra=orden
-            )
+# =====================
+# API: listar notas (para seguimiento)
+# ====================
 
-            creado = []
-            for it in items:
-                prod_id = it.get("producto")
-                cantidad = it.get("cantidad")
-                if not prod_id or not cantidad or int(cantidad) <= 0:
-                    raise ValidationError("Cada item requiere producto y cantidad > 0")
-                producto = Producto.objects.get(id=prod_id)
-                NotaPedidoItem.objects.create(nota=nota, producto=producto, cantidad=int(cantidad))
-                creado.append(prod_id)
+_RELACIONES_NOTA = ("proveedor", "cliente", "almacen", "almacen_destino")
+
+
+def _nota_dict(n, con_items=True):
+    """Formato histórico de /api/notas/ (el que entiende seguimiento.html)."""
+    items = None if not con_items else [{
+        "producto": it.producto_id,
+        "producto_nombre": getattr(it.producto, "nombre", ""),
+        "cantidad": float(getattr(it, "cantidad", 0) or 0),
+        "precio_unitario": float(getattr(it, "precio_unitario", 0) or 0),
+    } for it in n.items.all()]
+
+    # fecha robusta (usa n.fecha si existe; si no, intenta created_at)
+    fecha_val = getattr(n, "fecha", None) or getattr(n, "created_at", None)
+    return {
+        "id": n.id,
+        "numero": n.numero,
+        "fecha": fecha_val.isoformat() if fecha_val else None,
+        "tipo": (n.tipo or "").lower(),  # "entrada" | "salida"
+        "orden_compra": getattr(n, "orden_compra", "") or None,
+        "orden_venta": None,
+        "orden": getattr(n, "orden_compra", "") or "",
+        "proveedor": (
+            {"id": n.proveedor_id, "nombre": getattr(n.proveedor, "nombre", "")}
+            if getattr(n, "proveedor_id", None) else None
+        ),
+        "cliente": (
+            {"id": n.cliente_id, "nombre": getattr(n.cliente, "nombre", "")}
+            if getattr(n, "cliente_id", None) else None
+        ),
+        "almacen": {"id": n.almacen_id, "nombre": n.almacen.nombre} if n.almacen_id else None,
+        "almacen_destino": (
+            {"id": n.almacen_destino_id, "nombre": n.almacen_destino.nombre} if n.almacen_destino_id else None
+        ),
+        "items": items,
+    }
 
-        return JsonResponse({"status": "ok", "nota_id": nota.id, "items": creado}, status=201)
 
-    except Proveedor.DoesNotExist:
-        return JsonResponse({"error": "Proveedor no existe"}, status=400)
-    except Cliente.DoesNotExist:
-        return JsonResponse({"error": "Cliente no existe"}, status=400)
-    except Producto.DoesNotExist:
-        return JsonResponse({"error": "Producto no existe"}, status=400)
-    except ValidationError as e:
-        return JsonResponse({"error": str(e)}, status=400)
-    except json.JSONDecodeError:
-        return JsonResponse({"error": "JSON inválido"}, status=400)
-    except Exception as e:
-        return JsonResponse({"error": f"Error interno: {e}"}, status=500)
+def _nota_compacta(n):
+    """Formato normalizado: referencias por id e items como pares [producto, cantidad]."""
+    return {
+        "id": n.id,
+        "numero": n.numero,
+        "fecha": n.fecha.isoformat() if n.fecha else None,
+        "tipo": (n.tipo or "").lower(),
+        "orden": n.orden_compra or "",
+        "proveedor": n.proveedor_id,
+        "cliente": n.cliente_id,
+        "almacen": n.almacen_id,
+        "almacen_destino": n.almacen_destino_id,
+        "items": [[it.producto_id, it.cantidad] for it in n.items.all()],
+    }
 
 
+@require_http_methods(["GET"])
+@admitir("listado")
+async def api_notas_list(request):
+    """
+    Devuelve las notas en un formato que el seguimiento entiende.
+    Acepta los mismos filtros que seguimiento: q (incluye el número N2025_0001), start_date, end_date.
+    Modos compactos opcionales:
+      ?fields=id,numero,fecha  -> solo esos campos de cada nota
+      ?format=normalized       -> {"notas": [...], "proveedores": {id: nombre}, "clientes": {...},
+                                   "almacenes": {...}, "productos": {id: {"nombre", "codigo", "unidad"}}}
+    """
+    campos = _campos(request)
+    normalizado = _es_normalizado(request)
+
+    notas_qs = NotaPedido.objects.order_by("-fecha")
+    if normalizado:
+        # los nombres se mandan una sola vez: no hace falta traer producto por item
+        notas_qs = notas_qs.prefetch_related("items")
+    elif campos is None or "items" in campos:
+        notas_qs = notas_qs.select_related(*_RELACIONES_NOTA).prefetch_related("items__producto")
+    else:
+        notas_qs = notas_qs.select_related(*_RELACIONES_NOTA)
+    notas_qs = filtrar_notas(
+        notas_qs,
+        request.GET.get("q"),
+        request.GET.get("start_date"),
+        request.GET.get("end_date"),
+    )
+
+    if not normalizado:
+        con_items = campos is None or "items" in campos
+        data = [_proyectar(_nota_dict(n, con_items), campos) async for n in notas_qs]
+        return JsonResponse(data, safe=False)
+
+    # catálogos referenciados, vía subconsulta (evita listas IN enormes)
+    proveedores = Proveedor.objects.filter(id__in=notas_qs.values("proveedor_id"))
+    clientes = Cliente.objects.filter(id__in=notas_qs.values("cliente_id"))
+    almacenes = Almacen.objects.filter(
+        Q(id__in=notas_qs.values("almacen_id")) | Q(id__in=notas_qs.values("almacen_destino_id"))
+    )
+    productos = Producto.objects.filter(
+        id__in=NotaPedidoItem.objects.filter(nota__in=notas_qs.values("id")).values("producto_id")
+    )
+    data = {
+        "notas": [_proyectar(_nota_compacta(n), campos) async for n in notas_qs],
+        "proveedores": {p["id"]: p["nombre"] async for p in proveedores.values("id", "nombre")},
+        "clientes": {c["id"]: c["nombre"] async for c in clientes.values("id", "nombre")},
+        "almacenes": {a["id"]: a["nombre"] async for a in almacenes.values("id", "nombre")},
+        "productos": {
+            p["id"]: {"nombre": p["nombre"], "codigo": p["codigo"], "unidad": p["unidad"]}
+            async for p in productos.values("id", "nombre", "codigo", "unidad")
+        },
+    }
+    return JsonResponse(data)
+
 
 
 # =====================
-# API: listar notas (para seguimiento)
-# ====================
+# API: sincronización por diferencias (seguimiento, lectores de códigos)
+# =====================
+_CAMPOS_PRODUCTO_SYNC = ("id", "nombre", "codigo", "unidad", "adquisicion", "precio", "peso",
+                         "proveedor_id", "stock", "stock_minimo", "bajo_minimo")
+
 
 @require_http_methods(["GET"])
-def api_notas_list(request):
+async def api_sync(request):
     """
-    Devuelve todas las notas en un formato que el seguimiento entiende.
+    GET /api/sync/?since=<token>&incluir=productos,proveedores,clientes,notas
+    Devuelve lo creado/modificado desde el token (productos con su stock, notas en
+    formato compacto) y los ids eliminados, más el token para la próxima llamada.
+    Sin since, o con un token vencido, responde todo con "completo": true.
     """
-    notas_qs = (
-        NotaPedido.objects
-        .select_related("proveedor", "cliente")
-        .prefetch_related("items__producto")
-        .order_by("-fecha")
+    incluir = _campos(request, "incluir") or set(sincronizacion.COLECCIONES)
+    if not incluir <= set(sincronizacion.COLECCIONES):
+        return JsonResponse({"error": "incluir admite: " + ", ".join(sincronizacion.COLECCIONES)}, status=400)
+
+    ahora = timezone.now()
+    since = (request.GET.get("since") or "").strip()
+    try:
+        desde = sincronizacion.leer_token(since) if since else None
+    except (ValueError, OverflowError, OSError):
+        return JsonResponse({"error": "token inválido"}, status=400)
+
+    completo = sincronizacion.requiere_completo(desde, ahora)
+    if completo:
+        desde = None
+        await sync_to_async(sincronizacion.depurar)(ahora)
+
+    consultas = sincronizacion.consultas(desde, incluir)
+    data = {"token": sincronizacion.crear_token(ahora), "completo": completo}
+    if "productos" in consultas:
+        data["productos"] = [{
+            **{k: v for k, v in p.items() if k != "proveedor_id"},
+            "proveedor": p["proveedor_id"],
+            "precio": float(p["precio"]),
+            "peso": float(p["peso"]),
+        } async for p in consultas["productos"].values(*_CAMPOS_PRODUCTO_SYNC)]
+    if "proveedores" in consultas:
+        data["proveedores"] = [p async for p in consultas["proveedores"].values("id", "nombre", "dias_entrega")]
+    if "clientes" in consultas:
+        data["clientes"] = [c async for c in consultas["clientes"].values("id", "nombre")]
+    if "notas" in consultas:
+        data["notas"] = [_nota_compacta(n) async for n in consultas["notas"]]
+    data["eliminados"] = (
+        {k: [] for k in consultas} if completo
+        else await sync_to_async(sincronizacion.eliminados)(desde, incluir)
     )
+    return JsonResponse(data)
 
-    data = []
-    for n in notas_qs:
-        items = [{
-            "producto": it.producto_id,
-            "producto_nombre": getattr(it.producto, "nombre", ""),
-            "cantidad": float(getattr(it, "cantidad", 0) or 0),
-            "precio_unitario": float(getattr(it, "precio_unitario", 0) or 0),
-        } for it in n.items.all()]
-
-        # fecha robusta (usa n.fecha si existe; si no, intenta created_at)
-        fecha_val = getattr(n, "fecha", None) or getattr(n, "created_at", None)
-        data.append({
-            "id": n.id,
-            "fecha": fecha_val.isoformat() if fecha_val else None,
-            "tipo": (n.tipo or "").lower(),  # "entrada" | "salida"
-            "orden_compra": getattr(n, "orden_compra", "") or None,
-            "orden_venta": None,
-            "orden": getattr(n, "orden_compra", "") or "",
-            "proveedor": (
-                {"id": n.proveedor_id, "nombre": getattr(n.proveedor, "nombre", "")}
-                if getattr(n, "proveedor_id", None) else None
-            ),
-            "cliente": (
-                {"id": n.cliente_id, "nombre": getattr(n.cliente, "nombre", "")}
-                if getattr(n, "cliente_id", None) else None
-            ),
-            "items": items,
-        })
 
-    return JsonResponse(data, safe=False)
+@require_http_methods(["GET"])
+async def api_eventos(request):
+    """
+    Server-Sent Events: nota_guardada, nota_eliminada, notas_eliminadas y stock, al confirmarse cada escritura
+    (ver eventos.py). Retoma desde el header Last-Event-ID al reconectar.
+    """
+    if not hasattr(request, "scope"):
+        # bajo WSGI el flujo ocuparía un worker para siempre; 204 le dice a EventSource que no reintente
+        return HttpResponse(status=204)
+    ultimo = request.headers.get("Last-Event-ID") or request.GET.get("ultimo")
+    response = StreamingHttpResponse(eventos.flujo(ultimo), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"  # nginx: no acumular el flujo
+    return response
+
+
+def _cantidades_items(items):
+    """[{"producto", "cantidad"}, ...] -> {producto_id: cantidad}, sumando productos repetidos."""
+    if not isinstance(items, list) or not items:
+        raise ValidationError("items es requerido y debe ser lista")
+    cantidades = {}
+    for it in items:
+        prod_id = it.get("producto") if isinstance(it, dict) else None
+        cantidad = it.get("cantidad") if isinstance(it, dict) else None
+        if not prod_id or not cantidad or int(cantidad) <= 0:
+            raise ValidationError("Cada item requiere producto y cantidad > 0")
+        cantidades[int(prod_id)] = cantidades.get(int(prod_id), 0) + int(cantidad)
+    return cantidades
+
+
+def _nota_actualizar(request, nota_id):
+    """
+    PUT / PATCH /api/notas/<id>/
+    {
+      "tipo", "proveedor", "cliente", "almacen", "almacen_destino", "orden": opcionales, como en /api/notas/crear/
+      "items": [{"producto": <id>, "cantidad": <int>}...]  (requerido en PUT)
+    }
+    "items" es la lista completa nueva: se compara con los items guardados y solo
+    se insertan, actualizan o borran las filas que cambian (los items que quedan
+    conservan su id y su precio_unitario). Al stock y a la analítica llega solo
+    la diferencia de cada producto.
+    """
+    try:
+        payload = json.loads(request.body)
+        if not isinstance(payload, dict):
+            raise ValidationError("Se esperaba un objeto JSON")
+        if request.method == "PUT" and "items" not in payload:
+            raise ValidationError("items es requerido y debe ser lista")
+        cantidades = _cantidades_items(payload["items"]) if "items" in payload else None
+
+        with transaction.atomic():
+            nota = NotaPedido.objects.select_for_update().filter(id=nota_id).first()
+            if nota is None:
+                return JsonResponse({"error": "Nota no existe"}, status=404)
+            anterior = copy.copy(nota)
+
+            # —— cabecera
+            if "tipo" in payload:
+                tipo_raw = str(payload.get("tipo") or "").strip().lower()
+                if tipo_raw not in ("entrada", "salida", "traslado"):
+                    raise ValidationError("tipo inválido (Entrada | Salida | Traslado)")
+                nota.tipo = tipo_raw.capitalize()
+            if "proveedor" in payload:
+                nota.proveedor = Proveedor.objects.get(id=payload["proveedor"]) if payload["proveedor"] else None
+            if "cliente" in payload:
+                nota.cliente = Cliente.objects.get(id=payload["cliente"]) if payload["cliente"] else None
+            if "almacen" in payload:
+                nota.almacen = _almacen(payload["almacen"])
+            if "almacen_destino" in payload:
+                destino_id = payload["almacen_destino"]
+                nota.almacen_destino = Almacen.objects.get(id=destino_id) if destino_id else None
+            for clave in ("orden", "orden_compra", "orden_venta"):
+                if clave in payload:
+                    nota.orden_compra = payload[clave] or None
+                    break
+            _validar_cabecera(nota)
+
+            # —— items: diferencia contra lo guardado
+            filas = {}
+            for item in nota.items.order_by("id"):
+                filas.setdefault(item.producto_id, []).append(item)
+            antes = {
+                pid: (sum(it.cantidad for it in its), sum(it.cantidad * it.precio_unitario for it in its))
+                for pid, its in filas.items()
+            }
+            cambios = {"insertados": 0, "actualizados": 0, "eliminados": 0}
+            despues = antes
+            if cantidades is not None:
+                borrar, actualizar, despues = [], [], {}
+                for pid, its in filas.items():
+                    if pid not in cantidades:
+                        borrar.extend(it.id for it in its)
+                        continue
+                    # un producto repetido en la nota queda en una sola fila
+                    primera = its[0]
+                    borrar.extend(it.id for it in its[1:])
+                    if primera.cantidad != cantidades[pid]:
+                        primera.cantidad = cantidades[pid]
+                        actualizar.append(primera)
+                    despues[pid] = (primera.cantidad, primera.cantidad * primera.precio_unitario)
+
+                nuevos = [pid for pid in cantidades if pid not in filas]
+                precios = dict(Producto.objects.filter(id__in=nuevos).values_list("id", "precio"))
+                if len(precios) != len(nuevos):
+                    raise Producto.DoesNotExist
+                insertar = [
+                    NotaPedidoItem(nota=nota, producto_id=pid, cantidad=cantidades[pid], precio_unitario=precios[pid])
+                    for pid in nuevos
+                ]
+                for it in insertar:
+                    despues[it.producto_id] = (it.cantidad, it.cantidad * it.precio_unitario)
+
+                if borrar:
+                    NotaPedidoItem.objects.filter(id__in=borrar).delete()
+                if actualizar:
+                    NotaPedidoItem.objects.bulk_update(actualizar, ["cantidad"])
+                if insertar:
+                    NotaPedidoItem.objects.bulk_create(insertar)
+                cambios = {"insertados": len(insertar), "actualizados": len(actualizar), "eliminados": len(borrar)}
+                if actualizar or insertar:
+                    # bulk_update/bulk_create no disparan señales
+                    transaction.on_commit(lambda: invalidar(NotaPedidoItem))
+
+            cabecera = ("tipo", "proveedor_id", "cliente_id", "almacen_id", "almacen_destino_id", "orden_compra")
+            if any(cambios.values()) or any(getattr(nota, c) != getattr(anterior, c) for c in cabecera):
+                nota.save()  # actualizado: la nota aparece en /api/sync/ y se publica nota_guardada
+                inventario.nota_modificada(nota, anterior, antes, despues)
+                outbox.nota_guardada(nota)
+
+        nota = (
+            NotaPedido.objects.select_related(*_RELACIONES_NOTA)
+            .prefetch_related("items__producto").get(id=nota.id)
+        )
+        return JsonResponse({"status": "ok", "nota": _nota_dict(nota), "cambios": cambios})
 
+    except Proveedor.DoesNotExist:
+        return JsonResponse({"error": "Proveedor no existe"}, status=400)
+    except Cliente.DoesNotExist:
+        return JsonResponse({"error": "Cliente no existe"}, status=400)
+    except Producto.DoesNotExist:
+        return JsonResponse({"error": "Producto no existe"}, status=400)
+    except Almacen.DoesNotExist:
+        return JsonResponse({"error": "Almacén no existe"}, status=400)
+    except ValidationError as e:
+        return JsonResponse({"error": e.messages[0]}, status=400)
+    except json.JSONDecodeError:
+        return JsonResponse({"error": "JSON inválido"}, status=400)
+    except (TypeError, ValueError):
+        return JsonResponse({"error": "producto y cantidad deben ser enteros"}, status=400)
+    except Exception as e:
+        return JsonResponse({"error": f"Error interno: {e}"}, status=500)
 
 
-@csrf_exempt
-@require_http_methods(["DELETE"])
-def api_notas_delete(request, nota_id: int):
+def _nota_eliminar(request, nota_id):
     """
-    Elimina una NotaPedido y sus items.
-    El stock se recalcula automáticamente porque lo anotas desde los items.
+    Elimina una NotaPedido y sus items, devolviendo su efecto al stock.
     """
     try:
         with transaction.atomic():
             nota = get_object_or_404(NotaPedido, id=nota_id)
+            inventario.revertir(nota)
+            outbox.notas_eliminadas([(nota.id, nota.numero)])
             nota.delete()
         return JsonResponse({"status": "ok", "deleted_id": nota_id})
     except Exception as e:
         return JsonResponse({"error": f"No se pudo eliminar la nota: {e}"}, status=500)
 
+
+@csrf_exempt
+@require_http_methods(["PUT", "PATCH", "DELETE"])
+def api_nota_detalle(request, nota_id: int):
+    """PUT/PATCH edita la nota y sus items (ver _nota_actualizar); DELETE la elimina."""
+    if request.method == "DELETE":
+        return _nota_eliminar(request, nota_id)
+    return _nota_actualizar(request, nota_id)
+
+@csrf_exempt
+@require_http_methods(["POST"])
+@idempotente
+def api_notas_eliminar(request):
+    """
+    Elimina varias notas en una transacción.
+    JSON: {"ids": [1, 2, ...]}  o los filtros de seguimiento {"q", "start_date", "end_date"}
+    (al menos uno). El efecto en stock y analítica se revierte sumado por producto,
+    y notas e items se borran con un DELETE por tabla (signals.borrar_notas): un
+    solo evento notas_eliminadas y una invalidación del cache, sean 1 o 1000 notas.
+    Responde {"eliminadas": n, "resultados": [{"id", "status": "eliminada" | "no_existe"}]}.
+    """
+    try:
+        payload = json.loads(request.body)
+        if not isinstance(payload, dict):
+            return JsonResponse({"error": "Se esperaba un objeto JSON"}, status=400)
+
+        if "ids" in payload:
+            ids = payload["ids"]
+            if not isinstance(ids, list) or not ids:
+                return JsonResponse({"error": "ids debe ser una lista no vacía"}, status=400)
+            pedidos = list(dict.fromkeys(int(i) for i in ids))
+            notas = NotaPedido.objects.filter(id__in=pedidos)
+        else:
+            filtros = {k: str(payload.get(k) or "").strip() for k in ("q", "start_date", "end_date")}
+            if not any(filtros.values()):
+                return JsonResponse({"error": "Indique ids o al menos un filtro (q, start_date, end_date)"}, status=400)
+            for k in ("start_date", "end_date"):
+                if filtros[k] and parse_date(filtros[k]) is None:
+                    return JsonResponse({"error": f"{k} inválida (AAAA-MM-DD)"}, status=400)
+            pedidos = None
+            notas = filtrar_notas(NotaPedido.objects.all(), **{k: v or None for k, v in filtros.items()})
+
+        with transaction.atomic():
+            # el filtro por texto usa DISTINCT, que no admite FOR UPDATE: se bloquea por id
+            seleccion = NotaPedido.objects.filter(id__in=list(notas.values_list("id", flat=True)))
+            bloqueadas = list(seleccion.select_for_update().order_by("id").values_list("id", "numero"))
+            encontrados = [nota_id for nota_id, _ in bloqueadas]
+            if encontrados:
+                inventario.revertir_notas(seleccion)
+                outbox.notas_eliminadas(bloqueadas)
+                borrar_notas(encontrados)
+
+        existentes = set(encontrados)
+        resultados = [
+            {"id": i, "status": "eliminada" if i in existentes else "no_existe"}
+            for i in (pedidos if pedidos is not None else encontrados)
+        ]
+        return JsonResponse({"status": "ok", "eliminadas": len(encontrados), "resultados": resultados})
+
+    except json.JSONDecodeError:
+        return JsonResponse({"error": "JSON inválido"}, status=400)
+    except (TypeError, ValueError):
+        return JsonResponse({"error": "ids debe contener enteros"}, status=400)
+    except Exception as e:
+        return JsonResponse({"error": f"No se pudieron eliminar las notas: {e}"}, status=500)
+
 # views.py
 
 
@@ -618,138 +1185,330 @@ def api_cliente_delete(request, cliente_id: int):
 
 
 
+# =====================
+# API: analítica de movimientos (sobre el acumulado diario)
+# =====================
+def _filtros_analitica(request):
+    """desde/hasta (AAAA-MM-DD) y producto/proveedor/cliente (id). ValueError si algo no es válido."""
+    filtros = {}
+    for nombre in ("desde", "hasta"):
+        valor = (request.GET.get(nombre) or "").strip()
+        if valor:
+            fecha = parse_date(valor)
+            if fecha is None:
+                raise ValueError(f"{nombre} debe tener formato AAAA-MM-DD")
+            filtros[nombre] = fecha
+    for nombre in ("producto", "proveedor", "cliente"):
+        valor = (request.GET.get(nombre) or "").strip()
+        if valor:
+            filtros[nombre] = int(valor)
+    return filtros
+
+
+def _tipo_analitica(request):
+    tipo = (request.GET.get("tipo") or "").strip().lower()
+    if tipo not in ("", "entrada", "salida"):
+        raise ValueError("tipo inválido (entrada | salida)")
+    return tipo.capitalize() or None
+
+
 @require_http_methods(["GET"])
-def api_notas_export_pdf(request):
+async def api_analitica_movimientos(request):
+    """
+    Serie de entradas vs. salidas:
+    GET /api/analitica/movimientos/?agrupar=dia|semana|mes&desde=2024-01-01&hasta=2025-12-31
+        [&producto=<id>][&proveedor=<id>][&cliente=<id>]
+    """
+    agrupar = request.GET.get("agrupar", "dia")
+    if agrupar not in analitica.AGRUPACIONES:
+        return JsonResponse({"error": "agrupar inválido (dia | semana | mes)"}, status=400)
+    try:
+        filtros = _filtros_analitica(request)
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+
+    serie = [{
+        "periodo": f["periodo"].isoformat(),
+        "entradas": f["entradas"],
+        "salidas": f["salidas"],
+        "monto_entradas": float(f["monto_entradas"]),
+        "monto_salidas": float(f["monto_salidas"]),
+    } async for f in analitica.serie(agrupar, **filtros)]
+    return JsonResponse({"agrupar": agrupar, "results": serie})
+
+
+@require_http_methods(["GET"])
+async def api_analitica_top(request):
+    """
+    Ranking: GET /api/analitica/top/?por=producto|proveedor|cliente&metrica=cantidad|monto
+        &tipo=entrada|salida&n=10 (+ los filtros de fecha/id de /movimientos/)
+    """
+    por = request.GET.get("por", "producto")
+    metrica = request.GET.get("metrica", "cantidad")
+    if por not in analitica.DIMENSIONES:
+        return JsonResponse({"error": "por inválido (producto | proveedor | cliente)"}, status=400)
+    if metrica not in analitica.METRICAS:
+        return JsonResponse({"error": "metrica inválida (cantidad | monto)"}, status=400)
+    try:
+        filtros = _filtros_analitica(request)
+        tipo = _tipo_analitica(request)
+        n = min(max(int(request.GET.get("n", 10)), 1), 100)
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+
+    ranking = [{
+        "id": f[f"{por}_id"],
+        "nombre": f[f"{por}__nombre"],
+        "cantidad": f["cantidad"],
+        "monto": float(f["monto"]),
+    } async for f in analitica.top(por, tipo, metrica, n, **filtros)]
+    return JsonResponse({"por": por, "metrica": metrica, "tipo": tipo, "results": ranking})
+
+
+@require_http_methods(["GET"])
+async def api_inventario_abc(request):
+    """
+    Clasificación ABC, rotación, días de cobertura y stock muerto (ver rotacion.py):
+    GET /api/inventario/abc/?dias=365&sin_movimiento=180[&clase=A][&muerto=1]
+    """
+    try:
+        dias = min(max(int(request.GET.get("dias", 365)), 1), 3650)
+        sin_movimiento = max(int(request.GET.get("sin_movimiento", 180)), 1)
+    except ValueError:
+        return JsonResponse({"error": "dias y sin_movimiento deben ser enteros"}, status=400)
+
+    data = await sync_to_async(rotacion.analizar)(dias, sin_movimiento)
+    clase = (request.GET.get("clase") or "").strip().upper()
+    if clase:
+        data["productos"] = [p for p in data["productos"] if p["clase"] == clase]
+    if request.GET.get("muerto") in ("1", "true"):
+        data["productos"] = [p for p in data["productos"] if p["stock_muerto"]]
+    return JsonResponse(data)
+
+
+@require_http_methods(["GET"])
+async def api_reposicion(request):
+    """
+    Sugerencias de compra precalculadas (comando calcular_reposicion), agrupadas por proveedor:
+    GET /api/inventario/reposicion/?proveedor=<id>&todos=1 (todos=1 incluye los que no hay que pedir)
+    """
+    try:
+        proveedor_id = int(request.GET.get("proveedor") or 0) or None
+    except ValueError:
+        return JsonResponse({"error": "proveedor inválido"}, status=400)
+    solo_pedir = request.GET.get("todos") not in ("1", "true")
+
+    proveedores = {}
+    calculado = None
+    async for s in reposicion.por_proveedor(proveedor_id, solo_pedir):
+        grupo = proveedores.setdefault(s.proveedor_id, {
+            "id": s.proveedor_id,
+            "nombre": s.proveedor.nombre,
+            "dias_entrega": s.proveedor.dias_entrega,
+            "productos": [],
+            "monto": 0.0,
+        })
+        monto = float(s.producto.precio) * s.cantidad_sugerida
+        grupo["productos"].append({
+            "id": s.producto_id,
+            "codigo": s.producto.codigo,
+            "nombre": s.producto.nombre,
+            "stock": s.stock,
+            "demanda_diaria": s.demanda_diaria,
+            "desviacion_diaria": s.desviacion_diaria,
+            "punto_reorden": s.punto_reorden,
+            "cantidad_sugerida": s.cantidad_sugerida,
+            "monto": round(monto, 2),
+        })
+        grupo["monto"] = round(grupo["monto"] + monto, 2)
+        calculado = max(calculado, s.calculado) if calculado else s.calculado
+
+    return JsonResponse({
+        "calculado": calculado.isoformat() if calculado else None,
+        "proveedores": list(proveedores.values()),
+    })
+
+
+# =====================
+# API: archivo de notas (cierres de periodo, solo lectura)
+# =====================
+def _ref_archivada(id_, nombre):
+    return {"id": id_, "nombre": nombre} if id_ else None
+
+
+def _nota_archivada_dict(n):
+    """Mismo formato que _nota_dict, más el cierre que la archivó."""
+    return {
+        "id": n.id,
+        "numero": n.numero,
+        "fecha": n.fecha.isoformat(),
+        "tipo": n.tipo.lower(),
+        "orden_compra": n.orden_compra or None,
+        "orden": n.orden_compra or "",
+        "proveedor": _ref_archivada(n.proveedor_id, n.proveedor_nombre),
+        "cliente": _ref_archivada(n.cliente_id, n.cliente_nombre),
+        "almacen": _ref_archivada(n.almacen_id, n.almacen_nombre),
+        "almacen_destino": _ref_archivada(n.almacen_destino_id, n.almacen_destino_nombre),
+        "items": [{
+            "producto": it.producto_id,
+            "producto_nombre": it.producto_nombre,
+            "producto_codigo": it.producto_codigo,
+            "cantidad": it.cantidad,
+            "precio_unitario": float(it.precio_unitario),
+        } for it in n.items.all()],
+        "cierre": n.cierre_id,
+    }
+
+
+@require_http_methods(["GET"])
+async def api_archivo_notas(request):
+    """
+    Notas archivadas por los cierres, paginadas (la más reciente primero):
+    GET /api/archivo/notas/?q=&start_date=&end_date=&producto=<id>&page=&page_size=
+    q busca en número, orden, proveedor, cliente y nombre de producto.
+    """
+    notas = NotaArchivada.objects.prefetch_related("items")
+    q = (request.GET.get("q") or "").strip()
+    if q:
+        notas = notas.filter(
+            Q(numero__icontains=q) |
+            Q(orden_compra__icontains=q) |
+            Q(proveedor_nombre__icontains=q) |
+            Q(cliente_nombre__icontains=q) |
+            Q(items__producto_nombre__icontains=q)
+        ).distinct()
+    for nombre, lookup in (("start_date", "fecha__date__gte"), ("end_date", "fecha__date__lte")):
+        valor = (request.GET.get(nombre) or "").strip()
+        if valor:
+            fecha = parse_date(valor)
+            if fecha is None:
+                return JsonResponse({"error": f"{nombre} inválida (AAAA-MM-DD)"}, status=400)
+            notas = notas.filter(**{lookup: fecha})
+    producto = (request.GET.get("producto") or "").strip()
+    if producto:
+        if not producto.isdigit():
+            return JsonResponse({"error": "producto debe ser un id"}, status=400)
+        notas = notas.filter(id__in=NotaArchivadaItem.objects.filter(producto_id=producto).values("nota_id"))
+
+    page, page_size = _paginacion(request)
+    start = (page - 1) * page_size
+    end = start + page_size
+    total = await notas.acount()
+    results = [_nota_archivada_dict(n) async for n in notas.order_by("-fecha", "-id")[start:end]]
+    return JsonResponse({
+        "results": results,
+        "total": total,
+        "page": page,
+        "page_size": page_size,
+        "has_next": end < total,
+    })
+
+
+@require_http_methods(["GET"])
+async def api_archivo_cierres(request):
+    """Cierres hechos (el más reciente primero), con cuántas notas e items archivó cada uno."""
+    cierres = [{
+        "id": c["id"],
+        "fecha_corte": c["fecha_corte"].isoformat(),
+        "creado": c["creado"].isoformat(),
+        "notas": c["notas"],
+        "items": c["items"],
+    } async for c in Cierre.objects.order_by("-fecha_corte").values("id", "fecha_corte", "creado", "notas", "items")]
+    return JsonResponse({"results": cierres})
+
+
+@require_http_methods(["GET"])
+async def api_archivo_saldos(request, cierre_id):
+    """
+    Saldos iniciales de un cierre, paginados:
+    GET /api/archivo/cierres/<id>/saldos/?almacen=<id>&page=&page_size=
+    almacen: null es el saldo de las notas sin almacén.
+    """
+    cierre = await Cierre.objects.filter(id=cierre_id).afirst()
+    if cierre is None:
+        return JsonResponse({"error": "Cierre no encontrado"}, status=404)
+    saldos = SaldoInicial.objects.filter(cierre=cierre).select_related("producto", "almacen")
+    almacen = (request.GET.get("almacen") or "").strip()
+    if almacen:
+        if not almacen.isdigit():
+            return JsonResponse({"error": "almacen debe ser un id"}, status=400)
+        saldos = saldos.filter(almacen_id=almacen)
+
+    page, page_size = _paginacion(request, page_size_default=100, page_size_max=1000)
+    start = (page - 1) * page_size
+    end = start + page_size
+    total = await saldos.acount()
+    results = [{
+        "producto": s.producto_id,
+        "producto_nombre": s.producto.nombre,
+        "producto_codigo": s.producto.codigo,
+        "almacen": _ref_archivada(s.almacen_id, s.almacen.nombre if s.almacen else ""),
+        "stock": s.stock,
+    } async for s in saldos.order_by("producto__nombre", "producto_id", "almacen_id")[start:end]]
+    return JsonResponse({
+        "cierre": {"id": cierre.id, "fecha_corte": cierre.fecha_corte.isoformat()},
+        "results": results,
+        "total": total,
+        "page": page,
+        "page_size": page_size,
+        "has_next": end < total,
+    })
+
+
+# =====================
+# Diagnóstico: perfil de consultas SQL (solo staff)
+# =====================
+_ORDENES_SQL = ("total", "max", "promedio", "cantidad")
+
+
+@staff_member_required
+def diagnostico_sql(request):
+    orden = request.GET.get("orden") if request.GET.get("orden") in _ORDENES_SQL else "total"
+    vista = (request.GET.get("vista") or "").strip()
+    return render(request, "perfil_sql.html", {
+        "consultas": perfil_sql.top(50, orden, vista or None),
+        "lentas": perfil_sql.lentas(30),
+        "orden": orden,
+        "ordenes": _ORDENES_SQL,
+        "vista": vista,
+        "umbral_ms": getattr(settings, "SQL_LENTA_MS", 200),
+        "archivo": getattr(settings, "SQL_LENTAS_ARCHIVO", ""),
+        "activo": getattr(settings, "SQL_PERFIL", False),
+    })
+
+
+# =====================
+# Exportación PDF
+# =====================
+@require_http_methods(["GET"])
+@admitir("exportar")
+async def api_notas_export_pdf(request):
     """
     Exporta a PDF las notas seleccionadas.
     GET /api/notas/export/pdf/?ids=1,2,3
     Si no vienen ids, acepta filtros: q, start_date, end_date (como en seguimiento).
     Si no viene nada, exporta todas.
+    El PDF se genera en un pool aparte (ver exportar.executor_pdf) para no bloquear otras lecturas.
     """
     ids = (request.GET.get("ids") or "").strip()
     q = request.GET.get("q")
     start_date = request.GET.get("start_date")
     end_date = request.GET.get("end_date")
 
-    notas = (
-        NotaPedido.objects
-        .select_related("proveedor", "cliente")
-        .prefetch_related("items__producto")
-        .order_by("-fecha", "-id")
-    )
-
+    id_list = None
     if ids:
-        try:
-            id_list = [int(x) for x in ids.split(",") if x.strip().isdigit()]
-            if not id_list:
-                return JsonResponse({"error": "Parámetro ids inválido"}, status=400)
-            notas = notas.filter(id__in=id_list)
-        except Exception:
+        id_list = [int(x) for x in ids.split(",") if x.strip().isdigit()]
+        if not id_list:
             return JsonResponse({"error": "Parámetro ids inválido"}, status=400)
-    else:
-        if q:
-            notas = notas.filter(
-                Q(items__producto__nombre__icontains=q) |
-                Q(orden_compra__icontains=q) |
-                Q(proveedor__nombre__icontains=q) |
-                Q(cliente__nombre__icontains=q)
-            ).distinct()
-        if start_date:
-            notas = notas.filter(fecha__date__gte=start_date)
-        if end_date:
-            notas = notas.filter(fecha__date__lte=end_date)
-
-    # --- construir PDF con ReportLab ---
-    buffer = io.BytesIO()
-    doc = SimpleDocTemplate(
-        buffer,
-        pagesize=landscape(A4),
-        leftMargin=18, rightMargin=18, topMargin=20, bottomMargin=20
-    )
 
-    styles = getSampleStyleSheet()
-    styles.add(ParagraphStyle(name="Hdr", fontName="Helvetica", fontSize=14, leading=16, spaceAfter=8))
-    styles.add(ParagraphStyle(name="Cell", fontName="Helvetica", fontSize=9, leading=11))
-
-    story = []
-    story.append(Paragraph("C&R Logística — Notas de Pedido (Exportación)", styles["Hdr"]))
-    story.append(Spacer(1, 6))
-
-    data = [[
-        Paragraph("<b># Nota</b>", styles["Cell"]),
-        Paragraph("<b>Fecha</b>", styles["Cell"]),
-        Paragraph("<b>Tipo</b>", styles["Cell"]),
-        Paragraph("<b>Productos</b>", styles["Cell"]),
-        Paragraph("<b>Destinatario</b>", styles["Cell"]),
-        Paragraph("<b>Orden</b>", styles["Cell"]),
-    ]]
-
-    def fmt_fecha(n):
-        f = getattr(n, "fecha", None)
-        return f.strftime("%d/%m/%Y %H:%M") if f else "-"
-
-    def fmt_tipo(n):
-        t = (n.tipo or "").lower()
-        return "Entrada" if t == "entrada" else "Salida" if t == "salida" else (n.tipo or "-")
-
-    def fmt_dest(n):
-        if n.proveedor_id:
-            return f"Proveedor: {getattr(n.proveedor, 'nombre', '') or '-'}"
-        if n.cliente_id:
-            return f"Cliente: {getattr(n.cliente, 'nombre', '') or '-'}"
-        return "-"
-
-    def fmt_items(n):
-        líneas = []
-        for it in n.items.all():
-            nombre = getattr(it.producto, "nombre", "") or "-"
-            cant = getattr(it, "cantidad", 0) or 0
-            líneas.append(f"{nombre} (x{cant})")
-        # ReportLab hace wrap de \n automáticamente
-        return "\n".join(líneas) or "-"
-
-    # filas
-    for n in notas:
-        # Si quieres replicar EXACTO tu numeración del front,
-        # tendrás que traer ese secuencial por año desde BD.
-        numero = f"N{ (n.fecha.year if n.fecha else 0) }_{str(n.id).zfill(4)}"
-        data.append([
-            Paragraph(numero, styles["Cell"]),
-            Paragraph(fmt_fecha(n), styles["Cell"]),
-            Paragraph(fmt_tipo(n), styles["Cell"]),
-            Paragraph(fmt_items(n).replace("&", "&amp;"), styles["Cell"]),
-            Paragraph(fmt_dest(n).replace("&", "&amp;"), styles["Cell"]),
-            Paragraph((n.orden_compra or "-").replace("&", "&amp;"), styles["Cell"]),
-        ])
+    # ReportLab se importa recién aquí: el resto de vistas y los comandos no lo cargan
+    from . import exportar
 
-    table = Table(
-        data,
-        colWidths=[70, 90, 60, 330, 150, 120],
-        repeatRows=1
-    )
-    table.setStyle(TableStyle([
-        ("BACKGROUND", (0,0), (-1,0), colors.HexColor("#F3F4F6")),
-        ("TEXTCOLOR", (0,0), (-1,0), colors.HexColor("#111827")),
-        ("FONTNAME", (0,0), (-1,-1), "Helvetica"),
-        ("FONTSIZE", (0,0), (-1,-1), 9),
-        ("ALIGN", (0,0), (-1,0), "LEFT"),
-        ("VALIGN", (0,0), (-1,-1), "TOP"),
-        ("GRID", (0,0), (-1,-1), 0.25, colors.HexColor("#D1D5DB")),
-        ("ROWBACKGROUNDS", (0,1), (-1,-1), [colors.white, colors.HexColor("#FAFAFA")]),
-        ("LEFTPADDING", (0,0), (-1,-1), 6),
-        ("RIGHTPADDING", (0,0), (-1,-1), 6),
-        ("TOPPADDING", (0,0), (-1,-1), 4),
-        ("BOTTOMPADDING", (0,0), (-1,-1), 4),
-    ]))
-
-    story.append(table)
-    doc.build(story)
-
-    pdf_value = buffer.getvalue()
-    buffer.close()
+    filas = await sync_to_async(exportar.filas_exportacion)(id_list, q, start_date, end_date)
+    loop = asyncio.get_running_loop()
+    pdf_value = await loop.run_in_executor(exportar.executor_pdf(), exportar.construir_pdf_notas, filas)
 
     resp = HttpResponse(content_type="application/pdf")
     resp["Content-Disposition"] = 'attachment; filename="notas_pedido.pdf"'
     resp.write(pdf_value)
     return resp
-
@@ -0,0 +1,42 @@
+"""
+Perfil ASGI para producción (gunicorn + workers de uvicorn).
+
+    gunicorn -c gunicorn_asgi.conf.py mi_proyecto.asgi:application
+
+Las APIs de lectura (proveedores, clientes, productos, notas) son vistas async:
+cada worker atiende muchas lecturas concurrentes en su event loop en lugar de
+una por worker sync. La exportación PDF se genera en un pool aparte
+(PDF_EXECUTOR / PDF_WORKERS en settings) para no frenar ese loop.
+
+Todo se puede ajustar por variables de entorno sin tocar este archivo.
+"""
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+worker_class = "uvicorn_worker.UvicornWorker"
+
+# Con SQLite hay un solo escritor: pocos workers, la concurrencia la da el event loop.
+workers = int(os.environ.get("WEB_CONCURRENCY", min(multiprocessing.cpu_count(), 4)))
+
+# Eventos en vivo (/api/eventos/): el hub "memoria" solo reparte dentro de su proceso, así que con
+# varios workers se usa "bd". Los workers heredan este entorno y settings lo lee al cargarse.
+# Cambiar la cantidad con WEB_CONCURRENCY, no con -w: la opción de línea de comandos no pasa por aquí.
+os.environ.setdefault("EVENTOS_BACKEND", "bd" if workers > 1 else "memoria")
+if workers > 1 and os.environ["EVENTOS_BACKEND"] == "memoria":
+    raise RuntimeError(
+        f"EVENTOS_BACKEND=memoria no funciona con {workers} workers: un cliente conectado a un worker "
+        "no vería lo guardado en otro. Use EVENTOS_BACKEND=bd o WEB_CONCURRENCY=1."
+    )
+
+# Exportaciones grandes pueden tardar; el resto de requests no se ve afectado.
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", "120"))
+graceful_timeout = 30
+keepalive = 5
+
+# Recicla workers de vez en cuando para acotar la memoria (índices en memoria, pools).
+max_requests = int(os.environ.get("GUNICORN_MAX_REQUESTS", "2000"))
+max_requests_jitter = 200
+
+accesslog = "-"
+errorlog = "-"
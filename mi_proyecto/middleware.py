@@ -1,15 +1,35 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
 from django.http import HttpResponse
+from django.urls import Resolver404, resolve
+from django.utils.cache import patch_vary_headers
+from django.utils.text import compress_string
+from whitenoise.middleware import WhiteNoiseMiddleware
+from gestion import perfil_sql, perfilador
+from gestion.perfil_sql import vista_actual
 import base64
 
+try:
+    import brotli
+except ImportError:  # Brotli es opcional: sin él se usa gzip
+    brotli = None
+
+
 class BasicAuthMiddleware:
+    # Síncrono y asíncrono: bajo ASGI no obliga a pasar cada request por un hilo
+    sync_capable = True
+    async_capable = True
+
     def __init__(self, get_response):
         self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
 
-    def __call__(self, request):
+    def _autorizado(self, request):
         # Usuario y contraseña que quieres usar
         USERNAME = 'cyr'  # Cambia esto
         PASSWORD = 'cyr1506'  # Cambia esto
-        
+
         if 'HTTP_AUTHORIZATION' in request.META:
             auth = request.META['HTTP_AUTHORIZATION'].split()
             if len(auth) == 2:
@@ -17,8 +37,204 @@ class BasicAuthMiddleware:
                     credentials = base64.b64decode(auth[1]).decode('utf-8')
                     username, password = credentials.split(':')
                     if username == USERNAME and password == PASSWORD:
-                        return self.get_response(request)
-        
+                        return True
+        return False
+
+    def _no_autorizado(self):
         response = HttpResponse('No autorizado', status=401)
         response['WWW-Authenticate'] = 'Basic realm="Acceso restringido"'
-        return response
\ No newline at end of file
+        return response
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if self._autorizado(request):
+            return self.get_response(request)
+        return self._no_autorizado()
+
+    async def __acall__(self, request):
+        if self._autorizado(request):
+            return await self.get_response(request)
+        return self._no_autorizado()
+
+
+def nombre_vista(request):
+    try:
+        return resolve(request.path_info).view_name
+    except Resolver404:
+        return request.path_info
+
+
+class PerfilSqlMiddleware:
+    """
+    Marca las consultas SQL del request con el nombre de la vista (ver
+    gestion/perfil_sql.py). La variable de contexto acompaña al request también
+    en los hilos de sync_to_async.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        with vista_actual(nombre_vista(request)):
+            return self.get_response(request)
+
+    async def __acall__(self, request):
+        with vista_actual(nombre_vista(request)):
+            return await self.get_response(request)
+
+
+class PerfiladorMiddleware:
+    """
+    Perfila un request a pedido (header X-Perfilar o ?_perfilar=) si lo pide
+    staff o trae PERFILAR_TOKEN; ver gestion/perfilador.py. Va después de
+    AuthenticationMiddleware. Sin el header/parámetro no hace nada más.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        modo = perfilador.modo_pedido(request)
+        if modo is None or not perfilador.autorizado(request, request.user):
+            return self.get_response(request)
+        with perfilador.Perfil(modo, nombre_vista(request), request.get_full_path()) as perfil:
+            with perfil_sql.capturando():
+                response = self.get_response(request)
+        return perfil.responder(request, response)
+
+    async def __acall__(self, request):
+        modo = perfilador.modo_pedido(request)
+        if modo is None or not perfilador.autorizado(request, await request.auser()):
+            return await self.get_response(request)
+        with perfilador.Perfil(modo, nombre_vista(request), request.get_full_path()) as perfil:
+            # las consultas corren en el hilo de sync_to_async del request: ahí se engancha capturar
+            captura = perfil_sql.capturando()
+            await sync_to_async(captura.__enter__)()
+            try:
+                response = await self.get_response(request)
+            finally:
+                await sync_to_async(captura.__exit__)(None, None, None)
+        return perfil.responder(request, response)
+
+
+class AsyncWhiteNoiseMiddleware(WhiteNoiseMiddleware):
+    """
+    WhiteNoise solo es síncrono; bajo ASGI eso haría que Django ejecute toda la
+    cadena de middlewares y vistas desde un hilo. Servir un estático no bloquea
+    (el archivo se abre en la respuesta), así que basta con una ruta async.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response=None, *args, **kwargs):
+        super().__init__(get_response, *args, **kwargs)
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return super().__call__(request)
+
+    async def __acall__(self, request):
+        if self.autorefresh:
+            static_file = self.find_file(request.path_info)
+        else:
+            static_file = self.files.get(request.path_info)
+        if static_file is not None:
+            return self.serve(static_file, request)
+        return await self.get_response(request)
+
+
+def comprimir(contenido, codificacion):
+    if codificacion == "br":
+        # calidad 5: buena relación tamaño/CPU para respuestas dinámicas
+        return brotli.compress(contenido, quality=5)
+    return compress_string(contenido)
+
+
+def _pesos(accept_encoding):
+    """'br;q=0, gzip' -> {"br": 0.0, "gzip": 1.0}; las entradas con q inválido se ignoran."""
+    pesos = {}
+    for parte in accept_encoding.lower().split(","):
+        nombre, _, parametros = parte.partition(";")
+        nombre = nombre.strip()
+        if not nombre:
+            continue
+        q = 1.0
+        for parametro in parametros.split(";"):
+            clave, _, valor = parametro.partition("=")
+            if clave.strip() == "q":
+                try:
+                    q = float(valor)
+                except ValueError:
+                    q = None
+        if q is not None and 0 <= q <= 1:
+            pesos[nombre] = q
+    return pesos
+
+
+def elegir_codificacion(accept_encoding):
+    """La codificación aceptada con mayor q (Brotli ante un empate); nunca una con q=0."""
+    pesos = _pesos(accept_encoding)
+    candidatas = ["br", "gzip"] if brotli is not None else ["gzip"]
+    mejor = max(candidatas, key=lambda c: pesos.get(c, pesos.get("*", 0)))
+    return mejor if pesos.get(mejor, pesos.get("*", 0)) > 0 else None
+
+
+class JsonCompressionMiddleware:
+    """
+    Comprime con Brotli (o gzip) las respuestas JSON mayores a
+    JSON_COMPRESS_MIN_BYTES. El HTML y los estáticos no se tocan
+    (WhiteNoise ya sirve los estáticos comprimidos).
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self._comprimir(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        response = await self.get_response(request)
+        return self._comprimir(request, response)
+
+    def _comprimir(self, request, response):
+        if response.streaming or response.has_header("Content-Encoding"):
+            return response
+        if not response.get("Content-Type", "").startswith("application/json"):
+            return response
+        if len(response.content) < getattr(settings, "JSON_COMPRESS_MIN_BYTES", 1024):
+            return response
+
+        patch_vary_headers(response, ("Accept-Encoding",))
+        codificacion = elegir_codificacion(request.META.get("HTTP_ACCEPT_ENCODING", ""))
+        if codificacion is None:
+            return response
+
+        comprimido = comprimir(response.content, codificacion)
+        if len(comprimido) >= len(response.content):
+            return response
+        response.content = comprimido
+        response["Content-Length"] = str(len(comprimido))
+        response["Content-Encoding"] = codificacion
+        return response
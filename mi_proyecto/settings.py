@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
 import os
+import tempfile
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -48,12 +49,15 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',  # Para servir archivos estáticos
+    'mi_proyecto.middleware.JsonCompressionMiddleware',  # Brotli/gzip para JSON grandes
+    'mi_proyecto.middleware.AsyncWhiteNoiseMiddleware',  # WhiteNoise (estáticos) con ruta async para ASGI
     'django.contrib.sessions.middleware.SessionMiddleware',
     'mi_proyecto.middleware.BasicAuthMiddleware',
+    'mi_proyecto.middleware.PerfilSqlMiddleware',  # nombre de la vista en el perfil SQL
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'mi_proyecto.middleware.PerfiladorMiddleware',  # perfil de un request a pedido (staff)
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -77,6 +81,7 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'mi_proyecto.wsgi.application'
+ASGI_APPLICATION = 'mi_proyecto.asgi.application'  # perfil: gunicorn_asgi.conf.py
 
 
 # Database
@@ -90,6 +95,23 @@ DATABASES = {
 }
 
 
+# Cache
+# Compartido entre workers de gunicorn (por defecto en disco) para que la
+# invalidación del cache de vistas llegue a todos. Se puede cambiar por
+# variables de entorno, p. ej. CACHE_BACKEND=django.core.cache.backends.redis.RedisCache
+# CACHE_LOCATION=redis://127.0.0.1:6379
+
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get('CACHE_BACKEND', 'django.core.cache.backends.filebased.FileBasedCache'),
+        'LOCATION': os.environ.get('CACHE_LOCATION', os.path.join(tempfile.gettempdir(), 'cyr_inventario_cache')),
+    }
+}
+
+# Segundos que dura una respuesta cacheada de index / seguimiento
+VISTAS_CACHE_TIMEOUT = int(os.environ.get('VISTAS_CACHE_TIMEOUT', '300'))
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -136,4 +158,89 @@ STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
-DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
\ No newline at end of file
+DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+
+# Exportación PDF: pool donde se genera ("thread" o "process") y su tamaño
+PDF_EXECUTOR = os.environ.get('PDF_EXECUTOR', 'thread')
+PDF_WORKERS = int(os.environ.get('PDF_WORKERS', '2'))
+
+# Autocompletado de productos: cada cuántos segundos se reconstruye el índice en memoria
+TYPEAHEAD_TTL = int(os.environ.get('TYPEAHEAD_TTL', '300'))
+
+# Respuestas JSON a partir de este tamaño se comprimen (Brotli si el cliente lo acepta, si no gzip)
+JSON_COMPRESS_MIN_BYTES = int(os.environ.get('JSON_COMPRESS_MIN_BYTES', '1024'))
+
+# Alertas de stock mínimo: cada cruce del umbral se agrega como línea JSON a este archivo
+# (vacío = no se escribe). Lo consume el comando resumen_alertas o cualquier notificador externo.
+ALERTAS_STOCK_ARCHIVO = os.environ.get('ALERTAS_STOCK_ARCHIVO', '')
+
+# Sugerencias de reposición (comando calcular_reposicion): ventana de demanda en días,
+# factor z del nivel de servicio (1.65 ~ 95 %) y días entre pedidos al mismo proveedor
+REPOSICION_VENTANA_DIAS = int(os.environ.get('REPOSICION_VENTANA_DIAS', '90'))
+REPOSICION_Z = float(os.environ.get('REPOSICION_Z', '1.65'))
+REPOSICION_DIAS_CICLO = int(os.environ.get('REPOSICION_DIAS_CICLO', '30'))
+
+# /api/sync/: margen hacia atrás sobre el token del cliente (escrituras confirmadas tarde)
+# y cuántos días se guardan los registros de borrado; tokens más viejos reciben una foto completa
+SYNC_SOLAPE_SEGUNDOS = int(os.environ.get('SYNC_SOLAPE_SEGUNDOS', '30'))
+SYNC_RETENCION_DIAS = int(os.environ.get('SYNC_RETENCION_DIAS', '90'))
+
+# Eventos en vivo (/api/eventos/, requiere ASGI): "memoria" reparte dentro del proceso (un worker);
+# "bd" guarda los eventos en la tabla Evento y cada conexión la consulta cada EVENTOS_INTERVALO s.
+# gunicorn_asgi.conf.py usa "bd" cuando arranca más de un worker y no acepta "memoria" en ese caso.
+EVENTOS_BACKEND = os.environ.get('EVENTOS_BACKEND', 'memoria')
+EVENTOS_INTERVALO = float(os.environ.get('EVENTOS_INTERVALO', '1'))
+EVENTOS_HEARTBEAT = int(os.environ.get('EVENTOS_HEARTBEAT', '15'))
+EVENTOS_RETENCION_HORAS = int(os.environ.get('EVENTOS_RETENCION_HORAS', '24'))
+
+# Idempotency-Key en POST /api/notas/crear/ y /api/notas/eliminar/: horas que se guarda cada respuesta
+IDEMPOTENCIA_TTL_HORAS = int(os.environ.get('IDEMPOTENCIA_TTL_HORAS', '24'))
+
+# Control de admisión (gestion/admision.py) para exportar PDF y /api/notas/: fichas por cliente
+# (rafaga, repuestas a `tasa` por segundo) y tope de peticiones simultáneas por proceso con cola.
+# Los valores por clase están en admision.CLASES_POR_DEFECTO; ADMISION solo cambia los que se indiquen,
+# p. ej. {"exportar": {"concurrencia": 1}}. Mantener la concurrencia por debajo de los hilos del worker.
+ADMISION_ACTIVA = os.environ.get('ADMISION_ACTIVA', '1') == '1'
+ADMISION_PROXY = os.environ.get('ADMISION_PROXY', '0') == '1'  # confiar en X-Forwarded-For
+ADMISION = {}
+
+# Perfil SQL (gestion/perfil_sql.py): tiempos por consulta y vista, en /diagnostico/sql/ y el comando
+# consultas_lentas. Las sentencias de más de SQL_LENTA_MS se registran con su plan en SQL_LENTAS_ARCHIVO.
+# Apagado por defecto (mide cada consulta): SQL_PERFIL=1 lo activa mientras se diagnostica.
+SQL_PERFIL = os.environ.get('SQL_PERFIL', '0') == '1'
+SQL_LENTA_MS = float(os.environ.get('SQL_LENTA_MS', '200'))
+SQL_LENTAS_ARCHIVO = os.environ.get('SQL_LENTAS_ARCHIVO', '')
+SQL_PERFIL_VOLCADO = int(os.environ.get('SQL_PERFIL_VOLCADO', '30'))
+
+# Perfilado a pedido (gestion/perfilador.py): header X-Perfilar: 1 | cprofile (o ?_perfilar=) con sesión
+# de staff, o con X-Perfilar-Token igual a PERFILAR_TOKEN (vacío = solo staff). Archivos en PERFILAR_DIR.
+PERFILAR_TOKEN = os.environ.get('PERFILAR_TOKEN', '')
+PERFILAR_DIR = os.environ.get('PERFILAR_DIR', '')
+PERFILAR_INTERVALO_MS = float(os.environ.get('PERFILAR_INTERVALO_MS', '1'))
+
+# Outbox hacia el ERP (gestion/outbox.py): las escrituras de notas guardan un EventoSalida en su
+# transacción y el comando despachar_outbox los envía en lotes, en orden, a OUTBOX_URL
+# (vacío = no se registran). Reintentos con espera exponencial de BASE hasta MAX segundos.
+OUTBOX_URL = os.environ.get('OUTBOX_URL', '')
+OUTBOX_TOKEN = os.environ.get('OUTBOX_TOKEN', '')  # se manda como Authorization: Bearer
+OUTBOX_LOTE = int(os.environ.get('OUTBOX_LOTE', '100'))
+OUTBOX_TIMEOUT = float(os.environ.get('OUTBOX_TIMEOUT', '10'))
+OUTBOX_INTERVALO = float(os.environ.get('OUTBOX_INTERVALO', '1'))
+OUTBOX_REINTENTO_BASE = float(os.environ.get('OUTBOX_REINTENTO_BASE', '1'))
+OUTBOX_REINTENTO_MAX = float(os.environ.get('OUTBOX_REINTENTO_MAX', '300'))
+OUTBOX_RETENCION_DIAS = int(os.environ.get('OUTBOX_RETENCION_DIAS', '7'))
+
+# Respaldos en línea (gestion/respaldo.py, comandos respaldar_bd / verificar_respaldo / restaurar_bd):
+# carpeta por defecto (vacío = BASE_DIR/respaldos), páginas de SQLite por paso de la API de backup,
+# pausa entre pasos (s) y reinicios tolerados (escrituras durante la copia) antes de copiar de una vez
+RESPALDO_DIR = os.environ.get('RESPALDO_DIR', '')
+RESPALDO_PAGINAS = int(os.environ.get('RESPALDO_PAGINAS', '256'))
+RESPALDO_PAUSA = float(os.environ.get('RESPALDO_PAUSA', '0.01'))
+RESPALDO_REINTENTOS = int(os.environ.get('RESPALDO_REINTENTOS', '5'))
+
+# Escritura agrupada de POST /api/notas/crear/ (gestion/escritor.py): un hilo por worker confirma las
+# notas en lotes de hasta ESCRITURA_LOTE_MAX, esperando a lo sumo ESCRITURA_ESPERA_MS por más notas
+ESCRITURA_AGRUPADA = os.environ.get('ESCRITURA_AGRUPADA', '0') == '1'
+ESCRITURA_LOTE_MAX = int(os.environ.get('ESCRITURA_LOTE_MAX', '32'))
+ESCRITURA_ESPERA_MS = float(os.environ.get('ESCRITURA_ESPERA_MS', '5'))
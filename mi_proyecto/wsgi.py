@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'mi_proyecto.settings')
 
 application = get_wsgi_application()
+
+# WARMUP=1: el worker abre la BD, compila plantillas y llena caches antes del primer request
+if os.environ.get('WARMUP') == '1':
+    from gestion.calentamiento import calentar
+    calentar()